@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Микро-бенчмарк разбора комментариев: поиск каждой команды против одного скомпилированного выражения
+
+Запуск:
+    python3 benchmarks/bench_command_rules.py --comments 20000 --commands 4 16 64
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from command_rules import CommandRules
+
+WORDS = ('Здравствуйте', 'заказ', 'готов', 'к', 'выдаче', 'спасибо', 'order', 'is', 'ready', 'please', 'call')
+
+
+def make_commands(count):
+    """Команды отправки и исключения, как у нескольких команд менеджеров"""
+    send = ['@send', '@отправить', '@wazzup', '@клиент']
+    exclude = ['@nosend', '@internal', '@не_отправлять']
+    for n in range(max(0, count - len(send) - len(exclude))):
+        (send if n % 2 else exclude).append(f"@команда_{n}")
+    return send, exclude
+
+
+def make_comments(count, send, exclude):
+    """Комментарии разной длины: без команд, с командой отправки и с исключением"""
+    rng = random.Random(1)
+    comments = []
+    for _ in range(count):
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 60)))
+        kind = rng.random()
+        if kind < 0.4:
+            text = f"{rng.choice(send)} {text}"
+        elif kind < 0.5:
+            text = f"{text} {rng.choice(exclude)}"
+        comments.append(text)
+    return comments
+
+
+def legacy_select(text, role, send, exclude, auto_send, roles):
+    """Прежний разбор: поиск подстроки для каждой команды"""
+    lowered = text.lower()
+    for command in exclude:
+        if command.lower() in lowered:
+            return None
+    for command in send:
+        position = lowered.find(command.lower())
+        if position != -1:
+            return (text[:position] + text[position + len(command):]).strip() or None
+    if auto_send and role in roles:
+        return text.strip() or None
+    return None
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--comments', type=int, default=20000, help='количество комментариев')
+    parser.add_argument('--commands', type=int, nargs='+', default=[7, 16, 64], help='размеры набора команд')
+    args = parser.parse_args()
+
+    print(f"🚀 Разбор {args.comments} комментариев")
+    print("=" * 60)
+    for count in args.commands:
+        send, exclude = make_commands(count)
+        comments = make_comments(args.comments, send, exclude)
+        rules = CommandRules(send, exclude, True, ['user'])
+
+        start = time.perf_counter()
+        for text in comments:
+            legacy_select(text, 'user', send, exclude, True, ['user'])
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for text in comments:
+            rules.evaluate(text, 'user')
+        compiled = time.perf_counter() - start
+
+        print(f"   • команд {len(send) + len(exclude):3}: по одной {legacy * 1e6 / len(comments):6.1f} мкс, "
+              f"одним выражением {compiled * 1e6 / len(comments):6.1f} мкс")
+
+
+if __name__ == "__main__":
+    main()
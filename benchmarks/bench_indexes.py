@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк индексов: задержка типовых запросов до и после миграций схемы
+
+Создает базу в старой схеме (только CREATE TABLE), заполняет ее сообщениями,
+замеряет запросы, применяет миграции и замеряет снова.
+
+Запуск:
+    python3 benchmarks/bench_indexes.py --messages 1000000 --chats 20000
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import Storage
+from migrations import migrate, migration_base_schema
+
+# Запросы, которые интеграция выполняет на горячем пути
+QUERIES = [
+    ('контакт по (chat_id, chat_type)',
+     "SELECT id FROM contacts WHERE chat_id = ? AND chat_type = ?",
+     lambda chat: (chat, 'whatsapp')),
+    ('история чата по дате',
+     "SELECT text FROM wazzup_messages WHERE chat_id = ? ORDER BY datetime DESC LIMIT 50",
+     lambda chat: (chat,)),
+    ('последний канал чата',
+     "SELECT channel_id FROM wazzup_messages WHERE chat_id = ? AND chat_type = ? ORDER BY id DESC LIMIT 1",
+     lambda chat: (chat, 'whatsapp')),
+    ('сделки контакта',
+     "SELECT podio_item_id FROM deals WHERE contact_id = ? AND status = 'active'",
+     lambda chat: (int(chat[4:]) + 1,)),
+    ('чат по элементу Podio',
+     "SELECT chat_id FROM wazzup_messages WHERE podio_item_id = ? LIMIT 1",
+     lambda chat: (f"item-{chat}",)),
+]
+
+
+def populate(storage, messages, chats):
+    """Заполнение базы в старой схеме"""
+    with storage.transaction() as cursor:
+        migration_base_schema(cursor)
+        cursor.executemany(
+            "INSERT INTO contacts (chat_id, chat_type, name) VALUES (?, 'whatsapp', ?)",
+            ((f"7900{c:07d}", f"Client {c}") for c in range(chats))
+        )
+        cursor.executemany(
+            "INSERT INTO deals (contact_id, podio_item_id) VALUES (?, ?)",
+            ((c + 1, f"item-7900{c:07d}") for c in range(chats))
+        )
+
+    batch = 100000
+    for start in range(0, messages, batch):
+        with storage.transaction() as cursor:
+            cursor.executemany('''
+                INSERT INTO wazzup_messages
+                (message_id, channel_id, chat_id, chat_type, sender_name, text, status, datetime, podio_item_id)
+                VALUES (?, 'channel-1', ?, 'whatsapp', 'Client', ?, 'inbound', ?, ?)
+            ''', (
+                (f"msg-{n}", f"7900{n % chats:07d}", f"Сообщение {n}",
+                 f"2024-01-{1 + n % 28:02d}T{n % 24:02d}:00:00Z",
+                 f"item-7900{n % chats:07d}" if n % 10 == 0 else None)
+                for n in range(start, min(start + batch, messages))
+            ))
+
+
+def measure(storage, chats, repeats):
+    """Средняя задержка каждого запроса, мс"""
+    results = {}
+    conn = storage.connection()
+    sample = [f"7900{random.randrange(chats):07d}" for _ in range(repeats)]
+    for name, sql, params in QUERIES:
+        start = time.perf_counter()
+        for chat in sample:
+            conn.execute(sql, params(chat)).fetchall()
+        results[name] = (time.perf_counter() - start) * 1000 / repeats
+    return results
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1000000, help='количество сообщений')
+    parser.add_argument('--chats', type=int, default=20000, help='количество чатов')
+    parser.add_argument('--repeats', type=int, default=20, help='повторов каждого запроса')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Storage(os.path.join(tmp, 'bench.db'), synchronous='OFF')
+
+        print(f"📥 Заполнение: {args.messages} сообщений, {args.chats} чатов...")
+        start = time.perf_counter()
+        populate(storage, args.messages, args.chats)
+        print(f"   готово за {time.perf_counter() - start:.1f} с")
+
+        before = measure(storage, args.chats, args.repeats)
+
+        start = time.perf_counter()
+        migrate(storage)
+        print(f"🔧 Миграции применены за {time.perf_counter() - start:.1f} с")
+
+        after = measure(storage, args.chats, args.repeats)
+        storage.close()
+
+    print(f"\n🚀 Задержка запросов, мс (среднее из {args.repeats})")
+    print("=" * 70)
+    print(f"   {'запрос':<34} {'до':>12} {'после':>12}")
+    for name, _, _ in QUERIES:
+        print(f"   {name:<34} {before[name]:12.3f} {after[name]:12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк загрузки метаданных Podio: последовательный обход против PodioMetadata
+
+Заменитель Podio отвечает с задержкой; сравниваются прежний обход
+get_podio_apps.py, параллельная загрузка с пустым кэшем, теплый кэш
+и проверка устаревшего кэша через ETag.
+
+Запуск:
+    python3 benchmarks/bench_metadata.py --spaces 20 --apps 5 --latency 0.05
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_transport import HttpTransport
+from podio_metadata import PodioMetadata
+from stand_ins import StandInServer, podio_routes
+
+
+class StandInPodio:
+    """Минимальный клиент с интерфейсом PodioAPI.request"""
+
+    def __init__(self, base_url, pool_size):
+        self.http = HttpTransport('bench', base_url, pool_size=pool_size)
+
+    def request(self, method, path, **kwargs):
+        return self.http.request(method, path, **kwargs)
+
+
+def make_state(spaces, apps_per_space):
+    """Рабочие области, приложения и поля для заменителя"""
+    state = {'spaces': [], 'apps': {}, 'fields': {}}
+    for s in range(spaces):
+        space_id = 100 + s
+        state['spaces'].append({'space_id': space_id, 'name': f"Область {s}", 'url_label': f"space-{s}"})
+        state['apps'][space_id] = []
+        for a in range(apps_per_space):
+            app_id = space_id * 100 + a
+            state['apps'][space_id].append({
+                'app_id': app_id, 'url_label': f"app-{a}",
+                'config': {'name': f"Приложение {a}", 'item_name': 'Элемент'},
+            })
+            state['fields'][app_id] = [
+                {'field_id': app_id * 10 + f, 'external_id': f"field-{f}", 'type': 'text',
+                 'status': 'active', 'config': {'label': f"Поле {f}"}}
+                for f in range(8)
+            ]
+    return state
+
+
+def run_sequential(client):
+    """Прежний обход: области, затем приложения и поля по одному запросу"""
+    for space in client.request('GET', '/space/').json():
+        for app in client.request('GET', f"/app/space/{space['space_id']}/").json():
+            client.request('GET', f"/app/{app['app_id']}")
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--spaces', type=int, default=20, help='рабочих областей')
+    parser.add_argument('--apps', type=int, default=5, help='приложений в области')
+    parser.add_argument('--latency', type=float, default=0.05, help='задержка ответа заменителя, с')
+    parser.add_argument('--concurrency', type=int, default=8, help='параллельных запросов')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    state = make_state(args.spaces, args.apps)
+    requests_total = 1 + args.spaces + args.spaces * args.apps
+
+    print(f"🚀 Метаданные Podio: {args.spaces} областей × {args.apps} приложений, "
+          f"{requests_total} запросов, задержка {args.latency * 1000:.0f} мс")
+    print("=" * 60)
+
+    with StandInServer(podio_routes(state), latency=args.latency) as server, tempfile.TemporaryDirectory() as tmp:
+        client = StandInPodio(server.url, args.concurrency)
+        cache_path = os.path.join(tmp, 'metadata.json')
+
+        def measure(name, func):
+            before = len(server.requests)
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            print(f"   • {name:<32} {elapsed:7.3f} с, запросов {len(server.requests) - before}")
+
+        measure('последовательно (было)', lambda: run_sequential(client))
+
+        metadata = PodioMetadata(client, cache_path, ttl=3600, concurrency=args.concurrency)
+        measure('параллельно, пустой кэш', metadata.discover)
+
+        # Новый процесс читает кэш с диска
+        measure('теплый кэш (запуск)', lambda: PodioMetadata(client, cache_path, ttl=3600).discover())
+
+        expired = PodioMetadata(client, cache_path, ttl=0, concurrency=args.concurrency)
+        measure('устаревший кэш, ETag -> 304', expired.discover)
+        print(f"   • ответов 304: {expired.stats()['revalidated']}")
+
+
+if __name__ == "__main__":
+    main()
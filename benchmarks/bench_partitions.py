@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк режима разделов: пропускная способность входящих сообщений по числу процессов
+
+Очередь заполняется сообщениями от --chats чатов, затем процессы-разделы
+(как serve.py partition) сохраняют их и пишут комментарии в заменитель
+Podio с задержкой. Замеряется время до опустошения очередей.
+
+Запуск:
+    python3 benchmarks/bench_partitions.py --chats 2000 --messages 3 --partitions 1 2 4
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stand_ins import StandInServer, podio_routes
+
+DEALS_APP_ID = '55'
+
+
+def configure(db_path, podio_url, workers):
+    """Конфигурация интеграции для бенчмарка (до импорта main)"""
+    import config
+    config.DATABASE_CONFIG['db_path'] = db_path
+    config.PODIO_CONFIG['base_url'] = podio_url
+    config.PODIO_CONFIG['deals_app_id'] = DEALS_APP_ID
+    config.PODIO_CONFIG['metadata_cache'] = None
+    config.INTEGRATION_CONFIG['coalesce_window'] = 0.2
+    config.INTEGRATION_CONFIG['coalesce_max_delay'] = 1
+    config.INTEGRATION_CONFIG['queue_workers'] = workers
+    config.INTEGRATION_CONFIG['media_relay'] = False
+    config.INTEGRATION_CONFIG['log_file'] = None
+
+
+def run_partition(index, count, db_path, podio_url, workers, stop):
+    """Один раздел в дочернем процессе"""
+    configure(db_path, podio_url, workers)
+    logging.disable(logging.WARNING)
+    import main
+    main.start_partition(index, count)
+    stop.wait()
+    main.stop_partition(5)
+
+
+def populate(db_path, podio_url, chats, messages):
+    """Контакты со сделками и задачи входящих сообщений"""
+    configure(db_path, podio_url, 1)
+    logging.disable(logging.WARNING)
+    import main
+    tracker = main.tracker
+    with tracker.storage.transaction() as cursor:
+        for c in range(chats):
+            cursor.execute("INSERT INTO contacts (chat_id, chat_type, name) VALUES (?, 'whatsapp', ?)",
+                           (f"7900{c:07d}", f"Client {c}"))
+            cursor.execute("INSERT INTO deals (contact_id, podio_item_id) VALUES (?, ?)",
+                           (cursor.lastrowid, str(100000 + c)))
+    main.work_queue.put_many([
+        ('wazzup', {'messages': [{
+            'messageId': f"msg-{n}-{c}", 'channelId': 'channel-1', 'chatId': f"7900{c:07d}",
+            'chatType': 'whatsapp', 'status': 'inbound', 'text': f"Сообщение {n}",
+            'dateTime': '2024-01-01T10:00:00Z', 'contact': {'name': f"Client {c}"},
+        }]}, f"7900{c:07d}")
+        for n in range(messages) for c in range(chats)
+    ])
+    tracker.storage.close()
+
+
+def pending(db_path):
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM work_queue WHERE status IN ('pending', 'processing')").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def measure(partitions, args, podio_url):
+    """Время разбора очереди при заданном числе разделов, секунды"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        context = multiprocessing.get_context('spawn')
+        loader = context.Process(target=populate, args=(db_path, podio_url, args.chats, args.messages))
+        loader.start()
+        loader.join()
+
+        stop = context.Event()
+        processes = [
+            context.Process(target=run_partition,
+                            args=(index, partitions, db_path, podio_url, args.workers, stop))
+            for index in range(partitions)
+        ]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        # Очередь пуста, когда все сообщения сохранены и комментарии записаны в Podio
+        while pending(db_path) or time.perf_counter() - start < 1:
+            time.sleep(0.1)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        for process in processes:
+            process.join(30)
+        return elapsed
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chats', type=int, default=2000, help='активных чатов')
+    parser.add_argument('--messages', type=int, default=3, help='сообщений в чате')
+    parser.add_argument('--partitions', type=int, nargs='+', default=[1, 2, 4], help='числа разделов')
+    parser.add_argument('--workers', type=int, default=4, help='потоков очереди в разделе')
+    parser.add_argument('--podio-latency', type=float, default=0.02, help='задержка заменителя Podio, с')
+    args = parser.parse_args()
+
+    total = args.chats * args.messages
+    print(f"🚀 Разделы очередей: {args.chats} чатов × {args.messages} сообщений, "
+          f"задержка Podio {args.podio_latency * 1000:.0f} мс, потоков в разделе {args.workers}")
+    print("=" * 70)
+    with StandInServer(podio_routes(), latency=args.podio_latency) as server:
+        for partitions in args.partitions:
+            elapsed = measure(partitions, args, server.url)
+            comments = sum(1 for request in server.requests if request['path'].startswith('/comment/'))
+            server.requests.clear()
+            print(f"   • разделов {partitions}: {elapsed:6.1f} с, {total / elapsed * 60:8.0f} сообщений/мин, "
+                  f"{args.chats / elapsed * 60:7.0f} чатов/мин, комментариев Podio {comments}")
+
+
+if __name__ == "__main__":
+    main()
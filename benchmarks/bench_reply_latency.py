@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сквозная задержка ответа менеджера: комментарий Podio -> сообщение в Wazzup
+
+Заменитель Podio отправляет события comment.create на /webhook/podio,
+замеряется время до получения сообщения заменителем Wazzup.
+
+Запуск:
+    python3 benchmarks/bench_reply_latency.py --replies 100
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+from stand_ins import StandInServer, PodioHookEmitter, podio_routes, wazzup_routes
+
+ITEM_ID = 777
+
+
+def percentile(values, p):
+    """Перцентиль по отсортированному списку"""
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def wait_for_text(server, text, timeout):
+    """Ожидание сообщения с текстом text на заменителе Wazzup"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if any(request['body'].get('text') == text for request in server.requests[-20:]):
+            return True
+        time.sleep(0.0005)
+    return False
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--replies', type=int, default=50, help='количество ответов')
+    parser.add_argument('--podio-latency', type=float, default=0.02, help='задержка заменителя Podio, секунды')
+    parser.add_argument('--wazzup-latency', type=float, default=0.02, help='задержка заменителя Wazzup, секунды')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    state = {}
+    podio_server = StandInServer(podio_routes(state), latency=args.podio_latency).start()
+    wazzup_server = StandInServer(wazzup_routes(), latency=args.wazzup_latency).start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        import config
+        config.DATABASE_CONFIG['db_path'] = os.path.join(tmp, 'bench.db')
+        config.PODIO_CONFIG['base_url'] = podio_server.url
+        config.PODIO_CONFIG['deals_app_id'] = '55'
+        config.WAZZUP_CONFIG['base_url'] = f"{wazzup_server.url}/v3"
+        config.INTEGRATION_CONFIG['auto_send_comments'] = True
+        # Измеряем задержку hooks, а не лимит отправки канала
+        config.INTEGRATION_CONFIG['channel_rate'] = 0
+
+        import main as integration
+
+        # Связываем элемент Podio с чатом клиента
+        tracker = integration.tracker
+        tracker.save_webhook_batch([{
+            'messageId': 'bench-1', 'channelId': 'channel-1', 'chatId': '79000000001',
+            'chatType': 'whatsapp', 'status': 'inbound', 'text': 'Здравствуйте',
+        }])
+        contact_id = tracker.get_or_create_contact('79000000001', 'whatsapp')
+        tracker.storage.execute(
+            "INSERT INTO deals (contact_id, podio_item_id) VALUES (?, ?)", (contact_id, str(ITEM_ID))
+        )
+
+        integration.workers.start()
+        integration.delivery.start()
+        http_server = make_server('127.0.0.1', 0, integration.app, threaded=True)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        emitter = PodioHookEmitter(f"http://127.0.0.1:{http_server.server_port}/webhook/podio")
+
+        latencies = []
+        lost = 0
+        comments = state['comments'].setdefault(ITEM_ID, [])
+        for n in range(args.replies):
+            text = f"Ответ менеджера {n}"
+            comments.append({
+                'comment_id': 50000 + n,
+                'value': text,
+                'created_on': '2999-01-01 00:00:00',
+                'created_by': {'type': 'user'},
+            })
+            start = time.perf_counter()
+            emitter.comment_created(ITEM_ID, 50000 + n)
+            if wait_for_text(wazzup_server, text, timeout=10):
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                lost += 1
+
+        http_server.shutdown()
+        integration.workers.stop(timeout=1)
+        integration.delivery.stop(timeout=1)
+        integration.tracker.storage.close()
+
+    podio_server.stop()
+    wazzup_server.stop()
+
+    polling = config.INTEGRATION_CONFIG['polling_interval']
+    print(f"🚀 Задержка ответа через Podio hooks ({args.replies} ответов)")
+    print("=" * 60)
+    for p in (50, 95, 99):
+        print(f"   • p{p}: {percentile(latencies, p):.1f} мс")
+    print(f"   • потеряно: {lost}")
+    print(f"   • для сравнения, polling: в среднем {polling / 2:.0f} с, до {polling} с")
+
+
+if __name__ == "__main__":
+    main()
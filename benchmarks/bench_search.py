@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк поиска по переписке: LIKE по wazzup_messages против индекса FTS5
+
+Заполняет базу сообщениями из словаря, применяет миграции (индекс строится
+при миграции 8) и сравнивает задержку LIKE '%слово%' с MessageSearch.
+
+Запуск:
+    python3 benchmarks/bench_search.py --messages 300000 --chats 5000
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import Storage
+from migrations import migrate
+from message_search import MessageSearch
+
+WORDS = (
+    'заказ заказы доставка оплата счет курьер адрес телефон вопрос ответ скидка товар '
+    'размер цвет возврат обмен чек карта наличные сегодня завтра утром вечером спасибо '
+    'здравствуйте подскажите пожалуйста можно нужно когда сколько стоимость ещё уже'
+).split()
+
+# Редкие слова: запросы, которые находят немного сообщений
+RARE = ['претензия', 'рекламация', 'гарантийный', 'накладная']
+
+QUERIES = ['заказ', 'доставка завтра', 'претензия', 'гарантийный']
+
+
+def populate(storage, messages, chats):
+    """Сообщения из случайных слов словаря, редкие слова в 0.1% сообщений"""
+    rnd = random.Random(1)
+    batch = 50000
+    for start in range(0, messages, batch):
+        rows = []
+        for n in range(start, min(start + batch, messages)):
+            words = rnd.choices(WORDS, k=rnd.randint(3, 15))
+            if rnd.random() < 0.001:
+                words.append(rnd.choice(RARE))
+            rows.append((f"msg-{n}", f"7900{n % chats:07d}", ' '.join(words),
+                         f"2024-{1 + n % 12:02d}-{1 + n % 28:02d}T{n % 24:02d}:00:00Z"))
+        with storage.transaction() as cursor:
+            cursor.executemany('''
+                INSERT INTO wazzup_messages
+                (message_id, channel_id, chat_id, chat_type, sender_name, text, status, datetime)
+                VALUES (?, 'channel-1', ?, 'whatsapp', 'Client', ?, 'inbound', ?)
+            ''', rows)
+
+
+def like_search(conn, text, limit):
+    """Прежний способ: LIKE по каждому слову, новые сообщения сначала"""
+    words = text.split()
+    where = ' AND '.join('text LIKE ?' for _ in words)
+    return conn.execute(
+        f"SELECT id, text FROM wazzup_messages WHERE {where} ORDER BY id DESC LIMIT ?",
+        (*(f"%{word}%" for word in words), limit)
+    ).fetchall()
+
+
+def timed(func, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=300000, help='количество сообщений')
+    parser.add_argument('--chats', type=int, default=5000, help='количество чатов')
+    parser.add_argument('--limit', type=int, default=20, help='результатов на странице')
+    parser.add_argument('--repeats', type=int, default=5, help='повторов каждого запроса')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Storage(os.path.join(tmp, 'bench.db'), synchronous='OFF')
+        migrate(storage)
+        # Заполнение без триггеров, индекс строится одной командой rebuild
+        with storage.transaction() as cursor:
+            cursor.execute("DROP TRIGGER messages_fts_insert")
+
+        print(f"📥 Заполнение: {args.messages} сообщений, {args.chats} чатов...")
+        start = time.perf_counter()
+        populate(storage, args.messages, args.chats)
+        print(f"   готово за {time.perf_counter() - start:.1f} с")
+
+        search = MessageSearch(storage)
+        start = time.perf_counter()
+        search.rebuild()
+        print(f"🔎 Индекс построен за {time.perf_counter() - start:.1f} с")
+
+        conn = storage.connection()
+        chat = f"7900{7:07d}"
+        print(f"\n🚀 Задержка поиска, мс (среднее из {args.repeats}, страница {args.limit})")
+        print("=" * 78)
+        print(f"   {'запрос':<24} {'LIKE':>10} {'FTS rank':>10} {'FTS recent':>11} {'FTS чат':>10}")
+        for query in QUERIES:
+            like = timed(lambda: like_search(conn, query, args.limit), args.repeats)
+            rank = timed(lambda: search.search(query, limit=args.limit), args.repeats)
+            recent = timed(lambda: search.search(query, limit=args.limit, sort='recent'), args.repeats)
+            in_chat = timed(lambda: search.search(query, chat_id=chat, limit=args.limit), args.repeats)
+            print(f"   {query:<24} {like:10.2f} {rank:10.2f} {recent:11.2f} {in_chat:10.2f}")
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк пропускной способности /webhook/wazzup: app.run против gunicorn
+
+Сервер запускается в отдельном процессе только с ролью приема webhooks,
+клиенты отправляют запросы параллельно по keep-alive соединениям.
+
+Запуск:
+    python3 benchmarks/bench_serving.py --requests 3000 --concurrency 32 --workers 4 --threads 8
+"""
+
+import os
+import sys
+import time
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def free_port():
+    """Свободный локальный порт"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_dev_server(port):
+    """Текущий режим: встроенный сервер Flask (app.run)"""
+    logging.disable(logging.INFO)
+    import main as integration
+    integration.app.run(host='127.0.0.1', port=port, debug=False)
+
+
+def run_gunicorn(port, workers, threads):
+    """Production режим: serve.py web"""
+    logging.disable(logging.INFO)
+    import serve
+    args = argparse.Namespace(
+        bind=f"127.0.0.1:{port}", workers=workers, threads=threads,
+        worker_class='gthread', graceful_timeout=5,
+    )
+    serve.run_web(args)
+
+
+def wait_ready(url, timeout=30):
+    """Ожидание запуска сервера"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(f"{url}/webhook/test", timeout=1)
+            return True
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    return False
+
+
+def load(url, total, concurrency):
+    """Параллельная отправка webhooks, возвращает (запросов в секунду, ошибок)"""
+    local = threading.local()
+
+    def send(n):
+        # Отдельная keep-alive сессия для каждого клиентского потока
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        payload = {'messages': [{
+            'messageId': f"bench-{n}",
+            'channelId': 'channel-1',
+            'chatId': f"chat-{n % 100}",
+            'chatType': 'whatsapp',
+            'status': 'inbound',
+            'text': 'Здравствуйте',
+        }]}
+        try:
+            return session.post(f"{url}/webhook/wazzup", json=payload, timeout=30).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(send, range(total)))
+    elapsed = time.perf_counter() - start
+    return total / elapsed, results.count(False)
+
+
+def measure(name, target, target_args, args):
+    """Запуск сервера, прогрев и замер"""
+    port = target_args[0]
+    process = multiprocessing.Process(target=target, args=target_args, daemon=True)
+    process.start()
+    url = f"http://127.0.0.1:{port}"
+    try:
+        if not wait_ready(url):
+            print(f"   • {name}: сервер не запустился")
+            return None
+        load(url, min(200, args.requests), args.concurrency)
+        rate, errors = load(url, args.requests, args.concurrency)
+        print(f"   • {name}: {rate:.0f} запросов/с, ошибок {errors}")
+        return rate
+    finally:
+        process.terminate()
+        process.join(10)
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=3000, help='количество webhook')
+    parser.add_argument('--concurrency', type=int, default=32, help='параллельных клиентов')
+    parser.add_argument('--workers', type=int, default=4, help='процессов gunicorn')
+    parser.add_argument('--threads', type=int, default=8, help='потоков в процессе gunicorn')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Процессы сервера наследуют настройки через fork
+        multiprocessing.set_start_method('fork')
+        from config import DATABASE_CONFIG
+        DATABASE_CONFIG['db_path'] = os.path.join(tmp, 'bench.db')
+
+        print(f"🚀 Прием webhooks: {args.requests} запросов, {args.concurrency} клиентов")
+        print("=" * 60)
+        dev = measure('app.run', run_dev_server, (free_port(),), args)
+        prod = measure(
+            f"gunicorn {args.workers}x{args.threads}", run_gunicorn,
+            (free_port(), args.workers, args.threads), args
+        )
+
+    if dev and prod:
+        print(f"   • ускорение: {prod / dev:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Микро-бенчмарк слоя хранения: запись по одному сообщению против пакетной записи
+
+Запуск:
+    python3 benchmarks/bench_storage.py --webhooks 200 --batch 50
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import Storage
+from message_tracker import MessageTracker
+
+
+def make_messages(webhook_no, batch_size, chats):
+    """Генерация сообщений одного webhook"""
+    return [
+        {
+            'messageId': f"msg-{webhook_no}-{i}",
+            'channelId': 'channel-1',
+            'chatId': f"7900{(webhook_no * batch_size + i) % chats:07d}",
+            'chatType': 'whatsapp',
+            'contact': {'name': f"Client {i}"},
+            'text': f"Сообщение {i} из webhook {webhook_no}",
+            'type': 'text',
+            'status': 'inbound',
+            'dateTime': '2024-01-01T12:00:00.000Z',
+            'isEcho': False,
+        }
+        for i in range(batch_size)
+    ]
+
+
+def run_legacy(db_path, webhooks, batch_size, chats):
+    """Прежняя схема: новое соединение и COMMIT на каждую операцию"""
+    tracker = MessageTracker(Storage(db_path, journal_mode='DELETE', synchronous='FULL'))
+    tracker.storage.close()
+
+    start = time.perf_counter()
+    for w in range(webhooks):
+        for message in make_messages(w, batch_size, chats):
+            conn = sqlite3.connect(db_path)
+            tracker._insert_message(conn.cursor(), message)
+            conn.commit()
+            conn.close()
+
+            conn = sqlite3.connect(db_path)
+            cursor = conn.cursor()
+            tracker._get_or_create_contact(cursor, message['chatId'], message['chatType'])
+            conn.commit()
+            conn.close()
+    return time.perf_counter() - start
+
+
+def run_per_message(db_path, webhooks, batch_size, chats, synchronous):
+    """Постоянные соединения и WAL, но транзакция на каждую операцию"""
+    tracker = MessageTracker(Storage(db_path, synchronous=synchronous))
+    start = time.perf_counter()
+    for w in range(webhooks):
+        for message in make_messages(w, batch_size, chats):
+            tracker.save_wazzup_message(message)
+            tracker.get_or_create_contact(message['chatId'], message['chatType'])
+    elapsed = time.perf_counter() - start
+    tracker.storage.close()
+    return elapsed
+
+
+def run_batched(db_path, webhooks, batch_size, chats, synchronous):
+    """Постоянные соединения, WAL и одна транзакция на webhook"""
+    tracker = MessageTracker(Storage(db_path, synchronous=synchronous))
+    start = time.perf_counter()
+    for w in range(webhooks):
+        tracker.save_webhook_batch(make_messages(w, batch_size, chats))
+    elapsed = time.perf_counter() - start
+    tracker.storage.close()
+    return elapsed
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--webhooks', type=int, default=100, help='количество webhook')
+    parser.add_argument('--batch', type=int, default=50, help='сообщений в одном webhook')
+    parser.add_argument('--chats', type=int, default=500, help='количество разных чатов')
+    parser.add_argument('--synchronous', default='NORMAL', help='PRAGMA synchronous для WAL режимов')
+    args = parser.parse_args()
+
+    # Сообщения логируются на уровне INFO, в бенчмарке это только шум
+    logging.disable(logging.INFO)
+
+    total = args.webhooks * args.batch
+    print(f"🚀 Бенчмарк хранилища: {args.webhooks} webhook × {args.batch} сообщений")
+    print("=" * 60)
+
+    scenarios = [
+        ('connect на операцию (было)', lambda path: run_legacy(path, args.webhooks, args.batch, args.chats)),
+        ('WAL, транзакция на операцию', lambda path: run_per_message(path, args.webhooks, args.batch, args.chats, args.synchronous)),
+        ('WAL, транзакция на webhook', lambda path: run_batched(path, args.webhooks, args.batch, args.chats, args.synchronous)),
+    ]
+
+    for name, scenario in scenarios:
+        with tempfile.TemporaryDirectory() as tmp:
+            elapsed = scenario(os.path.join(tmp, 'bench.db'))
+        print(f"   • {name:<32} {elapsed:8.3f} с  {total / elapsed:10.0f} сообщ/с")
+
+
+if __name__ == "__main__":
+    main()
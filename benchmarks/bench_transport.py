@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк HTTP транспорта против локального заменителя Podio
+
+Сравнивает голые requests.post (новое соединение на каждый вызов)
+с HttpTransport (пул keep-alive соединений, повторы при 429).
+
+Запуск:
+    python3 benchmarks/bench_transport.py --calls 300 --latency 0.005 --throttle-every 10
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_transport import HttpTransport
+from stand_ins import StandInServer, podio_routes
+
+
+def run_bare(base_url, calls):
+    """Прежний вариант: requests.post без сессии и таймаута"""
+    ok = 0
+    for i in range(calls):
+        response = requests.post(f"{base_url}/item/app/1/", json={'fields': {'title': str(i)}})
+        ok += response.status_code == 200
+    return ok
+
+
+def run_transport(base_url, calls):
+    """HttpTransport с пулом соединений и повторами"""
+    http = HttpTransport('bench', base_url, backoff_factor=0.01, max_retry_after=5)
+    ok = 0
+    for i in range(calls):
+        response = http.post('/item/app/1/', json={'fields': {'title': str(i)}})
+        ok += response.status_code == 200
+    http.close()
+    return ok
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200, help='количество запросов')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка заменителя, секунды')
+    parser.add_argument('--throttle-every', type=int, default=0, help='отвечать 429 на каждый N-й запрос')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    print(f"🚀 HTTP транспорт: {args.calls} запросов, задержка {args.latency} с, 429 каждый {args.throttle_every or '-'}")
+    print("=" * 60)
+
+    for name, scenario in (('requests.post (было)', run_bare), ('HttpTransport', run_transport)):
+        server = StandInServer(podio_routes(), latency=args.latency,
+                               throttle_every=args.throttle_every, retry_after=0).start()
+        start = time.perf_counter()
+        ok = scenario(server.url, args.calls)
+        elapsed = time.perf_counter() - start
+        server.stop()
+        print(f"   • {name:<22} {elapsed:7.3f} с  {args.calls / elapsed:8.0f} запр/с  успешно {ok}/{args.calls}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк задержки ответа /webhook/wazzup при медленной обработке
+
+Обработчик очереди искусственно замедляется, чтобы показать, что время
+ответа webhook не зависит от скорости Podio и диска.
+
+Запуск:
+    python3 benchmarks/bench_webhook.py --requests 500 --handler-delay 0.2
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, p):
+    """Перцентиль по отсортированному списку"""
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300, help='количество webhook')
+    parser.add_argument('--messages', type=int, default=5, help='сообщений в одном webhook')
+    parser.add_argument('--chats', type=int, default=50, help='количество разных чатов')
+    parser.add_argument('--handler-delay', type=float, default=0.1, help='задержка обработки задачи, секунды')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from config import DATABASE_CONFIG
+        DATABASE_CONFIG['db_path'] = os.path.join(tmp, 'bench.db')
+
+        import main as integration
+
+        # Имитация медленной обработки (Podio, диск)
+        process = integration.process_wazzup_payload
+
+        def slow_process(payload):
+            time.sleep(args.handler_delay)
+            process(payload)
+
+        integration.workers.register('wazzup', slow_process)
+        integration.workers.start()
+
+        client = integration.app.test_client()
+        latencies = []
+        for r in range(args.requests):
+            messages = [
+                {
+                    'messageId': f"msg-{r}-{i}",
+                    'channelId': 'channel-1',
+                    'chatId': f"chat-{(r + i) % args.chats}",
+                    'chatType': 'whatsapp',
+                    'status': 'inbound',
+                    'text': 'Здравствуйте',
+                }
+                for i in range(args.messages)
+            ]
+            start = time.perf_counter()
+            response = client.post('/webhook/wazzup', json={'messages': messages})
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200
+
+        stats = integration.workers.stats()
+        integration.workers.stop(timeout=1)
+        integration.tracker.storage.close()
+
+    print(f"🚀 Задержка ответа webhook ({args.requests} запросов, обработка {args.handler_delay} с)")
+    print("=" * 60)
+    for p in (50, 95, 99):
+        print(f"   • p{p}: {percentile(latencies, p):.2f} мс")
+    print(f"   • в очереди после отправки: {stats['depth']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный тест интеграции с локальными заменителями Podio и Wazzup
+
+Webhooks отправляются на /webhook/wazzup с заданной частотой (открытая
+модель нагрузки: отправка не ждет ответов на предыдущие запросы), фоновые
+задачи записывают сообщения в Podio-заменитель. Результат - пропускная
+способность, p50/p95/p99 задержки ответа webhook и сквозной задержки до
+комментария в Podio, рост базы данных. Итоги сохраняются в JSON; с
+--baseline результат сравнивается с прошлым запуском, и при регрессии
+код возврата равен 1.
+
+Запуск:
+    python3 benchmarks/load_test.py --rate 50 --duration 30 --podio-latency 0.05
+    python3 benchmarks/load_test.py --baseline benchmarks/results/load-прошлый.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stand_ins import StandInServer, podio_routes, wazzup_routes
+
+APP_ID = '55'
+MARKER = re.compile(r'load-(\d+)-\d+')
+
+# Метрики для сравнения с прошлым запуском: (путь, больше - лучше)
+REGRESSION_METRICS = [
+    (('webhook', 'throughput'), True),
+    (('webhook', 'p95_ms'), False),
+    (('webhook', 'p99_ms'), False),
+    (('end_to_end', 'p95_ms'), False),
+    (('db', 'bytes_per_message'), False),
+]
+
+
+def percentile(values, p):
+    """Перцентиль по отсортированному списку"""
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def summary(values):
+    """p50/p95/p99/max в миллисекундах"""
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50), 2) if values else None,
+        'p95_ms': round(percentile(values, 95), 2) if values else None,
+        'p99_ms': round(percentile(values, 99), 2) if values else None,
+        'max_ms': round(max(values), 2) if values else None,
+    }
+
+
+def db_size(storage):
+    """Размер файла базы после переноса WAL в основной файл, байты"""
+    storage.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return os.path.getsize(storage.db_path)
+
+
+def load_payloads(path):
+    """Записанные webhooks Wazzup (JSON по одному на строку)"""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def make_payload(n, args, recorded):
+    """Тело webhook номер n; messageId уникальны, в тексте - метка для сквозной задержки"""
+    if recorded:
+        payload = json.loads(json.dumps(recorded[n % len(recorded)]))
+        for i, message in enumerate(payload.get('messages', [])):
+            message['messageId'] = f"{message.get('messageId')}-load-{n}-{i}"
+            message['text'] = f"{message.get('text', '')} load-{n}-{i}"
+        return payload
+
+    return {'messages': [
+        {
+            'messageId': f"load-{n}-{i}",
+            'channelId': 'channel-1',
+            'chatId': f"7900{(n + i) % args.chats:07d}",
+            'chatType': 'whatsapp',
+            'status': 'inbound',
+            'contact': {'name': f"Клиент {(n + i) % args.chats}"},
+            'text': f"Сообщение load-{n}-{i}",
+        }
+        for i in range(args.messages)
+    ]}
+
+
+def send_open_loop(url, args, recorded):
+    """Отправка webhooks по расписанию, возвращает (время отправки по номеру, задержки, ошибки)"""
+    total = int(args.rate * args.duration)
+    sent_at = {}
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def send(n):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        payload = make_payload(n, args, recorded)
+        start = time.time()
+        try:
+            response = session.post(f"{url}/webhook/wazzup", json=payload, timeout=30)
+            ok = response.status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        elapsed = (time.time() - start) * 1000
+        with lock:
+            sent_at[n] = start
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors.append(n)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        for n in range(total):
+            # Открытая модель: запрос уходит в свое время, даже если сервер отстает
+            delay = start + n / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, n)
+    elapsed = time.perf_counter() - start
+    return sent_at, latencies, errors, elapsed
+
+
+def compare(result, baseline, tolerance):
+    """Сравнение с прошлым запуском, возвращает список регрессий"""
+    regressions = []
+    for path, higher_is_better in REGRESSION_METRICS:
+        current, previous = result, baseline
+        for key in path:
+            current = (current or {}).get(key)
+            previous = (previous or {}).get(key)
+        if current is None or not previous:
+            continue
+
+        change = (current - previous) / previous
+        worse = change < -tolerance if higher_is_better else change > tolerance
+        if worse:
+            regressions.append({'metric': '.'.join(path), 'baseline': previous, 'current': current,
+                                'change': round(change, 3)})
+    return regressions
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rate', type=float, default=50, help='webhooks в секунду')
+    parser.add_argument('--duration', type=float, default=20, help='длительность нагрузки, секунды')
+    parser.add_argument('--messages', type=int, default=1, help='сообщений в одном webhook')
+    parser.add_argument('--chats', type=int, default=200, help='количество разных чатов')
+    parser.add_argument('--concurrency', type=int, default=32, help='одновременных запросов')
+    parser.add_argument('--replay', help='файл с записанными webhooks Wazzup (JSON по строкам)')
+    parser.add_argument('--podio-latency', type=float, default=0.05, help='задержка Podio, секунды')
+    parser.add_argument('--podio-error-rate', type=float, default=0.0, help='доля ответов 503 от Podio')
+    parser.add_argument('--wazzup-latency', type=float, default=0.02, help='задержка Wazzup, секунды')
+    parser.add_argument('--wazzup-error-rate', type=float, default=0.0, help='доля ответов 503 от Wazzup')
+    parser.add_argument('--coalesce-window', type=float, default=0, help='окно объединения сообщений, секунды')
+    parser.add_argument('--drain-timeout', type=float, default=60, help='ожидание разбора очереди, секунды')
+    parser.add_argument('--output', help='файл результата (по умолчанию benchmarks/results/load-<время>.json)')
+    parser.add_argument('--baseline', help='JSON прошлого запуска для поиска регрессий')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимое ухудшение метрики (доля)')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    recorded = load_payloads(args.replay) if args.replay else None
+
+    podio_server = StandInServer(
+        podio_routes(), latency=args.podio_latency, error_rate=args.podio_error_rate
+    ).start()
+    wazzup_server = StandInServer(
+        wazzup_routes(), latency=args.wazzup_latency, error_rate=args.wazzup_error_rate
+    ).start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        import config
+        db_path = os.path.join(tmp, 'load.db')
+        config.DATABASE_CONFIG['db_path'] = db_path
+        config.DATABASE_CONFIG['backup_dir'] = None
+        config.DATABASE_CONFIG['archive_dir'] = None
+        config.PODIO_CONFIG['base_url'] = podio_server.url
+        config.PODIO_CONFIG['deals_app_id'] = APP_ID
+        config.WAZZUP_CONFIG['base_url'] = f"{wazzup_server.url}/v3"
+        config.INTEGRATION_CONFIG['coalesce_window'] = args.coalesce_window
+        config.INTEGRATION_CONFIG['podio_hook_url'] = None
+
+        import main as integration
+
+        # У каждого чата есть сделка, чтобы сообщения уходили в Podio
+        storage = integration.tracker.storage
+        with storage.transaction() as cursor:
+            chat_ids = sorted({
+                (m.get('chatId'), m.get('chatType'))
+                for payload in (recorded or [make_payload(n, args, None) for n in range(args.chats)])
+                for m in payload.get('messages', [])
+            })
+            for number, (chat_id, chat_type) in enumerate(chat_ids):
+                cursor.execute("INSERT OR IGNORE INTO contacts (chat_id, chat_type, name) VALUES (?, ?, ?)",
+                               (chat_id, chat_type, f"Клиент {number}"))
+                cursor.execute('''
+                    INSERT INTO deals (contact_id, podio_item_id)
+                    SELECT id, ? FROM contacts WHERE chat_id = ? AND chat_type = ?
+                ''', (str(100000 + number), chat_id, chat_type))
+        integration.tracker.contacts.clear()
+        size_before = db_size(storage)
+
+        integration.start_background()
+        http_server = make_server('127.0.0.1', 0, integration.app, threaded=True)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{http_server.server_port}"
+
+        # Глубина очереди во время нагрузки
+        depths = []
+        sampling = threading.Event()
+
+        def sample():
+            while not sampling.wait(0.5):
+                depths.append(integration.workers.stats()['depth'])
+
+        threading.Thread(target=sample, daemon=True).start()
+
+        print(f"🚀 Нагрузка: {args.rate} webhooks/с в течение {args.duration} с")
+        sent_at, latencies, errors, elapsed = send_open_loop(url, args, recorded)
+
+        # Ожидание, пока фоновые задачи разберут очередь
+        drain_start = time.time()
+        while time.time() - drain_start < args.drain_timeout:
+            stats = integration.workers.stats()
+            if stats['depth'] == 0 and integration.coalescer.stats()['buffered'] == 0:
+                break
+            time.sleep(0.2)
+        drain_seconds = time.time() - drain_start
+        sampling.set()
+
+        # Сквозная задержка: от отправки webhook до комментария в Podio
+        delivered = {}
+        for record in podio_server.requests:
+            if record['method'] == 'POST' and record['path'].startswith('/comment/'):
+                for match in MARKER.finditer(json.dumps(record['body'], ensure_ascii=False)):
+                    n = int(match.group(1))
+                    delivered.setdefault(n, record['time'])
+        end_to_end = [(delivered[n] - sent_at[n]) * 1000 for n in delivered if n in sent_at]
+
+        counts = {
+            table: storage.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ('wazzup_messages', 'contacts', 'deals', 'work_queue')
+        }
+        size_after = db_size(storage)
+        queue_stats = integration.workers.stats()
+
+        http_server.shutdown()
+        integration.stop_background(timeout=5)
+        storage.close()
+
+    podio_server.stop()
+    wazzup_server.stop()
+
+    total = len(sent_at)
+    messages = counts['wazzup_messages']
+    result = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'params': vars(args),
+        'webhook': {
+            'sent': total,
+            'errors': len(errors),
+            'offered_rate': args.rate,
+            'throughput': round(len(latencies) / elapsed, 2) if elapsed else None,
+            **summary(latencies),
+        },
+        'end_to_end': {
+            'delivered': len(end_to_end),
+            **summary(end_to_end),
+        },
+        'queue': {
+            'max_depth': max(depths) if depths else 0,
+            'drain_seconds': round(drain_seconds, 2),
+            'dead': queue_stats['dead'],
+            'failed_attempts': queue_stats['failed_attempts'],
+        },
+        'db': {
+            'size_before': size_before,
+            'size_after': size_after,
+            'growth_bytes': size_after - size_before,
+            'bytes_per_message': round((size_after - size_before) / messages, 1) if messages else None,
+            'rows': counts,
+        },
+        'stand_ins': {
+            'podio_requests': len(podio_server.requests),
+            'wazzup_requests': len(wazzup_server.requests),
+        },
+    }
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results',
+        f"load-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        result['regressions'] = regressions
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    webhook = result['webhook']
+    e2e = result['end_to_end']
+    print("=" * 60)
+    print(f"   • отправлено: {webhook['sent']}, ошибок: {webhook['errors']}, "
+          f"пропускная способность: {webhook['throughput']} запросов/с")
+    print(f"   • ответ webhook: p50 {webhook['p50_ms']} мс, p95 {webhook['p95_ms']} мс, p99 {webhook['p99_ms']} мс")
+    print(f"   • до комментария Podio: p50 {e2e['p50_ms']} мс, p95 {e2e['p95_ms']} мс, "
+          f"p99 {e2e['p99_ms']} мс (доставлено {e2e['delivered']})")
+    print(f"   • очередь: максимум {result['queue']['max_depth']}, разобрана за {result['queue']['drain_seconds']} с")
+    print(f"   • база: +{result['db']['growth_bytes']} байт, {result['db']['bytes_per_message']} байт на сообщение")
+    print(f"   • результат: {output}")
+
+    for regression in regressions:
+        print(f"❌ Регрессия {regression['metric']}: {regression['baseline']} -> {regression['current']} "
+              f"({regression['change']:+.0%})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальные заменители внешних API для бенчмарков и ручной проверки
+- Настраиваемая задержка ответа
+- Имитация лимитов (429 + Retry-After) и ошибок 5xx
+"""
+
+import re
+import zlib
+import json
+import time
+import random
+import socket
+import itertools
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+
+
+class StandInServer:
+    """HTTP сервер, отвечающий по таблице маршрутов"""
+
+    def __init__(self, routes, latency=0.0, error_rate=0.0, throttle_every=0, retry_after=1,
+                 host='127.0.0.1', port=0):
+        self.routes = [(method, re.compile(pattern), handler) for method, pattern, handler in routes]
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.requests = []
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Запуск сервера в фоновом потоке"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Остановка сервера"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _dispatch(self, method, path, body, headers):
+        """Выбор ответа: ошибка, лимит или обработчик маршрута"""
+        number = next(self._counter)
+        with self._lock:
+            self.requests.append({'method': method, 'path': path, 'body': body, 'time': time.time()})
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.throttle_every and number % self.throttle_every == 0:
+            return 429, {'error': 'rate_limit'}, {'Retry-After': str(self.retry_after)}
+        if self.error_rate and random.random() < self.error_rate:
+            return 503, {'error': 'unavailable'}, {}
+
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(urlsplit(path).path)
+            if route_method == method and match:
+                return handler(match, body, headers)
+        return 404, {'error': 'not_found'}, {}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # Без Nagle заголовки и тело не ждут delayed ACK на keep-alive соединении
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type', '')
+                if 'multipart' in content_type:
+                    # Содержимое файлов не разбираем, достаточно размера
+                    body = {'size': len(raw)}
+                elif 'json' in content_type and raw:
+                    body = json.loads(raw)
+                elif raw:
+                    body = {k: v[0] for k, v in parse_qs(raw.decode()).items()}
+                else:
+                    # Для GET параметры приходят в строке запроса
+                    body = {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+
+                status, payload, headers = server._dispatch(self.command, self.path, body, self.headers)
+                if isinstance(payload, bytes):
+                    # Двоичный ответ (вложение), Content-Type задает обработчик
+                    data = payload
+                else:
+                    data = json.dumps(payload, ensure_ascii=False).encode()
+                    headers = {'Content-Type': 'application/json', **headers}
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _handle
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def podio_routes(state=None):
+    """Маршруты, имитирующие Podio API (токен, элементы, комментарии, файлы)
+
+    state: словарь с 'items' ({item_id: {'last_event_on': ..., 'fields': [...]}}),
+    'comments' ({item_id: [комментарии]}), 'spaces', 'apps' ({space_id: [...]})
+    и 'fields' ({app_id: [...]}), чтобы заменитель отдавал данные.
+    Как и Podio, hook.verify отправляется на URL hook только после запроса
+    /hook/<id>/verify/request.
+    """
+    ids = itertools.count(1000)
+    state = state if state is not None else {}
+    state.setdefault('items', {})
+    state.setdefault('comments', {})
+
+    def token(match, body, headers):
+        return 200, {
+            'access_token': f"token-{next(ids)}",
+            'refresh_token': f"refresh-{next(ids)}",
+            'expires_in': 28800,
+        }, {}
+
+    def create_item(match, body, headers):
+        item_id = next(ids)
+        # Созданный элемент виден в фильтре и по external_id
+        state['items'][item_id] = {
+            'app_id': int(match.group(1)),
+            'external_id': body.get('external_id'),
+            'fields': [{'external_id': key, 'values': value if isinstance(value, list) else [{'value': value}]}
+                       for key, value in body.get('fields', {}).items()],
+            'last_event_on': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()),
+        }
+        return 200, {'item_id': item_id, 'app_item_id': next(ids)}, {}
+
+    def item_by_external_id(match, body, headers):
+        for item_id, item in state['items'].items():
+            if item.get('app_id') == int(match.group(1)) and item.get('external_id') == match.group(2):
+                return 200, {'item_id': item_id, **item}, {}
+        return 404, {'error': 'not_found'}, {}
+
+    def filter_items(match, body, headers):
+        app_id = int(match.group(1))
+        since = body.get('filters', {}).get('last_event_on', {}).get('from', '')
+        items = sorted(
+            ({'item_id': item_id, **item} for item_id, item in state['items'].items()
+             if item.get('last_event_on', '') >= since and item.get('app_id', app_id) == app_id),
+            key=lambda item: item.get('last_event_on', '')
+        )
+        offset, limit = body.get('offset', 0), body.get('limit', 30)
+        return 200, {'total': len(state['items']), 'filtered': len(items),
+                     'items': items[offset:offset + limit]}, {}
+
+    def add_comment(match, body, headers):
+        comment_id = next(ids)
+        # Комментарий виден при чтении комментариев элемента (проверка повтора по external_id)
+        state['comments'].setdefault(int(match.groups()[-1]), []).append(
+            {'comment_id': comment_id, 'value': body.get('value'), 'external_id': body.get('external_id')})
+        return 200, {'comment_id': comment_id}, {}
+
+    def get_comments(match, body, headers):
+        comments = state['comments'].get(int(match.group(1)), [])
+        offset, limit = int(body.get('offset', 0)), int(body.get('limit', 100))
+        return 200, comments[offset:offset + limit], {}
+
+    def get_comment(match, body, headers):
+        comment_id = int(match.group(1))
+        for item_id, comments in state['comments'].items():
+            for comment in comments:
+                if comment['comment_id'] == comment_id:
+                    return 200, {**comment, 'ref': {'type': 'item', 'id': item_id}}, {}
+        return 404, {'error': 'not_found'}, {}
+
+    def upload_file(match, body, headers):
+        file_id = next(ids)
+        state.setdefault('files', {})[file_id] = body.get('size')
+        return 200, {'file_id': file_id}, {}
+
+    def copy_file(match, body, headers):
+        file_id = next(ids)
+        state.setdefault('files', {})[file_id] = state.get('files', {}).get(int(match.group(1)))
+        return 200, {'file_id': file_id}, {}
+
+    def cached(payload, headers):
+        # ETag по содержимому: при совпадении If-None-Match ответ 304 без тела
+        etag = '"%x"' % zlib.crc32(json.dumps(payload, sort_keys=True).encode())
+        if headers.get('If-None-Match') == etag:
+            return 304, b'', {'ETag': etag}
+        return 200, payload, {'ETag': etag}
+
+    def list_spaces(match, body, headers):
+        return cached(state.get('spaces', []), headers)
+
+    def list_apps(match, body, headers):
+        return cached(state.get('apps', {}).get(int(match.group(1)), []), headers)
+
+    def get_app(match, body, headers):
+        app_id = int(match.group(1))
+        for apps in state.get('apps', {}).values():
+            for app in apps:
+                if app['app_id'] == app_id:
+                    return cached({**app, 'fields': state.get('fields', {}).get(app_id, [])}, headers)
+        return 404, {'error': 'not_found'}, {}
+
+    def list_hooks(match, body, headers):
+        return 200, state.setdefault('hooks', []), {}
+
+    def create_hook(match, body, headers):
+        hook = {'hook_id': next(ids), 'url': body.get('url'), 'type': body.get('type'), 'status': 'inactive'}
+        state.setdefault('hooks', []).append(hook)
+        return 200, {'hook_id': hook['hook_id']}, {}
+
+    def request_verification(match, body, headers):
+        for hook in state.setdefault('hooks', []):
+            if hook['hook_id'] == int(match.group(1)):
+                hook['code'] = f"code-{next(ids)}"
+                emitter = PodioHookEmitter(hook['url'], hook['hook_id'])
+                # Подтверждение приходит отдельным запросом после ответа API
+                threading.Thread(target=emitter.verify, args=(hook['code'],), daemon=True).start()
+                return 204, b'', {}
+        return 404, {'error': 'not_found'}, {}
+
+    def validate_hook(match, body, headers):
+        for hook in state.setdefault('hooks', []):
+            if hook['hook_id'] == int(match.group(1)):
+                if not hook.get('code') or body.get('code') != hook['code']:
+                    return 400, {'error': 'invalid_value'}, {}
+                hook['status'] = 'active'
+                return 204, b'', {}
+        return 404, {'error': 'not_found'}, {}
+
+    return [
+        ('POST', r'/oauth/token/?', token),
+        ('POST', r'/item/app/(\d+)/filter/?', filter_items),
+        ('POST', r'/item/app/(\d+)/?', create_item),
+        ('GET', r'/item/app/(\d+)/external_id/([\w.-]+)', item_by_external_id),
+        ('POST', r'/comment/app/(\d+)/(\d+)/?', add_comment),
+        ('POST', r'/comment/item/(\d+)/?', add_comment),
+        ('GET', r'/comment/item/(\d+)/?', get_comments),
+        ('GET', r'/comment/(\d+)/?', get_comment),
+        ('POST', r'/file/?', upload_file),
+        ('POST', r'/file/(\d+)/copy/?', copy_file),
+        ('GET', r'/space/?', list_spaces),
+        ('GET', r'/app/space/(\d+)/?', list_apps),
+        ('GET', r'/app/(\d+)/?', get_app),
+        ('GET', r'/hook/app/(\d+)/?', list_hooks),
+        ('POST', r'/hook/app/(\d+)/?', create_hook),
+        ('POST', r'/hook/(\d+)/verify/request/?', request_verification),
+        ('POST', r'/hook/(\d+)/verify/validate/?', validate_hook),
+    ]
+
+
+def wazzup_routes(media=None):
+    """Маршруты, имитирующие Wazzup API v3 (отправка сообщений, webhooks, вложения)
+
+    media: словарь {имя: bytes}, который отдается по /media/<имя>.
+    """
+    ids = itertools.count(1)
+    media = media if media is not None else {}
+    seen = set()
+    lock = threading.Lock()
+
+    def send_message(match, body, headers):
+        key = body.get('crmMessageId')
+        with lock:
+            if key and key in seen:
+                return 400, {'error': 'REPEATED_CRM_MESSAGE_ID'}, {}
+            if key:
+                seen.add(key)
+        return 201, {'messageId': f"wz-{next(ids)}", 'chatId': body.get('chatId')}, {}
+
+    def webhooks(match, body, headers):
+        return 200, {'ok': True}, {}
+
+    def get_media(match, body, headers):
+        content = media.get(match.group(1))
+        if content is None:
+            return 404, {'error': 'not_found'}, {}
+        return 200, content, {'Content-Type': 'image/jpeg'}
+
+    return [
+        ('GET', r'/media/([\w.-]+)', get_media),
+        ('POST', r'(/v3)?/message/?', send_message),
+        ('PATCH', r'(/v3)?/webhooks/?', webhooks),
+    ]
+
+
+class PodioHookEmitter:
+    """Отправка событий в формате Podio hooks на endpoint интеграции"""
+
+    def __init__(self, target_url, hook_id=1):
+        self.target_url = target_url
+        self.hook_id = hook_id
+        self.session = requests.Session()
+
+    def _emit(self, data):
+        data = {'hook_id': self.hook_id, **data}
+        return self.session.post(self.target_url, data=data, timeout=10)
+
+    def verify(self, code='verify-code'):
+        """Запрос подтверждения hook"""
+        try:
+            return self._emit({'type': 'hook.verify', 'code': code})
+        except requests.RequestException:
+            return None
+
+    def comment_created(self, item_id, comment_id):
+        """Событие нового комментария"""
+        return self._emit({'type': 'comment.create', 'item_id': item_id, 'comment_id': comment_id})
+
+    def item_updated(self, item_id, revision_id=1):
+        """Событие изменения элемента"""
+        return self._emit({'type': 'item.update', 'item_id': item_id, 'item_revision_id': revision_id})
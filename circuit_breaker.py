@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Автоматический выключатель (circuit breaker) для внешних API
+- После failure_threshold сбоев подряд запросы не отправляются (fail fast)
+- Через reset_timeout пропускается один пробный запрос; неудача удваивает паузу
+- После восстановления отложенные задачи разбираются с ограниченной частотой
+"""
+
+import time
+import logging
+import threading
+
+from delivery import TokenBucket
+from metrics import REGISTRY
+from work_queue import RetryLater
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_TRANSITIONS = REGISTRY.counter(
+    'circuit_transitions', 'Переключения выключателей внешних API', ('upstream', 'state'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(RetryLater):
+    """API недоступен: запрос не отправлялся, задачу нужно отложить"""
+
+    def __init__(self, name, delay):
+        super().__init__(delay, f"{name} недоступен, повтор через {delay:.0f} с")
+
+
+class CircuitBreaker:
+    """Состояние доступности одного внешнего API"""
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, max_reset_timeout=300,
+                 replay_rate=2.0, replay_period=300):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.replay_rate = replay_rate
+        self.replay_period = replay_period
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_count = 0
+        self._timeout = reset_timeout
+        self._opened_at = 0.0
+        self._closed_at = 0.0
+        # Поток, который отправил пробный запрос в полуоткрытом состоянии
+        self._probe = None
+        self._bucket = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        # Был ли сбой API в текущей задаче очереди этого потока
+        self._task = threading.local()
+
+    @classmethod
+    def from_config(cls, name, config):
+        """Создание по словарю конфигурации API; None, если выключатель отключен"""
+        if not config.get('breaker_failures', 5):
+            return None
+        return cls(
+            name,
+            failure_threshold=config.get('breaker_failures', 5),
+            reset_timeout=config.get('breaker_reset', 30),
+            max_reset_timeout=config.get('breaker_max_reset', 300),
+            replay_rate=config.get('replay_rate', 2.0),
+            replay_period=config.get('replay_period', 300),
+        )
+
+    def on_close(self, callback):
+        """Вызов callback после восстановления API (например, разбудить очередь)"""
+        self._listeners.append(callback)
+
+    def retry_in(self):
+        """Сколько секунд API еще считается недоступным (0 - можно пробовать)"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0
+            return max(0.0, self._opened_at + self._timeout - time.monotonic())
+
+    def before_request(self):
+        """Проверка перед запросом: CircuitOpen, если запрос отправлять нельзя"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == OPEN:
+                wait = self._opened_at + self._timeout - now
+                if wait > 0:
+                    self._task.failed = True
+                    raise CircuitOpen(self.name, wait)
+                self._transition(HALF_OPEN)
+            # В полуоткрытом состоянии одновременно идет только один пробный запрос
+            if self._probe is not None:
+                self._task.failed = True
+                raise CircuitOpen(self.name, 1)
+            self._probe = threading.get_ident()
+
+    def record(self, failed):
+        """Результат запроса: True - сбой API, False - ответ получен, None - не учитывать"""
+        closed = False
+        with self._lock:
+            # Ответы запросов, отправленных до открытия, не снимают отметку пробы
+            was_probe = self._probe == threading.get_ident()
+            if was_probe:
+                self._probe = None
+            if failed is None:
+                return
+            if failed:
+                self._task.failed = True
+            if not failed:
+                self.failures = 0
+                if self.state != CLOSED:
+                    self._timeout = self.reset_timeout
+                    self._closed_at = time.monotonic()
+                    self._bucket = TokenBucket(self.replay_rate, max(1, self.replay_rate)) if self.replay_rate else None
+                    self._transition(CLOSED)
+                    closed = True
+            else:
+                self.failures += 1
+                if self.state == HALF_OPEN and was_probe:
+                    # Пробный запрос не прошел: следующая проба позже
+                    self._timeout = min(self._timeout * 2, self.max_reset_timeout)
+                    self._open()
+                elif self.state == CLOSED and self.failures >= self.failure_threshold:
+                    self._open()
+
+        if closed:
+            logger.info(f"✅ {self.name} снова доступен, отложенные задачи разбираются "
+                        f"не быстрее {self.replay_rate}/с")
+            for callback in self._listeners:
+                callback()
+
+    def begin_task(self):
+        """Начало задачи очереди в текущем потоке: сброс отметки сбоя API"""
+        self._task.failed = False
+
+    def task_failed(self):
+        """Был ли в текущей задаче потока сбой API или отказ открытого выключателя
+
+        Обертки API возвращают None/False вместо исключения, поэтому по
+        ошибке обработчика нельзя понять, что причиной была недоступность API.
+        """
+        return getattr(self._task, 'failed', False)
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self.opened_count += 1
+        self._transition(OPEN)
+        logger.error(f"🔌 {self.name} недоступен ({self.failures} сбоев подряд), "
+                     f"запросы приостановлены на {self._timeout:.0f} с")
+
+    def _transition(self, state):
+        self.state = state
+        CIRCUIT_TRANSITIONS.inc(upstream=self.name, state=state)
+
+    def throttle(self):
+        """Пауза перед задачей очереди в период разбора накопленных задач (0 - без паузы)"""
+        with self._lock:
+            bucket = self._bucket
+            if bucket is None:
+                return 0
+            if time.monotonic() - self._closed_at > self.replay_period:
+                self._bucket = None
+                return 0
+        return bucket.try_acquire()
+
+    def stats(self):
+        """Состояние выключателя"""
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'opened': self.opened_count,
+                'reset_timeout': self._timeout,
+                'replaying': self._bucket is not None,
+            }
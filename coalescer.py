@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Объединение серий коротких сообщений одного чата
+- Сообщения копятся, пока клиент пишет (окно тишины window)
+- Пачка отправляется не позже max_delay от первого сообщения
+- Пачка отправляется сразу при достижении max_batch сообщений
+"""
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class MessageCoalescer:
+    """Буфер сообщений по ключу чата с отложенной отправкой пачкой"""
+
+    def __init__(self, flush, window=3.0, max_batch=20, max_delay=15.0):
+        self.flush = flush
+        self.window = window
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._buffers = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._received = 0
+        self._flushes = 0
+
+    def start(self):
+        """Запуск фонового потока отправки"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name='coalescer', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        """Остановка с отправкой всех накопленных сообщений"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def add(self, key, item):
+        """Добавление сообщения в буфер чата"""
+        if self.window <= 0:
+            with self._cond:
+                self._received += 1
+            self._flush(key, [item])
+            return
+
+        if not self._running:
+            self.start()
+
+        ready = None
+        with self._cond:
+            self._received += 1
+            now = time.monotonic()
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                buffer = self._buffers[key] = {'items': [], 'first': now, 'last': now}
+            buffer['items'].append(item)
+            buffer['last'] = now
+
+            if len(buffer['items']) >= self.max_batch:
+                ready = self._buffers.pop(key)['items']
+            else:
+                self._cond.notify()
+
+        if ready:
+            self._flush(key, ready)
+
+    def _deadline(self, buffer):
+        """Момент отправки буфера"""
+        return min(buffer['last'] + self.window, buffer['first'] + self.max_delay)
+
+    def _run(self):
+        """Цикл фонового потока: отправка буферов, у которых истек срок"""
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                if not self._running:
+                    due = list(self._buffers)
+                else:
+                    due = [key for key, buffer in self._buffers.items() if self._deadline(buffer) <= now]
+
+                if not due:
+                    if not self._running:
+                        return
+                    timeout = None
+                    if self._buffers:
+                        timeout = min(self._deadline(buffer) for buffer in self._buffers.values()) - now
+                    self._cond.wait(timeout)
+                    continue
+
+                batches = [(key, self._buffers.pop(key)['items']) for key in due]
+
+            for key, items in batches:
+                self._flush(key, items)
+
+    def _flush(self, key, items):
+        """Передача пачки обработчику"""
+        with self._cond:
+            self._flushes += 1
+        try:
+            self.flush(key, items)
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки пачки сообщений чата {key}: {e}")
+
+    def stats(self):
+        """Сколько сообщений принято и сколькими пачками отправлено"""
+        with self._cond:
+            buffered = sum(len(buffer['items']) for buffer in self._buffers.values())
+        return {
+            'received': self._received,
+            'flushes': self._flushes,
+            'buffered': buffered,
+        }
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Правила маршрутизации комментариев Podio
+- Все команды send_commands/exclude_commands собираются в одно регулярное выражение
+- Сравнение без учета регистра и после Unicode нормализации (NFKC)
+- Комментарий разбирается за один проход: команда, текст без команды, тип автора
+- Правила перечитываются из command_rules_file без перезапуска
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+import unicodedata
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Результат разбора комментария
+# action: exclude - внутренняя заметка, send - команда отправки,
+#         auto - автоматическая отправка по типу автора, skip - не отправлять
+Route = namedtuple('Route', ('action', 'command', 'text'))
+
+RULE_KEYS = ('send_commands', 'exclude_commands', 'auto_send_comments', 'auto_send_roles')
+
+# Горизонтальные пробелы на месте вырезанной команды
+BLANKS = ' \t'
+
+
+def normalize(text):
+    """NFKC нормализация: полноширинные и составные символы к обычному виду"""
+    if unicodedata.is_normalized('NFKC', text):
+        return text
+    return unicodedata.normalize('NFKC', text)
+
+
+def _trie_pattern(words):
+    """Регулярное выражение по префиксному дереву слов
+
+    В отличие от простого перечисления через |, на каждой позиции текста
+    проверяется не каждая команда, а только ветка дерева по очередному
+    символу, поэтому время разбора почти не зависит от числа команд.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def emit(node):
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            body = '(?:' + body + ')?'
+        return body
+
+    return emit(trie)
+
+
+class CommandRules:
+    """Скомпилированный набор правил"""
+
+    def __init__(self, send_commands=(), exclude_commands=(), auto_send_comments=False, auto_send_roles=()):
+        self.send_commands = self._prepare(send_commands)
+        self.exclude_commands = self._prepare(exclude_commands)
+        self.auto_send_comments = bool(auto_send_comments)
+        # Типы автора комментария (created_by.type в Podio), а не роли в рабочей области
+        self.auto_send_roles = frozenset(auto_send_roles)
+
+        groups = []
+        # exclude идет первым: команда из обоих списков считается исключающей
+        if self.exclude_commands:
+            groups.append(f"(?P<exclude>{_trie_pattern(self.exclude_commands)})")
+        if self.send_commands:
+            groups.append(f"(?P<send>{_trie_pattern(self.send_commands)})")
+        self.pattern = None
+        if groups:
+            # Быстрый отсев позиций по первому символу команды (обычно это @),
+            # затем проверка, что команда - отдельное слово: не часть e-mail
+            # и не начало более длинного слова
+            first = ''.join(sorted({command[0] for command in self.send_commands + self.exclude_commands}))
+            self.pattern = re.compile(
+                f"(?=[{re.escape(first)}])" + r'(?<![\w@])(?:' + '|'.join(groups) + r')(?!\w)', re.IGNORECASE
+            )
+
+    @staticmethod
+    def _prepare(commands):
+        return sorted({normalize(command).casefold() for command in commands if command and command.strip()})
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config.get('send_commands', ()),
+            config.get('exclude_commands', ()),
+            config.get('auto_send_comments', False),
+            config.get('auto_send_roles', ()),
+        )
+
+    def evaluate(self, text, author_type=None):
+        """Разбор комментария за один проход
+
+        author_type - created_by.type комментария Podio ('user', 'app' и т.д.).
+        """
+        text = normalize(text or '')
+
+        sends = []
+        if self.pattern:
+            for match in self.pattern.finditer(text):
+                if match.lastgroup == 'exclude':
+                    return Route('exclude', match.group().casefold(), None)
+                sends.append(match)
+
+        if sends:
+            parts = []
+            position = 0
+            for match in sends:
+                parts.append(text[position:match.start()])
+                position = match.end()
+            parts.append(text[position:])
+            stripped = ' '.join(part.strip(BLANKS) for part in parts if part.strip(BLANKS)).strip()
+            return Route('send', sends[0].group().casefold(), stripped or None)
+
+        if self.auto_send_comments and author_type in self.auto_send_roles:
+            return Route('auto', None, text.strip() or None)
+
+        return Route('skip', None, None)
+
+
+class CommandRouter:
+    """Текущие правила с перечитыванием файла правил при его изменении
+
+    Файл command_rules_file (JSON) содержит любые из ключей RULE_KEYS и
+    переопределяет значения из INTEGRATION_CONFIG. Изменение времени
+    модификации файла проверяется не чаще раза в check_interval секунд.
+    """
+
+    def __init__(self, config, rules_file=None, check_interval=5):
+        self.config = config
+        self.rules_file = rules_file
+        self.check_interval = check_interval
+        self._mtime = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self.rules = CommandRules.from_config(config)
+        self.reload()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config,
+            rules_file=config.get('command_rules_file'),
+            check_interval=config.get('command_rules_check', 5),
+        )
+
+    def reload(self):
+        """Перечитывание файла правил, если он изменился; True при обновлении"""
+        if not self.rules_file:
+            return False
+
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.stat(self.rules_file).st_mtime_ns
+            except OSError:
+                return False
+            if mtime == self._mtime:
+                return False
+
+            try:
+                with open(self.rules_file, encoding='utf-8') as f:
+                    overrides = json.load(f)
+                settings = {key: self.config[key] for key in RULE_KEYS if key in self.config}
+                settings.update({key: overrides[key] for key in RULE_KEYS if key in overrides})
+                rules = CommandRules.from_config(settings)
+            except Exception as e:
+                # Ошибка в файле не должна ломать отправку - остаются прежние правила
+                logger.error(f"❌ Ошибка загрузки правил команд {self.rules_file}: {e}")
+                self._mtime = mtime
+                return False
+
+            self._mtime = mtime
+            self.rules = rules
+            logger.info(
+                f"🔄 Правила команд обновлены: отправка {len(rules.send_commands)}, "
+                f"исключение {len(rules.exclude_commands)}"
+            )
+            return True
+
+    def evaluate(self, text, author_type=None):
+        """Разбор комментария по актуальным правилам"""
+        if self.rules_file and time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload()
+        return self.rules.evaluate(text, author_type)
@@ -18,18 +18,81 @@ PODIO_CONFIG = {
     
     # Рабочая область
     'space_url': 'shturm-j361z6sagw/chat',
+    
+    # Названия приложений: App ID со значением 'UNKNOWN' определяются по ним при запуске
+    'app_names': {
+        'messages_app_id': 'Wazz',
+        'contacts_app_id': 'Контакты',
+        'deals_app_id': 'Сделки',
+    },
+    
+    # Сделки для новых клиентов: контакт и сделка создаются в Podio один раз
+    'auto_create_deals': True,
+    # Поля элементов: название или external_id поля -> шаблон ({name}, {chat_id}, {chat_type}, {phone}, {username})
+    'contact_fields': {
+        'title': '{name}',
+        'phone': [{'type': 'mobile', 'value': '+{phone}'}],  # Без номера поле не передается
+    },
+    'deal_fields': {
+        'title': '{name} ({chat_type})',
+    },
+    'deal_contact_field': None,  # Поле сделки со ссылкой на контакт, например 'contact'
+    # Сверка: сделка, закрытая в Podio, получает статус closed, следующее сообщение откроет новую
+    'deal_status_field': None,  # Поле статуса сделки, например 'status'
+    'deal_closed_values': ['Закрыта', 'Выиграна', 'Проиграна'],
+    'deal_reconcile_interval': 900,  # Секунды
+    
+    # Кэш метаданных (области, приложения, поля)
+    'metadata_cache': '/home/ubuntu/podio_metadata.json',
+    'metadata_ttl': 86400,  # После этого срока записи проверяются через ETag
+    'metadata_concurrency': 8,  # Параллельных запросов при загрузке
+    
+    # HTTP соединения
+    'base_url': 'https://api.podio.com',
+    'pool_size': 10,  # Keep-alive соединений к api.podio.com
+    'connect_timeout': 5,  # Секунды
+    'read_timeout': 30,  # Секунды
+    'max_retries': 3,  # Повторов при 420/429/5xx
+    'token_refresh_margin': 300,  # Обновлять токен за столько секунд до истечения
+    
+    # Выключатель: при недоступном Podio задачи ждут в очереди, не тратя попыток
+    'breaker_failures': 5,  # Сбоев подряд до приостановки запросов (0 - выключатель отключен)
+    'breaker_reset': 30,  # Пауза до пробного запроса, секунды
+    'breaker_max_reset': 300,  # Пауза удваивается после неудачной пробы до этого значения
+    'replay_rate': 2.0,  # Задач в секунду при разборе накопленной очереди после восстановления
+    'replay_period': 300,  # Сколько секунд после восстановления действует это ограничение
 }
 
 # Wazzup API настройки
 WAZZUP_CONFIG = {
     'api_token': '1aab54ad811540da85bedbc685f938d6',
     'base_url': 'https://api.wazzup24.com/v3',
+    
+    # HTTP соединения
+    'pool_size': 10,  # Keep-alive соединений к api.wazzup24.com
+    'connect_timeout': 5,  # Секунды
+    'read_timeout': 15,  # Секунды
+    'max_retries': 3,  # Повторов при 429/5xx
+    
+    # Выключатель (см. PODIO_CONFIG)
+    'breaker_failures': 5,
+    'breaker_reset': 30,
+    'breaker_max_reset': 300,
+    'replay_rate': 5.0,
+    'replay_period': 300,
 }
 
 # Настройки интеграции
 INTEGRATION_CONFIG = {
     # Интервал опроса в секундах
-    'polling_interval': 120,  # 2 минуты
+    'polling_interval': 120,  # 2 минуты, когда переписки нет
+    'polling_min_interval': 15,  # Во время активной переписки
+    
+    # Podio hooks для мгновенной доставки ответов (None - только polling)
+    'podio_hook_url': None,  # Например 'https://your-server.com/webhook/podio?token=секрет'
+    'podio_hook_secret': '',  # Должен совпадать с token в podio_hook_url
+    'reconcile_interval': 900,  # Интервал сверяющего polling при включенных hooks
+    'hook_check_interval': 60,  # Проверка подтверждения hooks; до подтверждения работает обычный polling
     
     # Команды для отправки сообщений
     'send_commands': ['@send', '@отправить', '@wazzup', '@клиент'],
@@ -40,20 +103,103 @@ INTEGRATION_CONFIG = {
     # Автоматическая отправка комментариев (без команд)
     'auto_send_comments': True,
     
-    # Роли пользователей, чьи комментарии отправляются автоматически
-    'auto_send_roles': ['manager', 'admin', 'user'],
+    # Типы авторов, чьи комментарии отправляются автоматически: created_by.type комментария Podio
+    # ('user' - сотрудник, 'app' - приложение или интеграция), а не роли в рабочей области
+    'auto_send_roles': ['user'],
+    
+    # JSON файл с теми же ключами команд и ролей; изменения применяются без перезапуска
+    'command_rules_file': None,  # Например '/home/ubuntu/command_rules.json'
+    'command_rules_check': 5,  # Как часто проверять изменение файла, секунды
     
     # Максимальная длина сообщения
     'max_message_length': 4000,
     
+    # Отправка ответов клиентам
+    'delivery_workers': 8,  # Потоков отправки в Wazzup
+    'channel_rate': 1.0,  # Сообщений в секунду на канал Wazzup (0 - без ограничения)
+    'channel_burst': 5,  # Сообщений подряд без паузы
+    'delivery_max_attempts': 5,  # Попыток отправки до пометки failed
+    'delivery_retry_delay': 5,  # Начальная пауза перед повтором, секунды
+    
+    # Вложения клиентов (фото, голосовые) как файлы Podio
+    'media_relay': True,
+    'media_cache_dir': '/home/ubuntu/media_cache',  # Кэш файлов по хешу содержимого
+    'media_max_bytes': 25 * 1024 * 1024,  # Больше - в комментарии остается только ссылка
+    'media_concurrency': 2,  # Одновременных передач в процессе
+    'media_chunk_size': 64 * 1024,  # Размер блока при загрузке и выгрузке
+    'media_cache_days': 7,  # Сколько хранить файлы в кэше
+    
+    # Поиск по истории переписки (GET /search)
+    'search_token': '',  # Пустой - поиск выключен
+    'search_default_limit': 20,  # Результатов на странице по умолчанию
+    'search_max_limit': 100,
+    
+    # Очередь входящих webhooks
+    'queue_workers': 4,  # Количество потоков обработки
+    'queue_max_attempts': 5,  # Попыток до пометки задачи как failed
+    'queue_retry_delay': 5,  # Начальная пауза перед повтором, секунды
+    
+    # Объединение серии сообщений клиента в один комментарий Podio
+    'coalesce_window': 3,  # Пауза в переписке, после которой пачка уходит в Podio (0 - без объединения)
+    'coalesce_max_batch': 20,  # Максимум сообщений в одном комментарии
+    'coalesce_max_delay': 15,  # Максимальная задержка первого сообщения пачки, секунды
+    'coalesce_recover_window': 86400,  # За сколько секунд искать непереданные в Podio сообщения при запуске
+    
+    # Production сервер (serve.py)
+    'server_bind': '0.0.0.0:5000',
+    'server_workers': 4,  # Процессов gunicorn
+    'server_threads': 8,  # Потоков в процессе (worker_class 'gthread')
+    'server_worker_class': 'gthread',  # 'gevent' - асинхронный режим (pip install gevent)
+    'graceful_timeout': 30,  # Ожидание завершения текущих запросов и задач при остановке
+    'partitions': 4,  # Процессов обработки очередей в режиме serve.py partition
+    'leader_lease_ttl': 30,  # Срок аренды ведущего процесса фоновых задач, секунды
+    
+    # Метрики Prometheus на /metrics
+    'metrics_enabled': True,
+    'background_metrics_port': 9105,  # /metrics процесса serve.py background (None - не открывать)
+    
     # Логирование
     'log_level': 'INFO',
     'log_file': '/home/ubuntu/podio_wazzup_integration.log',
+    'log_format': 'text',  # 'json' - одна запись JSON в строке для сборщиков логов
+    'log_async': True,  # Запись в файл в фоновом потоке, запрос не ждет диска
+    'log_rotation': 'external',  # Ротацию выполняет logrotate; 'size' - по log_max_bytes (только один процесс)
+    'log_max_bytes': 10 * 1024 * 1024,
+    'log_backup_count': 5,
+    # Доля записываемых INFO событий горячего пути (1 - все, 0.1 - каждое десятое)
+    'log_sampling': {
+        'message.received': 0.1,
+        'message.processed': 0.1,
+        'message.saved': 0.1,
+        'podio_hook.received': 1,
+        'contact.created': 1,
+    },
 }
 
 # База данных для отслеживания обработанных сообщений
 DATABASE_CONFIG = {
     'db_path': '/home/ubuntu/integration_data.db',
+    'backend': 'sqlite',  # Или 'модуль:Класс' с интерфейсом storage.Storage; база общая для процессов одного хоста
     'backup_interval': 86400,  # 24 часа
     'cleanup_days': 30,  # Удалять записи старше 30 дней
+
+    # Параметры SQLite
+    'journal_mode': 'WAL',  # WAL позволяет читать во время записи
+    'synchronous': 'NORMAL',  # NORMAL в WAL режиме: fsync только при checkpoint
+    'busy_timeout': 5000,  # Ожидание блокировки, мс
+    'auto_vacuum': 'INCREMENTAL',  # Только для новой базы; старой нужен разовый VACUUM
+    
+    # Обслуживание базы
+    'cleanup_interval': 3600,  # Как часто удалять старые записи, секунды
+    'cleanup_chunk': 500,  # Записей за одну короткую транзакцию
+    'archive_dir': '/home/ubuntu/archive',  # Архив удаленных сообщений (None - без архива)
+    'backup_dir': '/home/ubuntu/backups',  # Резервные копии (None - отключены)
+    'backup_keep': 7,  # Сколько копий хранить
+    
+    # Кэш контактов в памяти
+    'contact_cache_size': 10000,  # Максимум контактов в кэше
+    'contact_cache_ttl': 3600,  # Время жизни записи, секунды
+    
+    # Повторная доставка webhooks Wazzup
+    'dedup_capacity': 50000,  # Последних messageId в памяти для отсева повторов без запроса к базе
 }
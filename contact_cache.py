@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кэш контактов в памяти
+- (chat_id, chat_type) -> ID контакта, ID контакта в Podio и элемент активной сделки
+- Ограничение по размеру (LRU) и времени жизни записей
+- Общий для потоков Flask, обработчиков очереди и polling
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class ContactCache:
+    """LRU кэш контактов с ограничением времени жизни"""
+
+    def __init__(self, max_size=10000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._by_contact = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key):
+        """Поиск живой записи (вызывается под блокировкой)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl and time.monotonic() - entry['cached_at'] > self.ttl:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key):
+        """Удаление записи (вызывается под блокировкой)"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._by_contact.pop(entry['contact_id'], None)
+
+    def get(self, chat_id, chat_type):
+        """Запись контакта по чату или None"""
+        with self._lock:
+            entry = self._lookup((chat_id, chat_type))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(entry)
+
+    def contains(self, chat_id, chat_type):
+        """Есть ли живая запись чата (без учета в счетчиках)"""
+        with self._lock:
+            return self._lookup((chat_id, chat_type)) is not None
+
+    def get_by_contact(self, contact_id):
+        """Запись по ID контакта или None"""
+        with self._lock:
+            key = self._by_contact.get(contact_id)
+            entry = self._lookup(key) if key is not None else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(entry)
+
+    def put(self, chat_id, chat_type, contact_id, podio_contact_id=None, deal_item_id=None):
+        """Добавление или обновление записи"""
+        key = (chat_id, chat_type)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = {
+                'contact_id': contact_id,
+                'chat_id': chat_id,
+                'chat_type': chat_type,
+                'podio_contact_id': podio_contact_id,
+                'deal_item_id': deal_item_id,
+                'cached_at': time.monotonic(),
+            }
+            self._by_contact[contact_id] = key
+            while len(self._entries) > self.max_size:
+                _, oldest = self._entries.popitem(last=False)
+                self._by_contact.pop(oldest['contact_id'], None)
+                self.evictions += 1
+
+    def invalidate(self, chat_id, chat_type):
+        """Сброс записи чата после изменения в базе"""
+        with self._lock:
+            self._remove((chat_id, chat_type))
+
+    def invalidate_contact(self, contact_id):
+        """Сброс записи по ID контакта после изменения в базе"""
+        with self._lock:
+            key = self._by_contact.get(contact_id)
+            if key is not None:
+                self._remove(key)
+
+    def clear(self):
+        """Полная очистка"""
+        with self._lock:
+            self._entries.clear()
+            self._by_contact.clear()
+
+    def stats(self):
+        """Счетчики попаданий и промахов для подбора размера"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сделки Podio для переписки с клиентами
+- Активная сделка контакта ищется в локальном индексе (кэш контактов и таблица deals)
+- Контакт и сделка создаются в Podio один раз, все поля одним запросом
+- Сделки, закрытые в интерфейсе Podio, находятся периодической сверкой
+"""
+
+import time
+import logging
+import threading
+
+from metrics import REGISTRY
+from podio_sync import podio_now
+
+logger = logging.getLogger(__name__)
+
+DEALS_RESOLVED = REGISTRY.counter('deals_resolved', 'Поиск сделки для сообщений клиента', ('result',))
+
+
+class DealResolver:
+    """Поиск или создание сделки контакта и сверка статусов с Podio"""
+
+    def __init__(self, podio, tracker, config, cursors, page_size=100):
+        self.podio = podio
+        self.tracker = tracker
+        self.storage = tracker.storage
+        # PODIO_CONFIG: App ID заполняются при запуске, поэтому читаются при каждом вызове
+        self.config = config
+        self.cursors = cursors
+        self.page_size = page_size
+        # В режиме разделов сверку выполняет только ведущий процесс, и кэш контактов
+        # остальных процессов о закрытии сделки не знает: сделка из кэша проверяется по базе
+        self.verify_cached = False
+        self._reconciled_at = 0
+        self._stats_lock = threading.Lock()
+        self.counters = {'local': 0, 'created': 0, 'recovered': 0, 'closed': 0, 'reopened': 0}
+
+    def _app_id(self, key):
+        app_id = self.config.get(key)
+        return app_id if app_id and app_id != 'UNKNOWN' else None
+
+    def _count(self, result, amount=1):
+        DEALS_RESOLVED.inc(amount, result=result)
+        with self._stats_lock:
+            self.counters[result] += amount
+
+    def resolve(self, contact_id):
+        """ID элемента сделки Podio для контакта
+
+        Возвращает None, если создание сделок выключено или приложение
+        сделок неизвестно; ошибка Podio - исключение (задача будет повторена).
+        """
+        item_id = self.tracker.get_active_deal_item(contact_id)
+        if item_id and self.verify_cached and not self._deal_active(contact_id, item_id):
+            self.tracker.invalidate_contact(contact_id)
+            item_id = self.tracker.get_active_deal_item(contact_id)
+        if item_id:
+            self._count('local')
+            return item_id
+
+        deals_app_id = self._app_id('deals_app_id')
+        if not self.config.get('auto_create_deals', True) or not deals_app_id:
+            return None
+
+        contact = self._contact(contact_id)
+        if contact is None:
+            raise RuntimeError(f"контакт {contact_id} не найден")
+
+        # Незавершенная попытка создания: элемент мог быть создан, а ответ потерян
+        row = self.storage.execute(
+            "SELECT id FROM deals WHERE contact_id = ? AND status = 'creating' ORDER BY id DESC LIMIT 1",
+            (contact_id,)
+        ).fetchone()
+        retry = row is not None
+        if retry:
+            deal_id = row[0]
+        else:
+            with self.storage.transaction() as cursor:
+                cursor.execute("INSERT INTO deals (contact_id, status) VALUES (?, 'creating')", (contact_id,))
+                deal_id = cursor.lastrowid
+
+        values = self._values(contact)
+        contact_item_id = self._podio_contact(contact, values, retry)
+        fields = self._fields('deal_fields', values)
+        if contact_item_id and self.config.get('deal_contact_field'):
+            fields[self.config['deal_contact_field']] = [int(contact_item_id)]
+
+        item = self._find_or_create(deals_app_id, f"wazzup_deal_{contact_id}_{deal_id}", fields, retry)
+        item_id = str(item['item_id'])
+        with self.storage.transaction() as cursor:
+            cursor.execute(
+                "UPDATE deals SET podio_item_id = ?, status = 'active', updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (item_id, deal_id)
+            )
+        self.tracker.invalidate_contact(contact_id)
+        logger.info(f"🤝 Создана сделка {item_id} для контакта {contact_id}")
+        return item_id
+
+    def _deal_active(self, contact_id, item_id):
+        """Активна ли сделка item_id контакта по данным базы"""
+        row = self.storage.execute(
+            "SELECT 1 FROM deals WHERE contact_id = ? AND status = 'active' AND podio_item_id = ? LIMIT 1",
+            (contact_id, str(item_id))
+        ).fetchone()
+        return row is not None
+
+    def _contact(self, contact_id):
+        row = self.storage.execute(
+            "SELECT chat_id, chat_type, name, phone, username, podio_contact_id FROM contacts WHERE id = ?",
+            (contact_id,)
+        ).fetchone()
+        if not row:
+            return None
+        chat_id, chat_type, name, phone, username, podio_contact_id = row
+        return {
+            'id': contact_id,
+            'chat_id': chat_id,
+            'chat_type': chat_type,
+            'name': name,
+            'phone': phone or (chat_id if chat_type == 'whatsapp' else ''),
+            'username': username or '',
+            'podio_contact_id': podio_contact_id,
+        }
+
+    @staticmethod
+    def _values(contact):
+        """Значения для шаблонов полей"""
+        return {
+            'name': contact['name'] or contact['chat_id'],
+            'chat_id': contact['chat_id'],
+            'chat_type': contact['chat_type'],
+            'phone': contact['phone'],
+            'username': contact['username'],
+        }
+
+    def _fields(self, key, values):
+        """Поля элемента по шаблонам конфигурации
+
+        Шаблон - строка с {name}, {chat_id}, {chat_type}, {phone}, {username}
+        или список/словарь таких строк (например, значение поля телефона).
+        Поле с пустой подстановкой не передается.
+        """
+        def render(template):
+            if isinstance(template, str):
+                text = template.format(**values)
+                if template and not text.strip('+ '):
+                    raise ValueError
+                return text
+            if isinstance(template, list):
+                return [render(value) for value in template]
+            if isinstance(template, dict):
+                return {name: render(value) for name, value in template.items()}
+            return template
+
+        fields = {}
+        for field, template in self.config.get(key, {}).items():
+            try:
+                fields[field] = render(template)
+            except ValueError:
+                continue
+        return fields
+
+    def _podio_contact(self, contact, values, retry):
+        """ID элемента контакта в Podio (создается один раз) или None без приложения контактов"""
+        if contact['podio_contact_id']:
+            return contact['podio_contact_id']
+        contacts_app_id = self._app_id('contacts_app_id')
+        if not contacts_app_id:
+            return None
+
+        item = self._find_or_create(contacts_app_id, f"wazzup_contact_{contact['id']}",
+                                    self._fields('contact_fields', values), retry)
+        item_id = str(item['item_id'])
+        with self.storage.transaction() as cursor:
+            cursor.execute(
+                "UPDATE contacts SET podio_contact_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (item_id, contact['id'])
+            )
+        return item_id
+
+    def _find_or_create(self, app_id, external_id, fields, retry):
+        """Элемент по external_id (после прерванной попытки) или новый элемент"""
+        if retry:
+            found = self.podio.get_item_by_external_id(app_id, external_id)
+            if found is None:
+                raise RuntimeError(f"не удалось проверить элемент {external_id} в Podio")
+            if found:
+                self._count('recovered')
+                return found
+
+        item = self.podio.create_item(app_id, fields, external_id=external_id)
+        if not item:
+            raise RuntimeError(f"не удалось создать элемент {external_id} в Podio")
+        self._count('created')
+        return item
+
+    def _item_closed(self, item):
+        """Закрыта ли сделка по значению поля статуса (категория или текст)"""
+        field_key = self.config.get('deal_status_field')
+        closed_values = {value.casefold() for value in self.config.get('deal_closed_values', [])}
+        for field in item.get('fields', []):
+            if field_key not in (field.get('external_id'), field.get('label')):
+                continue
+            for entry in field.get('values', []):
+                value = entry.get('value')
+                text = value.get('text') if isinstance(value, dict) else value
+                if str(text).casefold() in closed_values:
+                    return True
+        return False
+
+    def reconcile(self, force=False):
+        """Сверка активных сделок с Podio (не чаще deal_reconcile_interval)
+
+        Читаются только элементы приложения сделок, изменившиеся после
+        курсора. Закрытая в Podio сделка помечается closed: следующее
+        сообщение клиента откроет новую. Возвращает число изменений.
+        """
+        deals_app_id = self._app_id('deals_app_id')
+        if not deals_app_id or not self.config.get('deal_status_field'):
+            return 0
+        if not force and time.monotonic() - self._reconciled_at < self.config.get('deal_reconcile_interval', 900):
+            return 0
+        self._reconciled_at = time.monotonic()
+
+        cursor_key = f"deals:{deals_app_id}"
+        since = self.cursors.get_cursor(cursor_key)
+        if since is None:
+            self.cursors.set_cursor(cursor_key, podio_now())
+            return 0
+
+        newest = since
+        closed, reopened = [], []
+        offset = 0
+        while True:
+            page = self.podio.filter_items(
+                deals_app_id, filters={'last_event_on': {'from': since}}, limit=self.page_size, offset=offset
+            )
+            if page is None:
+                # Курсор не двигаем, элементы будут перечитаны при следующей сверке
+                return 0
+            items = page.get('items', [])
+            for item in items:
+                (closed if self._item_closed(item) else reopened).append(str(item['item_id']))
+                newest = max(newest, item.get('last_event_on') or newest)
+            if len(items) < self.page_size:
+                break
+            offset += self.page_size
+
+        changed = self._set_status(closed, 'active', 'closed') + self._set_status(reopened, 'closed', 'active')
+        if newest != since:
+            self.cursors.set_cursor(cursor_key, newest)
+        return changed
+
+    def _set_status(self, item_ids, old, new):
+        """Смена статуса локальных сделок по элементам Podio"""
+        if not item_ids:
+            return 0
+        placeholders = ', '.join('?' for _ in item_ids)
+        with self.storage.transaction() as cursor:
+            contacts = [row[0] for row in cursor.execute(
+                f"SELECT contact_id FROM deals WHERE status = ? AND podio_item_id IN ({placeholders})",
+                (old, *item_ids)
+            )]
+            cursor.execute(
+                f"UPDATE deals SET status = ?, updated_at = CURRENT_TIMESTAMP "
+                f"WHERE status = ? AND podio_item_id IN ({placeholders})",
+                (new, old, *item_ids)
+            )
+        for contact_id in contacts:
+            self.tracker.invalidate_contact(contact_id)
+        if contacts:
+            self._count('closed' if new == 'closed' else 'reopened', len(contacts))
+            logger.info(f"🔄 Сделок {'закрыто' if new == 'closed' else 'открыто снова'} по данным Podio: {len(contacts)}")
+        return len(contacts)
+
+    def stats(self):
+        """Счетчики поиска и сверки сделок"""
+        with self._stats_lock:
+            return dict(self.counters)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Фильтр повторных webhooks Wazzup
+- Ограниченный набор недавно сохраненных messageId в памяти
+- Проверка без обращения к SQLite; при промахе дубль отсекает уникальный индекс
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class RecentIds:
+    """Последние capacity идентификаторов, старые вытесняются первыми"""
+
+    def __init__(self, capacity=50000):
+        self.capacity = capacity
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, item_id):
+        with self._lock:
+            return item_id in self._ids
+
+    def add_many(self, item_ids):
+        """Запоминание идентификаторов (после успешной записи в базу)"""
+        if not self.capacity:
+            return
+        with self._lock:
+            for item_id in item_ids:
+                if item_id is None:
+                    continue
+                self._ids[item_id] = None
+                self._ids.move_to_end(item_id)
+            while len(self._ids) > self.capacity:
+                self._ids.popitem(last=False)
+
+    def split(self, items, key):
+        """Разделение элементов на (новые, повторные) по key(item)"""
+        fresh, repeated = [], []
+        with self._lock:
+            for item in items:
+                if key(item) in self._ids:
+                    repeated.append(item)
+                else:
+                    fresh.append(item)
+            self.hits += len(repeated)
+            self.misses += len(fresh)
+        return fresh, repeated
+
+    def stats(self):
+        """Статистика фильтра"""
+        with self._lock:
+            return {
+                'size': len(self._ids),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
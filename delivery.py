@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Конвейер исходящих сообщений в Wazzup
+- Пул обработчиков на отдельной очереди, порядок сохраняется внутри чата
+- Ограничение частоты отправки для каждого канала (token bucket)
+- Длинные тексты делятся по границам предложений
+- Ключ идемпотентности (crmMessageId) не дает повторам отправить сообщение дважды
+- Статус каждого сообщения хранится в таблице outbound_messages
+"""
+
+import re
+import time
+import logging
+import threading
+from work_queue import WorkQueue, WorkerPool, RetryLater
+
+logger = logging.getLogger(__name__)
+
+# Граница предложения или абзаца
+SENTENCE_BREAK = re.compile(r'(?<=[.!?…])\s+|\n+')
+WORD_BREAK = re.compile(r'\s+')
+
+
+def split_message(text, max_length):
+    """Деление текста на части не длиннее max_length
+
+    Сначала ищется граница предложения во второй половине допустимого
+    отрезка, затем пробел; слово длиннее max_length режется как есть.
+    """
+    text = text.strip()
+    if not max_length or len(text) <= max_length:
+        return [text]
+
+    parts = []
+    while len(text) > max_length:
+        window = text[:max_length + 1]
+        cut = None
+        for pattern in (SENTENCE_BREAK, WORD_BREAK):
+            breaks = [m for m in pattern.finditer(window) if m.start() >= max_length // 2]
+            if breaks:
+                cut = breaks[-1]
+                break
+
+        if cut:
+            parts.append(text[:cut.start()].rstrip())
+            text = text[cut.end():].lstrip()
+        else:
+            parts.append(text[:max_length])
+            text = text[max_length:].lstrip()
+
+    if text:
+        parts.append(text)
+    return parts
+
+
+class TokenBucket:
+    """Ограничение частоты: rate токенов в секунду, не больше burst подряд"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Взять токен; возвращает 0 или время до появления токена, секунды"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class ChannelRateLimiter:
+    """Отдельный token bucket для каждого канала Wazzup"""
+
+    def __init__(self, rate=1.0, burst=5):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, channel_id):
+        """Время ожидания для канала (0 - можно отправлять)"""
+        if not self.rate:
+            return 0
+        with self._lock:
+            bucket = self._buckets.get(channel_id)
+            if bucket is None:
+                bucket = self._buckets[channel_id] = TokenBucket(self.rate, self.burst)
+        return bucket.try_acquire()
+
+
+class OutboundDelivery:
+    """Очередь исходящих сообщений и пул их отправки"""
+
+    def __init__(self, storage, wazzup, workers=8, max_length=4000, rate=1.0, burst=5,
+                 max_attempts=5, retry_delay=5):
+        self.storage = storage
+        self.wazzup = wazzup
+        self.max_length = max_length
+        self.limiter = ChannelRateLimiter(rate, burst)
+        self.queue = WorkQueue(storage, table='outbound_queue', max_attempts=max_attempts, retry_delay=retry_delay)
+        self.pool = WorkerPool(self.queue, workers=workers, poll_interval=0.5, name='outbound')
+        # Пока Wazzup недоступен, ответы ждут в очереди
+        self.pool.register('send', self.send, breaker=wazzup.http.breaker)
+
+    @classmethod
+    def from_config(cls, storage, wazzup, config):
+        """Создание конвейера по словарю INTEGRATION_CONFIG"""
+        return cls(
+            storage,
+            wazzup,
+            workers=config.get('delivery_workers', 8),
+            max_length=config.get('max_message_length', 4000),
+            rate=config.get('channel_rate', 1.0),
+            burst=config.get('channel_burst', 5),
+            max_attempts=config.get('delivery_max_attempts', 5),
+            retry_delay=config.get('delivery_retry_delay', 5),
+        )
+
+    def start(self):
+        """Запуск потоков отправки"""
+        self.pool.start()
+
+    def stop(self, timeout=10):
+        """Остановка после отправки текущих сообщений"""
+        self.pool.stop(timeout)
+
+    def enqueue(self, channel_id, chat_id, chat_type, text, key, source=None):
+        """Постановка текста в очередь отправки
+
+        key - ключ идемпотентности (например, ID комментария Podio): повторная
+        постановка с тем же ключом ничего не добавляет. Возвращает число
+        новых частей сообщения.
+        """
+        parts = split_message(text, self.max_length)
+        partition = f"chat:{chat_type}:{chat_id}"
+        tasks = []
+        with self.storage.transaction() as cursor:
+            for number, part in enumerate(parts, 1):
+                cursor.execute('''
+                    INSERT INTO outbound_messages
+                    (idempotency_key, source, channel_id, chat_id, chat_type, part, parts, text)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(idempotency_key) DO NOTHING
+                ''', (f"{key}:{number}", source, channel_id, chat_id, chat_type, number, len(parts), part))
+                if cursor.rowcount:
+                    tasks.append(('send', {'id': cursor.lastrowid}, partition))
+
+            # Задачи пишутся в той же транзакции, что и сообщения
+            if tasks:
+                self.queue.put_many(tasks)
+
+        if tasks:
+            self.pool.notify()
+        return len(tasks)
+
+    def send(self, payload):
+        """Отправка одной части сообщения (обработчик очереди)"""
+        row = self.storage.execute('''
+            SELECT idempotency_key, channel_id, chat_id, chat_type, text, status
+            FROM outbound_messages WHERE id = ?
+        ''', (payload['id'],)).fetchone()
+        if not row:
+            logger.warning(f"⚠️ Исходящее сообщение {payload['id']} не найдено")
+            return
+        key, channel_id, chat_id, chat_type, text, status = row
+        if status == 'sent':
+            return
+
+        wait = self.limiter.try_acquire(channel_id)
+        if wait:
+            raise RetryLater(wait, f"лимит канала {channel_id}")
+
+        self._update(payload['id'], "status = 'sending', attempts = attempts + 1")
+        result = self.wazzup.send_message(channel_id, chat_id, text, chat_type, crm_message_id=key)
+        if not result:
+            self._update(payload['id'], "status = 'failed', error = ?", ('ошибка отправки в Wazzup',))
+            raise RuntimeError(f"не удалось отправить сообщение {key}")
+
+        self._update(
+            payload['id'],
+            "status = 'sent', error = NULL, wazzup_message_id = COALESCE(?, wazzup_message_id), sent_at = CURRENT_TIMESTAMP",
+            (result.get('messageId'),)
+        )
+        logger.info(f"📤 Сообщение {key} отправлено в {chat_type} чат {chat_id}")
+
+    def _update(self, message_id, assignments, params=()):
+        """Изменение статуса исходящего сообщения"""
+        with self.storage.transaction() as cursor:
+            cursor.execute(f"UPDATE outbound_messages SET {assignments} WHERE id = ?", (*params, message_id))
+
+    def stats(self):
+        """Статистика очереди отправки и статусов сообщений"""
+        stats = self.pool.stats()
+        rows = self.storage.execute("SELECT status, COUNT(*) FROM outbound_messages GROUP BY status").fetchall()
+        stats['messages'] = dict(rows)
+        return stats
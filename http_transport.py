@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP транспорт для внешних API (Podio, Wazzup)
+- Пул keep-alive соединений на каждый хост
+- Явные таймауты на подключение и чтение
+- Повторы с джиттером на 429/5xx с учетом Retry-After и лимитов Podio
+- Выключатель (circuit breaker): при недоступном API запросы сразу завершаются ошибкой
+"""
+
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from circuit_breaker import CircuitBreaker
+from metrics import UPSTREAM_REQUEST_SECONDS, UPSTREAM_RETRIES, endpoint_label
+
+logger = logging.getLogger(__name__)
+
+# Podio отвечает 420 при превышении лимита запросов
+RETRY_STATUSES = (420, 429, 500, 502, 503, 504)
+
+# Методы, которые безопасно повторять после таймаута чтения или обрыва соединения
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+def failed_before_connect(error):
+    """Ошибка возникла до установления соединения, запрос точно не отправлен"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    # requests оборачивает ошибку urllib3: MaxRetryError(reason=NewConnectionError)
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, NewConnectionError)
+
+
+def parse_retry_after(value):
+    """Разбор заголовка Retry-After (секунды или HTTP-дата)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpTransport:
+    """Общий HTTP клиент с пулом соединений и политикой повторов"""
+
+    def __init__(self, name, base_url, pool_size=10, connect_timeout=5, read_timeout=30,
+                 max_retries=3, backoff_factor=0.5, max_backoff=30, max_retry_after=60, breaker=None):
+        self.name = name
+        self.breaker = breaker
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+
+        # Лимиты, которые сообщает сервер (X-Rate-Limit-*)
+        self.rate_limit = {'limit': None, 'remaining': None}
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount(self.base_url, adapter)
+
+    @classmethod
+    def from_config(cls, name, config, default_base_url):
+        """Создание транспорта по словарю конфигурации API"""
+        return cls(
+            name,
+            config.get('base_url', default_base_url),
+            pool_size=config.get('pool_size', 10),
+            connect_timeout=config.get('connect_timeout', 5),
+            read_timeout=config.get('read_timeout', 30),
+            max_retries=config.get('max_retries', 3),
+            breaker=CircuitBreaker.from_config(name, config),
+        )
+
+    def url(self, path):
+        """Полный URL для пути API"""
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _backoff(self, attempt):
+        """Пауза перед повтором: экспонента с полным джиттером"""
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+    def _update_rate_limit(self, response):
+        """Запоминание лимитов запросов из заголовков ответа"""
+        limit = response.headers.get('X-Rate-Limit-Limit')
+        remaining = response.headers.get('X-Rate-Limit-Remaining')
+        if remaining is None:
+            return
+        with self._lock:
+            self.rate_limit = {
+                'limit': int(limit) if limit and limit.isdigit() else None,
+                'remaining': int(remaining) if remaining.isdigit() else None,
+            }
+        if self.rate_limit['remaining'] == 0:
+            logger.warning(f"⚠️ {self.name}: лимит запросов исчерпан")
+
+    def _retry_delay(self, response, attempt):
+        """Пауза перед повтором ответа с ошибкой или None, если повторять не нужно"""
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_retry_after else None
+
+        # Часовой лимит Podio исчерпан: повтор через секунды не поможет
+        if response.status_code in (420, 429) and self.rate_limit['remaining'] == 0:
+            return None
+
+        return self._backoff(attempt)
+
+    def request(self, method, path, **kwargs):
+        """Запрос с повторами
+
+        Возвращает последний полученный ответ; исключение пробрасывается,
+        если ответа так и не было. При открытом выключателе сразу
+        выбрасывается CircuitOpen.
+        """
+        method = method.upper()
+        url = self.url(path)
+        kwargs.setdefault('timeout', self.timeout)
+
+        if self.breaker:
+            self.breaker.before_request()
+
+        start = time.perf_counter()
+        status = 'error'
+        # Сбоем API считаются ошибки соединения, таймауты и 5xx после всех повторов
+        failed = True
+        try:
+            response = self._request_with_retries(method, url, **kwargs)
+            status = response.status_code
+            failed = status >= 500
+            return response
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            raise
+        except Exception:
+            failed = None
+            raise
+        finally:
+            if self.breaker:
+                self.breaker.record(failed)
+            UPSTREAM_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                upstream=self.name, method=method, endpoint=endpoint_label(urlsplit(url).path), status=status
+            )
+
+    def _request_with_retries(self, method, url, **kwargs):
+        """Цикл попыток запроса"""
+        attempt = 0
+        body = kwargs.get('data')
+        while True:
+            # Потоковое тело (файл) перед каждой попыткой читается с начала
+            if hasattr(body, 'seek'):
+                body.seek(0)
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # Запрос мог дойти до сервера, повторяем только безопасные методы
+                retryable = method in IDEMPOTENT_METHODS or failed_before_connect(e)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                UPSTREAM_RETRIES.inc(upstream=self.name, reason=type(e).__name__)
+                logger.warning(f"⚠️ {self.name}: {method} {url} - {e}, повтор через {delay:.1f} с")
+            else:
+                self._update_rate_limit(response)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = self._retry_delay(response, attempt)
+                if delay is None:
+                    return response
+                UPSTREAM_RETRIES.inc(upstream=self.name, reason=response.status_code)
+                logger.warning(
+                    f"⚠️ {self.name}: {method} {url} - {response.status_code}, повтор через {delay:.1f} с"
+                )
+
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request('PATCH', path, **kwargs)
+
+    def close(self):
+        """Закрытие пула соединений"""
+        self.session.close()
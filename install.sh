@@ -25,7 +25,7 @@ python3 -m venv venv
 source venv/bin/activate
 
 # Установка Python пакетов
-pip install flask requests
+pip install flask requests gunicorn
 
 # Создание конфигурации Nginx
 echo "🌐 Настройка Nginx..."
@@ -60,16 +60,31 @@ systemctl enable nginx
 echo "🔄 Настройка автозапуска..."
 cat > /etc/supervisor/conf.d/podio-wazzup.conf << 'EOF'
 [program:podio-wazzup-integration]
-command=/opt/podio-wazzup-integration/venv/bin/python /opt/podio-wazzup-integration/hybrid_integration.py
+command=/opt/podio-wazzup-integration/venv/bin/python /opt/podio-wazzup-integration/serve.py all
 directory=/opt/podio-wazzup-integration
 user=root
 autostart=true
 autorestart=true
+stopsignal=TERM
+stopwaitsecs=40
 redirect_stderr=true
 stdout_logfile=/var/log/podio-wazzup-integration.log
 environment=PYTHONPATH="/opt/podio-wazzup-integration"
 EOF
 
+# Ротация журнала: в него пишут несколько процессов, поэтому файл ротирует logrotate
+cat > /etc/logrotate.d/podio-wazzup << 'EOF'
+/var/log/podio-wazzup-integration.log {
+    daily
+    rotate 7
+    compress
+    delaycompress
+    missingok
+    notifempty
+    copytruncate
+}
+EOF
+
 # Создание базовых файлов конфигурации
 echo "⚙️ Создание базовой конфигурации..."
 cat > /opt/podio-wazzup-integration/integration_config.py << 'EOF'
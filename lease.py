@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Выбор ведущего процесса через аренду в SQLite
+- Фоновые задачи (polling, очереди, обслуживание) выполняет только один процесс
+- Аренда продлевается, пока процесс жив; после падения ее забирает другой
+"""
+
+import os
+import time
+import socket
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """Аренда с ограниченным сроком в таблице leases"""
+
+    def __init__(self, storage, name, ttl=30, holder=None):
+        self.storage = storage
+        self.name = name
+        self.ttl = ttl
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}"
+        self.expires_at = 0.0
+
+    def acquire(self):
+        """Получение или продление аренды, возвращает True для ведущего"""
+        now = time.time()
+        try:
+            with self.storage.transaction() as cursor:
+                cursor.execute('''
+                    INSERT INTO leases (name, holder, expires_at, acquired_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET
+                        holder = excluded.holder,
+                        expires_at = excluded.expires_at,
+                        acquired_at = CASE WHEN leases.holder = excluded.holder
+                                           THEN leases.acquired_at ELSE excluded.acquired_at END
+                    WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+                ''', (self.name, self.holder, now + self.ttl, now, now))
+                acquired = cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"❌ Ошибка продления аренды {self.name}: {e}")
+            # Пока срок не истек, аренда остается за нами
+            return now < self.expires_at
+
+        self.expires_at = now + self.ttl if acquired else 0.0
+        return acquired
+
+    def release(self):
+        """Освобождение аренды, чтобы другой процесс забрал ее сразу"""
+        try:
+            with self.storage.transaction() as cursor:
+                cursor.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder))
+        except Exception as e:
+            logger.error(f"❌ Ошибка освобождения аренды {self.name}: {e}")
+        self.expires_at = 0.0
+
+    def current_holder(self):
+        """Текущий держатель аренды или None"""
+        row = self.storage.execute(
+            "SELECT holder FROM leases WHERE name = ? AND expires_at >= ?", (self.name, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+
+class LeaderElection:
+    """Поток, который запускает роль при получении аренды и останавливает при потере"""
+
+    def __init__(self, lease, on_elected, on_demoted, interval=None):
+        self.lease = lease
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.interval = interval or max(1, lease.ttl / 3)
+        self.leader = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запуск выборов в фоновом потоке"""
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name=f"lease-{self.lease.name}", daemon=True)
+        self._thread.start()
+
+    def run(self):
+        """Цикл продления аренды до вызова stop()"""
+        try:
+            self._run()
+        finally:
+            self.lease.storage.release()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.lease.acquire():
+                if not self.leader:
+                    logger.info(f"👑 Процесс {self.lease.holder} стал ведущим ({self.lease.name})")
+                    self.leader = True
+                    if self.on_elected() is False:
+                        # Роль не запустилась, отдаем аренду другому процессу
+                        self._demote()
+                        self.lease.release()
+            elif self.leader:
+                logger.warning(f"⚠️ Процесс {self.lease.holder} потерял аренду ({self.lease.name})")
+                self._demote()
+
+            self._stop.wait(self.interval)
+
+        if self.leader:
+            self._demote()
+            self.lease.release()
+
+    def _demote(self):
+        """Остановка роли ведущего"""
+        self.leader = False
+        try:
+            self.on_demoted()
+        except Exception as e:
+            logger.error(f"❌ Ошибка остановки роли {self.lease.name}: {e}")
+
+    def stop(self, timeout=60):
+        """Остановка роли и освобождение аренды"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Настройка логирования интеграции
+- Запись в очередь в потоке запроса, вывод в отдельном фоновом потоке
+- Файл log_file: по умолчанию ротацию выполняет logrotate (log_rotation 'external'),
+  'size' - ротация по размеру, только когда в файл пишет один процесс
+- Текстовый или JSON формат
+- Выборочная запись частых INFO событий
+"""
+
+import sys
+import json
+import queue
+import atexit
+import logging
+import itertools
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, WatchedFileHandler
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - один JSON объект в строке"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        event = getattr(record, 'event', None)
+        if event:
+            entry['event'] = event
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропуск части записей частых событий
+
+    Событие задается через extra={'event': ...}; для события с долей 0.1
+    записывается каждая десятая запись. WARNING и выше пишутся всегда.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = {event: rate for event, rate in rates.items() if rate < 1}
+        self._counters = {event: itertools.count() for event in self.rates}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        if event not in self.rates or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates[event]
+        if rate <= 0:
+            return False
+        with self._lock:
+            number = next(self._counters[event])
+        return number % max(1, round(1 / rate)) == 0
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке
+
+    Стандартный prepare() собирает текст сообщения сразу; здесь запись
+    уходит в очередь как есть и форматируется фоновым потоком.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(config):
+    """Настройка корневого логгера по INTEGRATION_CONFIG
+
+    Повторный вызов заменяет ранее установленные обработчики.
+    """
+    global _listener
+
+    level = getattr(logging, config.get('log_level', 'INFO'))
+    if config.get('log_format', 'text') == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+
+    handlers = [logging.StreamHandler(sys.stderr)]
+    log_file = config.get('log_file')
+    if log_file:
+        try:
+            if config.get('log_rotation', 'external') == 'external':
+                # Ротацию выполняет logrotate; в файл пишут несколько процессов (gunicorn, разделы)
+                handlers.append(WatchedFileHandler(log_file, encoding='utf-8'))
+            else:
+                # Ротация по размеру безопасна, только если в файл пишет один процесс
+                handlers.append(RotatingFileHandler(
+                    log_file,
+                    maxBytes=config.get('log_max_bytes', 10 * 1024 * 1024),
+                    backupCount=config.get('log_backup_count', 5),
+                    encoding='utf-8',
+                ))
+        except OSError as e:
+            sys.stderr.write(f"⚠️ Не удалось открыть файл журнала {log_file}: {e}\n")
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    if _listener:
+        _listener.stop()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    if config.get('log_async', True):
+        log_queue = queue.SimpleQueue()
+        queue_handler = DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(config.get('log_sampling', {})))
+        root.addHandler(queue_handler)
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+    else:
+        sampling = SamplingFilter(config.get('log_sampling', {}))
+        for handler in handlers:
+            handler.addFilter(sampling)
+            root.addHandler(handler)
+        _listener = None
+
+    root.setLevel(level)
+    # Журнал каждого запроса от werkzeug на горячем пути не нужен
+    logging.getLogger('werkzeug').setLevel(max(level, logging.WARNING))
+
+
+def flush_logging():
+    """Запись оставшихся в очереди сообщений (при остановке процесса)"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(flush_logging)
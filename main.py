@@ -6,317 +6,329 @@
 - Polling для обработки комментариев Podio и отправки ответов
 """
 
-from flask import Flask, request, jsonify
-import requests
-import sqlite3
+from flask import Flask, request, jsonify, g
 import json
 import time
+import hashlib
 import logging
 import threading
-from datetime import datetime, timedelta
-from config import PODIO_CONFIG, WAZZUP_CONFIG, INTEGRATION_CONFIG, DATABASE_CONFIG
+from config import PODIO_CONFIG, INTEGRATION_CONFIG, DATABASE_CONFIG
+from podio_api import PodioAPI
+from podio_metadata import PodioMetadata
+from wazzup_api import WazzupAPI
+from message_tracker import MessageTracker
+from work_queue import WorkQueue, WorkerPool, shard_of
+from coalescer import MessageCoalescer
+from maintenance import MaintenanceScheduler
+from delivery import OutboundDelivery
+from deals import DealResolver
+from media_relay import MediaRelay
+from message_search import MessageSearch, SearchError
+from lease import LeaderLease, LeaderElection
+from command_rules import CommandRouter
+from podio_sync import CommentSyncEngine, AdaptiveInterval, HOOK_TYPES
+from metrics import REGISTRY, HTTP_REQUEST_SECONDS, POLL_CYCLE_SECONDS, POLL_COMMENTS_SENT
+from log_setup import setup_logging
 
 # Настройка логирования
-logging.basicConfig(
-    level=getattr(logging, INTEGRATION_CONFIG['log_level']),
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+setup_logging(INTEGRATION_CONFIG)
 logger = logging.getLogger(__name__)
 
 # Flask приложение для webhooks
 app = Flask(__name__)
 
-class PodioAPI:
-    """Класс для работы с Podio API"""
-    
-    def __init__(self):
-        self.access_token = None
-        self.token_expires = None
-        
-    def authenticate(self):
-        """Аутентификация в Podio"""
-        url = "https://api.podio.com/oauth/token"
-        data = {
-            'grant_type': 'password',
-            'client_id': PODIO_CONFIG['client_id'],
-            'client_secret': PODIO_CONFIG['client_secret'],
-            'username': PODIO_CONFIG['username'],
-            'password': PODIO_CONFIG['password']
-        }
-        
-        try:
-            response = requests.post(url, data=data)
-            if response.status_code == 200:
-                token_data = response.json()
-                self.access_token = token_data['access_token']
-                self.token_expires = datetime.now() + timedelta(seconds=token_data.get('expires_in', 3600))
-                logger.info("✅ Успешная аутентификация в Podio")
-                return True
-            else:
-                logger.error(f"❌ Ошибка аутентификации Podio: {response.status_code}")
-                return False
-        except Exception as e:
-            logger.error(f"❌ Исключение при аутентификации Podio: {e}")
-            return False
+# Глобальные объекты
+podio = PodioAPI()
+wazzup = WazzupAPI()
+tracker = MessageTracker()
+
+# Очередь входящих webhooks и пул обработчиков
+work_queue = WorkQueue(
+    tracker.storage,
+    max_attempts=INTEGRATION_CONFIG.get('queue_max_attempts', 5),
+    retry_delay=INTEGRATION_CONFIG.get('queue_retry_delay', 5),
+)
+workers = WorkerPool(work_queue, workers=INTEGRATION_CONFIG.get('queue_workers', 4), name='inbound')
+
+# Передача вложений клиентов в файлы Podio (None - выключена)
+media = MediaRelay.from_config(tracker.storage, podio, INTEGRATION_CONFIG)
+
+# Поиск по истории переписки
+search = MessageSearch.from_config(tracker.storage, INTEGRATION_CONFIG)
+
+def split_wazzup_payload(data):
+    """Разбиение webhook на задачи по чатам с сохранением порядка сообщений"""
+    chats = {}
+    for message in data.get('messages', []):
+        chats.setdefault(message.get('chatId'), []).append(message)
+
+    items = [('wazzup', {'messages': group}, chat_id) for chat_id, group in chats.items()]
+
+    # Остальные части webhook (статусы и т.п.) не привязаны к чату
+    rest = {key: value for key, value in data.items() if key != 'messages'}
+    if rest:
+        items.append(('wazzup', rest, None))
+    return items
+
+def process_wazzup_payload(data):
+    """Обработка задачи из очереди: сохранение сообщений и контактов
+
+    Повторная обработка той же задачи или повторно доставленного webhook
+    не создает дублей: сохраненные ранее сообщения дальше не передаются.
+    """
+    if data.get('statuses') and tracker.update_statuses(data['statuses']) is None:
+        raise RuntimeError("не удалось обновить статусы сообщений")
+
+    messages = data.get('messages', [])
+    inbound = []
+
+    for message in messages:
+        logger.info("📥 Получено сообщение: %s", message.get('messageId'), extra={'event': 'message.received'})
+
+        # Пропускаем исходящие сообщения (отправленные нами)
+        if message.get('isEcho') or message.get('status') != 'inbound':
+            continue
+
+        inbound.append(message)
+
+    # Сохраняем сообщения и контакты одной транзакцией
+    processed = tracker.save_webhook_batch(inbound)
+    if processed is None:
+        raise RuntimeError("не удалось сохранить сообщения")
+
+    for message, contact_id in processed:
+        if contact_id:
+            # Серию коротких сообщений передаем в Podio одним комментарием
+            coalescer.add((contact_id, message.get('chatId'), message.get('chatType')), {
+                'message_id': message.get('messageId'),
+                'sender_name': message.get('contact', {}).get('name', 'Unknown'),
+                'text': message.get('text', ''),
+                'content_uri': message.get('contentUri', ''),
+                'type': message.get('type', 'text'),
+            })
+            logger.info("✅ Сообщение обработано для контакта %s", contact_id, extra={'event': 'message.processed'})
+
+def enqueue_podio_batch(key, messages):
+    """Постановка пачки сообщений чата в очередь на запись в Podio"""
+    contact_id, chat_id, chat_type = key
+    # Отдельный раздел: запись в Podio, ожидающая восстановления API, не задерживает прием сообщений чата
+    work_queue.put('podio_comment', {
+        'contact_id': contact_id,
+        'chat_id': chat_id,
+        'chat_type': chat_type,
+        'messages': messages,
+    }, f"podio:{chat_type}:{chat_id}")
+    workers.notify()
+
+def recover_unsynced_messages():
+    """Постановка в очередь сообщений, потерянных из буфера объединения
+
+    Задача wazzup завершается, когда сообщения попали в буфер в памяти; если
+    процесс остановился аварийно до записи пачки в очередь, сообщения остаются
+    в базе без podio_item_id. При запуске обработки (буфер еще пуст) они снова
+    ставятся в очередь. Возвращает число восстановленных сообщений.
+    """
+    messages = tracker.get_unsynced_messages(INTEGRATION_CONFIG.get('coalesce_recover_window', 86400))
+    if not messages:
+        return 0
+
+    # Уже поставленные в очередь (в том числе failed) сообщения не дублируем
+    queued = {
+        message['message_id']
+        for payload in work_queue.payloads('podio_comment')
+        for message in payload.get('messages', [])
+    }
+    chats = {}
+    for message in messages:
+        if message['message_id'] in queued:
+            continue
+        # В режиме разделов каждый процесс восстанавливает только свои чаты
+        if work_queue.partition and shard_of(message['chat_id']) % work_queue.partition[1] != work_queue.partition[0]:
+            continue
+        key = (message.pop('contact_id'), message.pop('chat_id'), message.pop('chat_type'))
+        chats.setdefault(key, []).append(message)
+
+    max_batch = INTEGRATION_CONFIG.get('coalesce_max_batch', 20)
+    recovered = 0
+    for key, chat_messages in chats.items():
+        for start in range(0, len(chat_messages), max_batch):
+            enqueue_podio_batch(key, chat_messages[start:start + max_batch])
+        recovered += len(chat_messages)
+    if recovered:
+        logger.warning(f"♻️ Возвращено в очередь Podio непереданных сообщений: {recovered}")
+    return recovered
+
+def format_podio_comment(messages, attached=()):
+    """Текст одного комментария Podio из серии сообщений клиента
+
+    Для вложений, переданных файлами (attached), ссылка в тексте не нужна.
+    """
+    lines = [f"💬 {messages[0]['sender_name']}:"]
+    for message in messages:
+        if message['text']:
+            lines.append(message['text'])
+        elif message['content_uri'] in attached:
+            lines.append(f"[{message['type']}] 📎")
+        elif message['content_uri']:
+            lines.append(f"[{message['type']}] {message['content_uri']}")
+    return "\n".join(lines)
+
+def relay_attachments(messages):
+    """Передача вложений серии в файлы Podio: (file_ids, переданные contentUri)"""
+    file_ids, attached = [], set()
+    if media is None:
+        return file_ids, attached
+    for message in messages:
+        uri = message['content_uri']
+        if not uri or uri in attached:
+            continue
+        file_id = media.relay(uri, message['type'])
+        if file_id:
+            file_ids.append(file_id)
+            attached.add(uri)
+    return file_ids, attached
+
+def comment_external_id(messages):
+    """external_id комментария Podio, одинаковый при каждом повторе пачки"""
+    digest = hashlib.sha1('\n'.join(message['message_id'] for message in messages).encode()).hexdigest()
+    return f"wazzup_{digest[:20]}"
+
+def deliver_to_podio(payload):
+    """Запись пачки сообщений клиента в Podio
+
+    Повтор задачи не создает второй комментарий: уже переданные сообщения
+    пропускаются, а если запись комментария начиналась и ответ Podio потерян,
+    комментарий ищется у элемента по external_id.
+    """
+    synced = tracker.get_synced_messages(message['message_id'] for message in payload['messages'])
+    messages = [message for message in payload['messages'] if message['message_id'] not in synced]
+    if not messages:
+        return
+    # Активная сделка из локального индекса; новому клиенту она создается в Podio один раз
+    item_id = deals.resolve(payload['contact_id'])
     
-    def ensure_authenticated(self):
-        """Проверка и обновление токена при необходимости"""
-        if not self.access_token or datetime.now() >= self.token_expires:
-            return self.authenticate()
-        return True
+    if not item_id:
+        logger.info(f"ℹ️ У контакта {payload['contact_id']} нет сделки в Podio, сообщения сохранены локально")
+        return
     
-    def get_headers(self):
-        """Получение заголовков для API запросов"""
-        return {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
-        }
+    message_ids = [message['message_id'] for message in messages]
+    external_id = comment_external_id(messages)
+    if tracker.begin_comment_post(external_id, item_id):
+        posted = podio.has_item_comment(item_id, external_id)
+        if posted is None:
+            raise RuntimeError(f"не удалось проверить комментарии элемента {item_id}")
+        if posted:
+            logger.info(f"♻️ Комментарий {external_id} уже есть у элемента {item_id}")
+            tracker.mark_messages_synced(message_ids, item_id, external_id)
+            return
     
-    def create_item(self, app_id, fields):
-        """Создание нового элемента в приложении"""
-        if not self.ensure_authenticated():
-            return None
-            
-        url = f"https://api.podio.com/item/app/{app_id}/"
-        data = {
-            'fields': fields
-        }
-        
-        try:
-            response = requests.post(url, headers=self.get_headers(), json=data)
-            if response.status_code == 200:
-                item_data = response.json()
-                logger.info(f"✅ Создан элемент {item_data.get('item_id')} в приложении {app_id}")
-                return item_data
-            else:
-                logger.error(f"❌ Ошибка создания элемента: {response.status_code}")
-                return None
-        except Exception as e:
-            logger.error(f"❌ Исключение при создании элемента: {e}")
-            return None
+    file_ids, attached = relay_attachments(messages)
+    comment = format_podio_comment(messages, attached)
+    if not podio.add_comment_to_item(PODIO_CONFIG['deals_app_id'], item_id, comment, file_ids, external_id):
+        raise RuntimeError(f"не удалось добавить комментарий к элементу {item_id}")
     
-    def add_comment_to_item(self, app_id, item_id, comment_text):
-        """Добавление комментария к элементу"""
-        if not self.ensure_authenticated():
-            return False
-            
-        url = f"https://api.podio.com/comment/app/{app_id}/{item_id}/"
-        data = {
-            'value': comment_text,
-            'external_id': f"wazzup_{int(time.time())}"
-        }
-        
-        try:
-            response = requests.post(url, headers=self.get_headers(), json=data)
-            if response.status_code == 200:
-                logger.info(f"✅ Комментарий добавлен к элементу {item_id}")
-                return True
-            else:
-                logger.error(f"❌ Ошибка добавления комментария: {response.status_code}")
-                return False
-        except Exception as e:
-            logger.error(f"❌ Исключение при добавлении комментария: {e}")
-            return False
+    tracker.mark_messages_synced(message_ids, item_id, external_id)
 
-class WazzupAPI:
-    """Класс для работы с Wazzup API"""
-    
-    def __init__(self):
-        self.api_token = WAZZUP_CONFIG['api_token']
-        self.base_url = WAZZUP_CONFIG['base_url']
-    
-    def get_headers(self):
-        """Получение заголовков для API запросов"""
-        return {
-            'Authorization': f'Bearer {self.api_token}',
-            'Content-Type': 'application/json'
-        }
+workers.register('wazzup', process_wazzup_payload)
+workers.register('podio_comment', deliver_to_podio, breaker=podio.http.breaker)
+
+# Объединение серий сообщений одного чата перед записью в Podio
+coalescer = MessageCoalescer(
+    enqueue_podio_batch,
+    window=INTEGRATION_CONFIG.get('coalesce_window', 3),
+    max_batch=INTEGRATION_CONFIG.get('coalesce_max_batch', 20),
+    max_delay=INTEGRATION_CONFIG.get('coalesce_max_delay', 15),
+)
+
+# Метаданные Podio: App ID по названиям приложений и поля для create_item из кэша
+metadata = PodioMetadata.from_config(podio, PODIO_CONFIG)
+podio.metadata = metadata
+
+# Синхронизация комментариев Podio (приложения без App ID пропускаем)
+sync_app_ids = []
+
+def resolve_podio_apps(offline):
+    """Определение App ID по метаданным и обновление списка синхронизируемых приложений"""
+    metadata.resolve_app_ids(PODIO_CONFIG, offline=offline)
+    for key in ('deals_app_id', 'messages_app_id'):
+        app_id = PODIO_CONFIG.get(key)
+        if app_id and app_id != 'UNKNOWN' and app_id not in sync_app_ids:
+            sync_app_ids.append(app_id)
+
+# При импорте только кэш: запуск процесса не ждет Podio
+resolve_podio_apps(offline=True)
+
+# Конвейер отправки ответов клиентам
+delivery = OutboundDelivery.from_config(tracker.storage, wazzup, INTEGRATION_CONFIG)
+
+command_router = CommandRouter.from_config(INTEGRATION_CONFIG)
+comment_sync = CommentSyncEngine(podio, wazzup, tracker, sync_app_ids, delivery=delivery, router=command_router)
+workers.register('podio_hook', comment_sync.handle_hook, breaker=podio.http.breaker)
+
+# Сделки клиентов: локальный индекс, создание в Podio и сверка закрытых
+deals = DealResolver(podio, tracker, PODIO_CONFIG, cursors=comment_sync)
+
+# Очистка старых записей, архив и резервные копии базы
+maintenance = MaintenanceScheduler(tracker.storage, DATABASE_CONFIG)
+
+# Фоновые задачи выполняет только процесс, получивший аренду
+polling_stop = threading.Event()
+polling_thread = None
+# Подтвержден ли хотя бы один Podio hook (до этого ответы забирает обычный polling)
+podio_hooks_active = False
+background_lease = LeaderLease(tracker.storage, 'background', ttl=INTEGRATION_CONFIG.get('leader_lease_ttl', 30))
+election = LeaderElection(background_lease, lambda: start_background(), lambda: stop_background())
+
+# Метрики Prometheus (endpoint /metrics)
+REGISTRY.enabled = INTEGRATION_CONFIG.get('metrics_enabled', True)
+REGISTRY.gauge('queue_tasks', 'Задачи в очередях по статусам', ('queue', 'status'), callback=lambda: {
+    (name, status): count
+    for name, queue in (('inbound', work_queue), ('outbound', delivery.queue))
+    for status, count in queue.counts().items()
+})
+REGISTRY.gauge('coalescer_buffered', 'Сообщения, ожидающие объединения', callback=lambda: coalescer.stats()['buffered'])
+REGISTRY.gauge('contact_cache_size', 'Записей в кэше контактов', callback=lambda: tracker.contacts.stats()['size'])
+REGISTRY.gauge('podio_token_age_seconds', 'Возраст токена Podio', callback=lambda: podio.auth.stats()['age'])
+REGISTRY.gauge('podio_token_expires_in_seconds', 'Время до истечения токена Podio',
+               callback=lambda: podio.auth.stats()['expires_in'])
+REGISTRY.gauge('circuit_open', '1, если выключатель внешнего API не закрыт', ('upstream',), callback=lambda: {
+    (api.http.name,): int(api.http.breaker.state != 'closed') for api in (podio, wazzup) if api.http.breaker
+})
+REGISTRY.gauge('background_leader', '1, если процесс выполняет фоновые задачи', callback=lambda: int(election.leader))
+
+def ensure_podio_hooks(hook_url):
+    """Регистрация недостающих Podio hooks для синхронизируемых приложений
+
+    Новые и неподтвержденные hooks получают запрос подтверждения: Podio
+    не доставляет события, пока hook не ответил на hook.verify.
+    Возвращает True, если хотя бы один hook подтвержден.
+    """
+    global podio_hooks_active
     
-    def send_message(self, channel_id, chat_id, text, chat_type='whatsapp'):
-        """Отправка сообщения"""
-        url = f"{self.base_url}/message"
-        data = {
-            'channelId': channel_id,
-            'chatId': chat_id,
-            'text': text,
-            'chatType': chat_type
-        }
+    active = False
+    for app_id in sync_app_ids:
+        hooks = podio.get_hooks(app_id)
+        if hooks is None:
+            continue
         
-        try:
-            response = requests.post(url, headers=self.get_headers(), json=data)
-            if response.status_code == 201:  # Wazzup возвращает 201 для успешной отправки
-                result = response.json()
-                logger.info(f"✅ Сообщение отправлено в {chat_type} чат {chat_id}")
-                return result
+        existing = {(hook.get('url'), hook.get('type')): hook for hook in hooks}
+        for hook_type in HOOK_TYPES:
+            hook = existing.get((hook_url, hook_type))
+            if hook is None:
+                hook = podio.create_hook(app_id, hook_url, hook_type)
+                if hook:
+                    podio.request_hook_verification(hook['hook_id'])
+            elif hook.get('status') == 'active':
+                active = True
             else:
-                logger.error(f"❌ Ошибка отправки сообщения: {response.status_code} - {response.text}")
-                return None
-        except Exception as e:
-            logger.error(f"❌ Исключение при отправке сообщения: {e}")
-            return None
+                podio.request_hook_verification(hook['hook_id'])
     
-    def setup_webhooks(self, webhook_url):
-        """Настройка webhooks"""
-        url = f"{self.base_url}/webhooks"
-        data = {
-            'webhooksUri': webhook_url,
-            'subscriptions': {
-                'messagesAndStatuses': True,
-                'contactsAndDealsCreation': False,
-                'channelsUpdates': False,
-                'templateStatus': False
-            }
-        }
-        
-        try:
-            response = requests.patch(url, headers=self.get_headers(), json=data)
-            if response.status_code == 200:
-                logger.info(f"✅ Webhooks настроены на {webhook_url}")
-                return True
-            else:
-                logger.error(f"❌ Ошибка настройки webhooks: {response.status_code} - {response.text}")
-                return False
-        except Exception as e:
-            logger.error(f"❌ Исключение при настройке webhooks: {e}")
-            return False
-
-class MessageTracker:
-    """Класс для отслеживания обработанных сообщений"""
-    
-    def __init__(self):
-        self.db_path = DATABASE_CONFIG['db_path']
-        self.init_database()
-    
-    def init_database(self):
-        """Инициализация базы данных"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Таблица для сообщений Wazzup
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS wazzup_messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    message_id TEXT UNIQUE,
-                    channel_id TEXT,
-                    chat_id TEXT,
-                    chat_type TEXT,
-                    sender_name TEXT,
-                    text TEXT,
-                    content_uri TEXT,
-                    message_type TEXT,
-                    status TEXT,
-                    datetime TEXT,
-                    is_echo BOOLEAN,
-                    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    podio_item_id TEXT
-                )
-            ''')
-            
-            # Таблица для контактов
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS contacts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    chat_id TEXT UNIQUE,
-                    chat_type TEXT,
-                    name TEXT,
-                    phone TEXT,
-                    username TEXT,
-                    podio_contact_id TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Таблица для сделок
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS deals (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    contact_id INTEGER,
-                    podio_item_id TEXT,
-                    status TEXT DEFAULT 'active',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (contact_id) REFERENCES contacts (id)
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            logger.info("✅ База данных инициализирована")
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка инициализации базы данных: {e}")
-    
-    def save_wazzup_message(self, message_data):
-        """Сохранение сообщения из Wazzup"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO wazzup_messages 
-                (message_id, channel_id, chat_id, chat_type, sender_name, text, 
-                 content_uri, message_type, status, datetime, is_echo)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                message_data.get('messageId'),
-                message_data.get('channelId'),
-                message_data.get('chatId'),
-                message_data.get('chatType'),
-                message_data.get('contact', {}).get('name', 'Unknown'),
-                message_data.get('text', ''),
-                message_data.get('contentUri', ''),
-                message_data.get('type', 'text'),
-                message_data.get('status', 'unknown'),
-                message_data.get('dateTime'),
-                message_data.get('isEcho', False)
-            ))
-            
-            conn.commit()
-            conn.close()
-            logger.info(f"✅ Сообщение {message_data.get('messageId')} сохранено")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка сохранения сообщения: {e}")
-            return False
-    
-    def get_or_create_contact(self, chat_id, chat_type, name=None):
-        """Получение или создание контакта"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Ищем существующий контакт
-            cursor.execute("SELECT * FROM contacts WHERE chat_id = ? AND chat_type = ?", (chat_id, chat_type))
-            contact = cursor.fetchone()
-            
-            if contact:
-                conn.close()
-                return contact[0]  # Возвращаем ID контакта
-            
-            # Создаем новый контакт
-            cursor.execute('''
-                INSERT INTO contacts (chat_id, chat_type, name)
-                VALUES (?, ?, ?)
-            ''', (chat_id, chat_type, name or 'Unknown'))
-            
-            contact_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-            
-            logger.info(f"✅ Создан новый контакт {contact_id} для {chat_type}:{chat_id}")
-            return contact_id
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка работы с контактом: {e}")
-            return None
-
-# Глобальные объекты
-podio = PodioAPI()
-wazzup = WazzupAPI()
-tracker = MessageTracker()
+    if active and not podio_hooks_active:
+        logger.info("✅ Podio hooks подтверждены, polling переходит в режим сверки")
+    elif podio_hooks_active and not active:
+        logger.warning("⚠️ Podio hooks не подтверждены, ответы снова забирает polling")
+    podio_hooks_active = active
+    return active
 
 @app.route('/webhook/wazzup', methods=['POST'])
 def wazzup_webhook():
@@ -329,36 +341,129 @@ def wazzup_webhook():
             logger.info("📥 Получен тестовый webhook от Wazzup")
             return jsonify({'status': 'ok'}), 200
         
-        # Обработка сообщений
-        messages = data.get('messages', [])
-        
-        for message in messages:
-            logger.info(f"📥 Получено сообщение: {message.get('messageId')}")
-            
-            # Пропускаем исходящие сообщения (отправленные нами)
-            if message.get('isEcho') or message.get('status') != 'inbound':
-                continue
-            
-            # Сохраняем сообщение
-            tracker.save_wazzup_message(message)
-            
-            # Получаем или создаем контакт
-            chat_id = message.get('chatId')
-            chat_type = message.get('chatType')
-            sender_name = message.get('contact', {}).get('name', 'Unknown')
-            
-            contact_id = tracker.get_or_create_contact(chat_id, chat_type, sender_name)
-            
-            if contact_id:
-                # TODO: Создать сделку в Podio или добавить комментарий к существующей
-                logger.info(f"✅ Сообщение обработано для контакта {contact_id}")
-            
+        # Сохраняем webhook в очередь и сразу отвечаем, обработка идет в фоне.
+        # Повторы отсекаются при сохранении сообщений: фильтр недавних messageId заполняет
+        # процесс обработки очереди, а не процесс gunicorn, принявший webhook
+        items = split_wazzup_payload(data)
+        if items:
+            work_queue.put_many(items)
+            workers.notify()
+
         return jsonify({'status': 'ok'}), 200
         
     except Exception as e:
         logger.error(f"❌ Ошибка обработки webhook: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/webhook/podio', methods=['POST'])
+def podio_webhook():
+    """Обработчик hooks от Podio (hook.verify, comment.create, item.update)"""
+    try:
+        # Podio не подписывает hooks, поэтому секрет передается в URL
+        secret = INTEGRATION_CONFIG.get('podio_hook_secret')
+        if secret and request.args.get('token') != secret:
+            return jsonify({'error': 'forbidden'}), 403
+        
+        event = request.form.to_dict()
+        if not event.get('type'):
+            return jsonify({'error': 'unknown event'}), 400
+        
+        logger.info("📥 Получен hook Podio: %s", event.get('type'), extra={'event': 'podio_hook.received'})
+        
+        # События одного элемента обрабатываются по порядку
+        item_id = event.get('item_id')
+        work_queue.put('podio_hook', event, f"podio_item:{item_id}" if item_id else None)
+        workers.notify()
+        
+        return jsonify({'status': 'ok'}), 200
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка обработки hook Podio: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/queue/stats', methods=['GET'])
+def queue_stats():
+    """Глубина очереди, скорость ее разбора и буфер объединения сообщений"""
+    stats = workers.stats()
+    stats['coalescer'] = coalescer.stats()
+    return jsonify(stats), 200
+
+@app.before_request
+def start_request_timer():
+    if REGISTRY.enabled:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            endpoint=request.url_rule.rule if request.url_rule else 'unmatched',
+            method=request.method,
+            status=response.status_code,
+        )
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Метрики в текстовом формате Prometheus"""
+    if not REGISTRY.enabled:
+        return jsonify({'error': 'metrics disabled'}), 404
+    return REGISTRY.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/stats', methods=['GET'])
+def integration_stats():
+    """Статистика очереди и кэшей интеграции"""
+    return jsonify({
+        'queue': workers.stats(),
+        'coalescer': coalescer.stats(),
+        'delivery': delivery.stats(),
+        'contact_cache': tracker.contacts.stats(),
+        'recent_messages': tracker.recent_messages.stats(),
+        'media': media.stats() if media else None,
+        'deals': deals.stats(),
+        'podio_metadata': metadata.stats(),
+        'podio_token': podio.auth.stats(),
+        'breakers': {api.http.name: api.http.breaker.stats() for api in (podio, wazzup) if api.http.breaker},
+        'background_leader': background_lease.current_holder(),
+        'partition': work_queue.partition,
+        'maintenance': maintenance.last_report,
+    }), 200
+
+@app.route('/search', methods=['GET'])
+def search_messages():
+    """Поиск по истории переписки
+
+    Параметры: q, chat_id, chat_type, from, to, sort (rank|recent), limit, cursor.
+    Токен search_token передается в заголовке Authorization: Bearer или в ?token=.
+    """
+    token = INTEGRATION_CONFIG.get('search_token')
+    if not token:
+        return jsonify({'error': 'search disabled'}), 403
+    header = request.headers.get('Authorization', '')
+    provided = (header[7:] if header.startswith('Bearer ') else header).strip() or request.args.get('token')
+    if provided != token:
+        return jsonify({'error': 'forbidden'}), 403
+
+    args = request.args
+    try:
+        start = time.perf_counter()
+        result = search.search(
+            args.get('q'),
+            chat_id=args.get('chat_id'),
+            chat_type=args.get('chat_type'),
+            date_from=args.get('from'),
+            date_to=args.get('to'),
+            limit=args.get('limit', type=int),
+            cursor=args.get('cursor'),
+            sort=args.get('sort', 'rank'),
+        )
+    except SearchError as e:
+        return jsonify({'error': str(e)}), 400
+    result['took_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return jsonify(result), 200
+
 @app.route('/webhook/test', methods=['GET', 'POST'])
 def test_webhook():
     """Тестовый endpoint для проверки webhooks"""
@@ -373,40 +478,153 @@ def run_polling_loop():
     """Основной цикл polling для обработки комментариев Podio"""
     logger.info("🔄 Запуск polling цикла для Podio")
     
-    while True:
+    polling = AdaptiveInterval(
+        INTEGRATION_CONFIG.get('polling_min_interval', 15),
+        INTEGRATION_CONFIG['polling_interval']
+    )
+    # Когда ответы доставляются по hooks, polling только сверяет пропущенное
+    reconcile = INTEGRATION_CONFIG.get('reconcile_interval', 900)
+    reconcile = AdaptiveInterval(reconcile, reconcile)
+    
+    try:
+        poll_until_stopped(polling, reconcile)
+    finally:
+        tracker.storage.release()
+
+def poll_until_stopped(polling, reconcile):
+    """Проверки комментариев Podio до остановки polling"""
+    hook_url = INTEGRATION_CONFIG.get('podio_hook_url')
+    hook_check_interval = INTEGRATION_CONFIG.get('hook_check_interval', 60)
+    next_hook_check = time.monotonic() + hook_check_interval
+    
+    while not polling_stop.is_set():
         try:
-            # TODO: Реализовать получение новых комментариев из Podio
-            # и отправку их через Wazzup API
+            # Hooks проверяются, пока не подтверждены, и при каждой сверке после этого
+            if hook_url and time.monotonic() >= next_hook_check:
+                ensure_podio_hooks(hook_url)
+                next_hook_check = time.monotonic() + hook_check_interval
+            interval = reconcile if podio_hooks_active else polling
             
             logger.info("🔍 Проверка новых комментариев в Podio...")
+            with POLL_CYCLE_SECONDS.time():
+                sent = comment_sync.run_once()
+            deals.reconcile()
+            POLL_COMMENTS_SENT.inc(sent)
+            
+            # Переписка активна, если мы отвечали или клиент писал недавно
+            active = sent > 0 or tracker.has_recent_messages(interval.max_interval)
             
             # Пауза между проверками
-            time.sleep(INTEGRATION_CONFIG['polling_interval'])
+            polling_stop.wait(interval.record(active))
             
         except Exception as e:
             logger.error(f"❌ Ошибка в polling цикле: {e}")
-            time.sleep(30)  # Короткая пауза при ошибке
+            polling_stop.wait(30)  # Короткая пауза при ошибке
 
-def main():
-    """Основная функция"""
-    logger.info("🚀 Запуск гибридной интеграции Podio-Wazzup")
+def start_leader_tasks():
+    """Задачи ведущего процесса: подключение к Podio, hooks, обслуживание базы и polling"""
+    global polling_thread
     
     # Проверяем подключения
     if not podio.authenticate():
         logger.error("❌ Не удалось подключиться к Podio")
-        return
+        return False
+    
+    # Пустой кэш метаданных загружаем сразу, иначе обновляем его в фоне
+    resolve_podio_apps(offline=False)
+    metadata.refresh_async()
     
     # Настраиваем webhooks для Wazzup (если нужно)
     webhook_url = "https://your-server.com/webhook/wazzup"  # Замените на ваш URL
     # wazzup.setup_webhooks(webhook_url)
     
+    # Регистрируем Podio hooks для мгновенной доставки ответов
+    if INTEGRATION_CONFIG.get('podio_hook_url'):
+        ensure_podio_hooks(INTEGRATION_CONFIG['podio_hook_url'])
+    
+    # Запускаем обслуживание базы данных
+    maintenance.start()
+    
     # Запускаем polling в отдельном потоке
-    polling_thread = threading.Thread(target=run_polling_loop, daemon=True)
+    polling_stop.clear()
+    polling_thread = threading.Thread(target=run_polling_loop, name='polling', daemon=True)
     polling_thread.start()
+    return True
+
+def stop_leader_tasks(timeout=30):
+    """Остановка polling и обслуживания базы"""
+    global polling_thread
+    
+    polling_stop.set()
+    if polling_thread:
+        polling_thread.join(timeout)
+        polling_thread = None
+    maintenance.stop(timeout)
+
+def start_processing():
+    """Запуск обработчиков очереди webhooks и отправки ответов клиентам"""
+    recover_unsynced_messages()
+    workers.start()
+    delivery.start()
+
+def stop_processing(timeout=30):
+    """Остановка очередей: текущие задачи завершаются, буферы сохраняются"""
+    workers.stop(timeout)
+    # Накопленные серии сообщений уходят в очередь и будут обработаны после перезапуска
+    coalescer.stop()
+    delivery.stop(timeout)
+
+def start_background():
+    """Запуск фоновых задач: очереди, отправка ответов, обслуживание и polling"""
+    if not start_leader_tasks():
+        return False
+    start_processing()
+    return True
+
+def stop_background(timeout=30):
+    """Плавная остановка фоновых задач: текущие задачи завершаются, буферы сохраняются"""
+    logger.info("🛑 Остановка фоновых задач")
+    stop_leader_tasks(timeout)
+    stop_processing(timeout)
+
+def start_partition(index, count):
+    """Режим разделов: процесс обрабатывает задачи своих чатов (шарды index по модулю count)
+
+    Все задачи чата попадают в один процесс, поэтому порядок сообщений,
+    объединение серий и кэш контактов работают как в одном процессе.
+    Polling и обслуживание базы выполняет один процесс, получивший аренду.
+    """
+    work_queue.partition = delivery.queue.partition = (index, count)
+    # Закрытие сделки сверкой видит только ведущий процесс, остальные проверяют сделку из кэша по базе
+    deals.verify_cached = count > 1
+    # Частота отправки в канал делится между процессами
+    delivery.limiter.rate = INTEGRATION_CONFIG.get('channel_rate', 1.0) / count
+    resolve_podio_apps(offline=False)
+    start_processing()
+    logger.info(f"🧩 Раздел {index + 1}/{count} запущен")
+    
+    election.on_elected = start_leader_tasks
+    election.on_demoted = stop_leader_tasks
+    election.start()
+
+def stop_partition(timeout=30):
+    """Остановка раздела и освобождение аренды ведущего"""
+    election.stop(timeout)
+    stop_processing(timeout)
+
+def main():
+    """Запуск в одном процессе (режим разработки), для production см. serve.py"""
+    logger.info("🚀 Запуск гибридной интеграции Podio-Wazzup")
+    
+    if not start_background():
+        return
     
     # Запускаем Flask сервер для webhooks
     logger.info("🌐 Запуск webhook сервера на порту 5000")
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    try:
+        app.run(host='0.0.0.0', port=5000, debug=False)
+    finally:
+        stop_background()
 
 if __name__ == "__main__":
     main()
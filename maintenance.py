@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Обслуживание базы данных по DATABASE_CONFIG
+- Удаление записей старше cleanup_days небольшими порциями
+- Архивирование удаленных сообщений в сжатые JSONL сегменты
+- Инкрементальный VACUUM
+- Онлайн резервные копии через SQLite backup API раз в backup_interval
+"""
+
+import os
+import glob
+import gzip
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceScheduler:
+    """Фоновый поток обслуживания базы данных"""
+
+    def __init__(self, storage, config):
+        self.storage = storage
+        self.cleanup_days = config.get('cleanup_days', 30)
+        self.cleanup_interval = config.get('cleanup_interval', 3600)
+        self.cleanup_chunk = config.get('cleanup_chunk', 500)
+        self.cleanup_pause = config.get('cleanup_pause', 0.05)
+        self.archive_dir = config.get('archive_dir')
+        self.backup_interval = config.get('backup_interval', 86400)
+        self.backup_dir = config.get('backup_dir')
+        self.backup_keep = config.get('backup_keep', 7)
+        self.vacuum_pages = config.get('vacuum_pages', 1000)
+        self.last_report = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запуск фонового потока"""
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='maintenance', daemon=True)
+        self._thread.start()
+        logger.info("🧹 Запущено обслуживание базы данных")
+
+    def stop(self, timeout=30):
+        """Остановка после текущей порции работы"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        """Цикл: очистка раз в cleanup_interval, копия раз в backup_interval"""
+        next_cleanup = time.time()
+        try:
+            while not self._stop.is_set():
+                try:
+                    if time.time() >= next_cleanup:
+                        self.run_cleanup()
+                        next_cleanup = time.time() + self.cleanup_interval
+
+                    if self.backup_due():
+                        self.run_backup()
+                except Exception as e:
+                    logger.error(f"❌ Ошибка обслуживания базы данных: {e}")
+
+                self._stop.wait(min(60, self.cleanup_interval))
+        finally:
+            self.storage.release()
+
+    def run_cleanup(self):
+        """Удаление и архивирование старых записей, затем VACUUM"""
+        start = time.perf_counter()
+        segment = None
+        if self.archive_dir:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            segment = os.path.join(self.archive_dir, f"wazzup_messages-{stamp}.jsonl.gz")
+
+        cutoff = f"-{int(self.cleanup_days)} days"
+        messages = self._prune_messages(cutoff, segment)
+        comments = self._prune('podio_comments', "status IN ('sent', 'queued', 'skipped') AND processed_at < datetime('now', ?)", cutoff)
+        outbound = self._prune('outbound_messages', "status = 'sent' AND sent_at < datetime('now', ?)", cutoff)
+        # Файлы Podio в media_files остаются: по хешу их можно переиспользовать и позже
+        self._prune('media_sources', "created_at < datetime('now', ?)", cutoff)
+        vacuumed = self.incremental_vacuum()
+
+        self.last_report['cleanup'] = {
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'messages_pruned': messages,
+            'comments_pruned': comments,
+            'outbound_pruned': outbound,
+            'pages_vacuumed': vacuumed,
+            'archive': segment if messages and segment else None,
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+        logger.info(
+            f"🧹 Очистка: удалено сообщений {messages}, комментариев {comments}, исходящих {outbound}, "
+            f"освобождено страниц {vacuumed} за {self.last_report['cleanup']['seconds']} с"
+        )
+        return self.last_report['cleanup']
+
+    def _prune_messages(self, cutoff, segment):
+        """Порционное удаление старых сообщений с записью в архив"""
+        pruned = 0
+        conn = self.storage.connection()
+        conn.row_factory = sqlite3.Row
+        try:
+            while not self._stop.is_set():
+                # Чтение порции не блокирует запись (WAL), блокировка берется только на DELETE.
+                # Последнее сообщение чата остается: по нему выбирается канал для ответа клиенту
+                rows = conn.execute('''
+                    SELECT * FROM wazzup_messages m
+                    WHERE processed_at < datetime('now', ?)
+                      AND EXISTS (
+                          SELECT 1 FROM wazzup_messages n
+                          WHERE n.chat_id = m.chat_id AND n.chat_type = m.chat_type AND n.id > m.id
+                      )
+                    ORDER BY processed_at
+                    LIMIT ?
+                ''', (cutoff, self.cleanup_chunk)).fetchall()
+                if not rows:
+                    break
+
+                if segment:
+                    with gzip.open(segment, 'at', encoding='utf-8') as archive:
+                        for row in rows:
+                            archive.write(json.dumps(dict(row), ensure_ascii=False) + "\n")
+
+                with self.storage.transaction() as cursor:
+                    cursor.executemany("DELETE FROM wazzup_messages WHERE id = ?", [(row['id'],) for row in rows])
+                pruned += len(rows)
+
+                # Пауза между порциями, чтобы webhook не ждал блокировку
+                time.sleep(self.cleanup_pause)
+        finally:
+            conn.row_factory = None
+        return pruned
+
+    def _prune(self, table, condition, cutoff):
+        """Порционное удаление записей таблицы без архивирования"""
+        pruned = 0
+        while not self._stop.is_set():
+            with self.storage.transaction() as cursor:
+                cursor.execute(f'''
+                    DELETE FROM {table} WHERE rowid IN (
+                        SELECT rowid FROM {table} WHERE {condition} LIMIT ?
+                    )
+                ''', (cutoff, self.cleanup_chunk))
+                deleted = cursor.rowcount
+            pruned += deleted
+            if deleted < self.cleanup_chunk:
+                break
+            time.sleep(self.cleanup_pause)
+        return pruned
+
+    def incremental_vacuum(self):
+        """Возврат свободных страниц файловой системе порциями"""
+        mode = self.storage.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode != 2:
+            # База создана до включения auto_vacuum=INCREMENTAL, нужен разовый VACUUM вручную
+            logger.debug("Инкрементальный VACUUM недоступен для этой базы")
+            return 0
+
+        freed = 0
+        while not self._stop.is_set():
+            free_pages = self.storage.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free_pages:
+                break
+            pages = min(free_pages, self.vacuum_pages)
+            # executescript проходит PRAGMA до конца; execute освобождает только одну страницу
+            self.storage.connection().executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+            freed += free_pages - self.storage.execute("PRAGMA freelist_count").fetchone()[0]
+            time.sleep(self.cleanup_pause)
+        return freed
+
+    def _backups(self):
+        """Файлы резервных копий, от старых к новым"""
+        base = os.path.splitext(os.path.basename(self.storage.db_path))[0]
+        return sorted(glob.glob(os.path.join(self.backup_dir, f"{base}-*.db")))
+
+    def backup_due(self):
+        """Пора ли делать резервную копию"""
+        if not self.backup_dir or not self.backup_interval:
+            return False
+        backups = self._backups() if os.path.isdir(self.backup_dir) else []
+        if not backups:
+            return True
+        return time.time() - os.path.getmtime(backups[-1]) >= self.backup_interval
+
+    def run_backup(self):
+        """Согласованная копия работающей базы через backup API"""
+        start = time.perf_counter()
+        os.makedirs(self.backup_dir, exist_ok=True)
+        base = os.path.splitext(os.path.basename(self.storage.db_path))[0]
+        target = os.path.join(self.backup_dir, f"{base}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.db")
+
+        # Копируем во временный файл, чтобы незаконченная копия не считалась готовой
+        partial = target + '.partial'
+        destination = sqlite3.connect(partial)
+        try:
+            # Копия за один шаг: в WAL режиме чтение не блокирует запись webhooks. Копия порциями
+            # начинается заново после каждой записи в базу и под постоянным потоком webhooks не завершается
+            self.storage.connection().backup(destination, pages=-1)
+        finally:
+            destination.close()
+        os.replace(partial, target)
+
+        for old in self._backups()[:-self.backup_keep]:
+            os.remove(old)
+
+        self.last_report['backup'] = {
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'file': target,
+            'bytes': os.path.getsize(target),
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+        logger.info(f"💾 Резервная копия {target} создана за {self.last_report['backup']['seconds']} с")
+        return self.last_report['backup']
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Передача вложений из Wazzup (contentUri) в файлы Podio
+- Загрузка и выгрузка потоком блоками, файл целиком в памяти не держится
+- Кэш на диске по SHA-256 содержимого: одинаковый файл выгружается в Podio один раз
+- Ограничение размера файла и числа одновременных передач
+"""
+
+import os
+import time
+import uuid
+import hashlib
+import logging
+import mimetypes
+import tempfile
+import threading
+from urllib.parse import urlsplit, unquote
+
+from http_transport import HttpTransport
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MEDIA_RELAYED = REGISTRY.counter('media_relayed', 'Вложения, переданные в Podio', ('result',))
+MEDIA_BYTES = REGISTRY.counter('media_downloaded_bytes', 'Загружено байт вложений из Wazzup')
+
+# Количество блокировок по хешу файла: одинаковые файлы не выгружаются параллельно
+LOCK_STRIPES = 64
+
+
+class MediaTooLarge(Exception):
+    """Вложение больше допустимого размера"""
+
+
+class MultipartFile:
+    """Тело multipart/form-data с файлом с диска, читаемое блоками
+
+    requests отправляет такой объект потоком с заголовком Content-Length.
+    seek(0) позволяет повторить запрос (повтор транспорта или обновление токена).
+    """
+
+    def __init__(self, path, filename, mime_type, field='source', fields=None, chunk_size=65536):
+        self.path = path
+        self.chunk_size = chunk_size
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+
+        safe_name = filename.replace('"', '').replace('\r', '').replace('\n', '')
+        head = ''
+        for name, value in (fields or {}).items():
+            head += f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+        head += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{safe_name}"\r\n'
+            f'Content-Type: {mime_type}\r\n\r\n'
+        )
+        self._head = head.encode('utf-8')
+        self._tail = f'\r\n--{boundary}--\r\n'.encode()
+        self.length = len(self._head) + os.path.getsize(path) + len(self._tail)
+        self._file = None
+        self.seek(0)
+
+    def __len__(self):
+        return self.length
+
+    def seek(self, offset, whence=0):
+        if offset != 0 or whence != 0:
+            raise ValueError("поддерживается только seek(0)")
+        self.close()
+        self._parts = [self._head, None, self._tail]
+        self._file = open(self.path, 'rb')
+
+    def read(self, size=-1):
+        """Следующий блок тела; b'' в конце"""
+        if size is None or size < 0:
+            size = self.chunk_size
+        while self._parts:
+            part = self._parts[0]
+            if part is None:
+                data = self._file.read(size)
+                if data:
+                    return data
+                self._parts.pop(0)
+                continue
+            data, rest = part[:size], part[size:]
+            if rest:
+                self._parts[0] = rest
+            else:
+                self._parts.pop(0)
+            return data
+        return b''
+
+    def __iter__(self):
+        while True:
+            data = self.read(self.chunk_size)
+            if not data:
+                self.close()
+                return
+            yield data
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class MediaRelay:
+    """Загрузка вложений клиентов и их выгрузка в Podio через кэш на диске"""
+
+    def __init__(self, storage, podio, cache_dir, max_bytes=25 * 1024 * 1024, concurrency=2,
+                 chunk_size=65536, cache_days=7, http=None):
+        self.storage = storage
+        self.podio = podio
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.cache_days = cache_days
+        self.http = http or HttpTransport('Media', '', pool_size=max(1, concurrency), read_timeout=60, max_retries=2)
+        self._slots = threading.BoundedSemaphore(max(1, concurrency))
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._pruned_at = 0
+        self._stats_lock = threading.Lock()
+        self.counters = {'uploaded': 0, 'reused': 0, 'too_large': 0, 'failed': 0}
+
+    @classmethod
+    def from_config(cls, storage, podio, config):
+        """Создание по INTEGRATION_CONFIG; None, если передача вложений выключена"""
+        if not config.get('media_relay', True) or not config.get('media_cache_dir'):
+            return None
+        return cls(
+            storage,
+            podio,
+            config['media_cache_dir'],
+            max_bytes=config.get('media_max_bytes', 25 * 1024 * 1024),
+            concurrency=config.get('media_concurrency', 2),
+            chunk_size=config.get('media_chunk_size', 65536),
+            cache_days=config.get('media_cache_days', 7),
+        )
+
+    def _count(self, result):
+        MEDIA_RELAYED.inc(result=result)
+        with self._stats_lock:
+            self.counters[result] += 1
+
+    def cache_path(self, digest):
+        """Путь файла в кэше по хешу содержимого"""
+        return os.path.join(self.cache_dir, digest[:2], digest)
+
+    def relay(self, content_uri, media_type=None):
+        """ID файла Podio для вложения или None, если передать не удалось
+
+        Ошибка передачи не мешает записи комментария: ссылка на вложение
+        остается в тексте.
+        """
+        try:
+            with self._slots:
+                digest = self._source_digest(content_uri)
+                if digest is None or not os.path.exists(self.cache_path(digest)) and not self._has_file(digest):
+                    digest = self._download(content_uri, media_type)
+                file_id = self._podio_file(digest, content_uri, media_type)
+                if file_id is None:
+                    # При повторной загрузке по ссылке оказалось другое содержимое
+                    file_id = self._podio_file(self._source_digest(content_uri), content_uri, media_type)
+                if file_id is None:
+                    raise RuntimeError("содержимое по ссылке меняется при каждой загрузке")
+        except MediaTooLarge as e:
+            self._count('too_large')
+            logger.warning(f"⚠️ Вложение не передано в Podio: {e}")
+            return None
+        except Exception as e:
+            self._count('failed')
+            logger.error(f"❌ Ошибка передачи вложения {content_uri}: {e}")
+            return None
+
+        self.prune_cache()
+        return file_id
+
+    def _source_digest(self, content_uri):
+        """Хеш содержимого, уже загруженного по этому contentUri"""
+        row = self.storage.execute(
+            "SELECT sha256 FROM media_sources WHERE content_uri = ?", (content_uri,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _has_file(self, digest):
+        """Есть ли файл в Podio (тогда содержимое на диске не нужно)"""
+        row = self.storage.execute(
+            "SELECT podio_file_id FROM media_files WHERE sha256 = ?", (digest,)
+        ).fetchone()
+        return bool(row and row[0])
+
+    def _download(self, content_uri, media_type):
+        """Потоковая загрузка во временный файл с подсчетом SHA-256, возвращает хеш"""
+        response = self.http.request('GET', content_uri, stream=True)
+        try:
+            if response.status_code != 200:
+                raise RuntimeError(f"загрузка вернула {response.status_code}")
+
+            declared = response.headers.get('Content-Length')
+            if declared and declared.isdigit() and int(declared) > self.max_bytes:
+                raise MediaTooLarge(f"{content_uri}: {int(declared)} байт больше лимита {self.max_bytes}")
+
+            tmp_dir = os.path.join(self.cache_dir, 'tmp')
+            os.makedirs(tmp_dir, exist_ok=True)
+            digest = hashlib.sha256()
+            size = 0
+            fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in response.iter_content(self.chunk_size):
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            raise MediaTooLarge(f"{content_uri}: больше лимита {self.max_bytes} байт")
+                        digest.update(chunk)
+                        f.write(chunk)
+                MEDIA_BYTES.inc(size)
+
+                digest = digest.hexdigest()
+                path = self.cache_path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        finally:
+            response.close()
+
+        mime_type = (response.headers.get('Content-Type') or '').split(';')[0].strip() or 'application/octet-stream'
+        filename = self._filename(content_uri, mime_type, media_type)
+        with self.storage.transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO media_files (sha256, size, mime_type, filename)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(sha256) DO NOTHING
+            ''', (digest, size, mime_type, filename))
+            cursor.execute('''
+                INSERT INTO media_sources (content_uri, sha256) VALUES (?, ?)
+                ON CONFLICT(content_uri) DO UPDATE SET sha256 = excluded.sha256
+            ''', (content_uri, digest))
+        return digest
+
+    @staticmethod
+    def _filename(content_uri, mime_type, media_type):
+        """Имя файла для Podio по ссылке и типу содержимого"""
+        name = unquote(os.path.basename(urlsplit(content_uri).path))
+        if not name or '.' not in name:
+            extension = mimetypes.guess_extension(mime_type) or ''
+            name = f"{name or media_type or 'file'}{extension}"
+        return name
+
+    def _podio_file(self, digest, content_uri, media_type):
+        """ID файла Podio: выгрузка при первом использовании, копия при повторном
+
+        None, если файл пропал из кэша, а заново загруженное содержимое имеет
+        другой хеш: для него есть своя запись кэша.
+        """
+        with self._locks[int(digest[:8], 16) % LOCK_STRIPES]:
+            row = self.storage.execute(
+                "SELECT podio_file_id, uses, mime_type, filename FROM media_files WHERE sha256 = ?", (digest,)
+            ).fetchone()
+            file_id, uses, mime_type, filename = row
+
+            if file_id and uses:
+                # Один файл Podio прикрепляется к одному объекту - копируем на стороне Podio
+                new_id = self.podio.copy_file(file_id)
+                if new_id is None:
+                    raise RuntimeError(f"не удалось скопировать файл Podio {file_id}")
+                self._count('reused')
+                self._mark_used(digest)
+                return new_id
+
+            if not file_id:
+                path = self.cache_path(digest)
+                if not os.path.exists(path):
+                    # Файл удален из кэша до выгрузки - загружаем заново
+                    if self._download(content_uri, media_type) != digest:
+                        return None
+                body = MultipartFile(path, filename, mime_type, fields={'filename': filename},
+                                     chunk_size=self.chunk_size)
+                try:
+                    file_id = self.podio.upload_file(body)
+                finally:
+                    body.close()
+                if file_id is None:
+                    raise RuntimeError(f"не удалось выгрузить файл {filename} в Podio")
+                with self.storage.transaction() as cursor:
+                    cursor.execute(
+                        "UPDATE media_files SET podio_file_id = ? WHERE sha256 = ?", (str(file_id), digest)
+                    )
+                self._count('uploaded')
+            self._mark_used(digest)
+            return file_id
+
+    def _mark_used(self, digest):
+        with self.storage.transaction() as cursor:
+            cursor.execute(
+                "UPDATE media_files SET uses = uses + 1, last_used_at = CURRENT_TIMESTAMP WHERE sha256 = ?",
+                (digest,)
+            )
+
+    def prune_cache(self, force=False):
+        """Удаление файлов кэша старше cache_days (не чаще раза в час)"""
+        if not force and time.monotonic() - self._pruned_at < 3600:
+            return 0
+        self._pruned_at = time.monotonic()
+
+        cutoff = time.time() - self.cache_days * 86400
+        removed = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        if removed:
+            logger.info(f"🧹 Удалено файлов из кэша вложений: {removed}")
+        return removed
+
+    def stats(self):
+        """Статистика передачи вложений"""
+        with self._stats_lock:
+            return dict(self.counters)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Полнотекстовый поиск по истории переписки
+- Индекс FTS5 messages_fts обновляется триггерами на wazzup_messages (миграция 8)
+- Каждое слово запроса ищется по началу ("заказ" находит "заказы", "заказа")
+- Результаты по релевантности (bm25) или по новизне, страницы по ключу (keyset)
+"""
+
+import re
+import json
+import base64
+import logging
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Слов запроса учитывается не больше этого числа
+MAX_TERMS = 10
+
+SORTS = ('rank', 'recent')
+
+
+class SearchError(ValueError):
+    """Некорректные параметры поиска"""
+
+
+class MessageSearch:
+    """Поиск сообщений по индексу messages_fts"""
+
+    def __init__(self, storage, default_limit=20, max_limit=100):
+        self.storage = storage
+        self.default_limit = default_limit
+        self.max_limit = max_limit
+
+    @classmethod
+    def from_config(cls, storage, config):
+        return cls(
+            storage,
+            default_limit=config.get('search_default_limit', 20),
+            max_limit=config.get('search_max_limit', 100),
+        )
+
+    @staticmethod
+    def build_query(text):
+        """Выражение MATCH: все слова запроса, каждое как префикс
+
+        Кавычки и операторы FTS5 из пользовательского ввода не попадают
+        в выражение. "ё" заменяется на "е", как и в индексе.
+        """
+        text = (text or '').replace('ё', 'е').replace('Ё', 'Е')
+        terms = re.findall(r'\w+', text)[:MAX_TERMS]
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    @staticmethod
+    def encode_cursor(key):
+        return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor, sort):
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            if sort == 'rank':
+                score, message_id = key
+                return float(score), int(message_id)
+            return int(key)
+        except Exception:
+            raise SearchError("некорректный cursor")
+
+    @staticmethod
+    def _date_bounds(date_from, date_to):
+        """Границы по полю datetime (ISO строка); дата без времени в date_to включается целиком"""
+        bounds = []
+        if date_from:
+            bounds.append(('m.datetime >= ?', date_from))
+        if date_to:
+            if len(date_to) == 10:
+                try:
+                    date_to = (date.fromisoformat(date_to) + timedelta(days=1)).isoformat()
+                except ValueError:
+                    raise SearchError("некорректная дата date_to")
+                bounds.append(('m.datetime < ?', date_to))
+            else:
+                bounds.append(('m.datetime <= ?', date_to))
+        return bounds
+
+    def search(self, text, chat_id=None, chat_type=None, date_from=None, date_to=None,
+               limit=None, cursor=None, sort='rank'):
+        """Страница результатов: {'hits': [...], 'next_cursor': str или None}
+
+        sort='rank' - сначала наиболее релевантные, 'recent' - сначала новые.
+        next_cursor передается в следующий вызов с теми же параметрами.
+        """
+        if sort not in SORTS:
+            raise SearchError(f"sort должен быть одним из: {', '.join(SORTS)}")
+        query = self.build_query(text)
+        if not query:
+            raise SearchError("пустой запрос")
+        limit = min(max(1, int(limit or self.default_limit)), self.max_limit)
+
+        conditions = ['messages_fts MATCH ?']
+        params = [query]
+        if chat_id:
+            conditions.append('m.chat_id = ?')
+            params.append(chat_id)
+        if chat_type:
+            conditions.append('m.chat_type = ?')
+            params.append(chat_type)
+        for condition, value in self._date_bounds(date_from, date_to):
+            conditions.append(condition)
+            params.append(value)
+
+        if sort == 'rank':
+            if cursor:
+                score, last_id = self.decode_cursor(cursor, sort)
+                conditions.append('(bm25(messages_fts) > ? OR (bm25(messages_fts) = ? AND m.id > ?))')
+                params.extend([score, score, last_id])
+            order = 'score, m.id'
+        else:
+            if cursor:
+                conditions.append('messages_fts.rowid < ?')
+                params.append(self.decode_cursor(cursor, sort))
+            order = 'messages_fts.rowid DESC'
+
+        # Фрагменты с подсветкой считаются только для строк страницы
+        rows = self.storage.execute(f'''
+            SELECT m.id, m.message_id, m.chat_id, m.chat_type, m.sender_name, m.datetime,
+                   m.is_echo, m.podio_item_id, m.text,
+                   bm25(messages_fts) AS score,
+                   snippet(messages_fts, 0, '<mark>', '</mark>', '…', 16) AS snippet
+            FROM messages_fts
+            JOIN wazzup_messages m ON m.id = messages_fts.rowid
+            WHERE {' AND '.join(conditions)}
+            ORDER BY {order}
+            LIMIT ?
+        ''', (*params, limit + 1)).fetchall()
+
+        hits = [
+            {
+                'id': row[0],
+                'message_id': row[1],
+                'chat_id': row[2],
+                'chat_type': row[3],
+                'sender_name': row[4],
+                'datetime': row[5],
+                'is_echo': bool(row[6]),
+                'podio_item_id': row[7],
+                'text': row[8],
+                'score': row[9],
+                'snippet': row[10],
+            }
+            for row in rows[:limit]
+        ]
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = hits[-1]
+            next_cursor = self.encode_cursor([last['score'], last['id']] if sort == 'rank' else last['id'])
+        return {'hits': hits, 'next_cursor': next_cursor}
+
+    def rebuild(self):
+        """Перестроение индекса по wazzup_messages"""
+        with self.storage.transaction() as cursor:
+            cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+        logger.info("🔎 Индекс поиска сообщений перестроен")
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Отслеживание сообщений Wazzup и контактов в SQLite
+"""
+
+import logging
+from config import DATABASE_CONFIG
+from storage import create_storage
+from contact_cache import ContactCache
+from dedup import RecentIds
+from migrations import migrate
+from metrics import DB_OPERATION_SECONDS, WEBHOOK_DUPLICATES
+
+logger = logging.getLogger(__name__)
+
+# Порядок статусов доставки Wazzup: запоздавший повтор не откатывает статус назад
+STATUS_ORDER = ('sent', 'delivered', 'read')
+
+# Где хранится статус сообщения: (таблица, колонка messageId Wazzup, колонка статуса)
+STATUS_COLUMNS = (
+    ('wazzup_messages', 'message_id', 'status'),
+    ('outbound_messages', 'wazzup_message_id', 'delivery_status'),
+)
+
+
+class MessageTracker:
+    """Класс для отслеживания обработанных сообщений"""
+
+    def __init__(self, storage=None):
+        self.storage = storage or create_storage(DATABASE_CONFIG)
+        self.db_path = self.storage.db_path
+        self.contacts = ContactCache(
+            max_size=DATABASE_CONFIG.get('contact_cache_size', 10000),
+            ttl=DATABASE_CONFIG.get('contact_cache_ttl', 3600),
+        )
+        # Недавно сохраненные messageId: повторы webhooks отсекаются без обращения к базе
+        self.recent_messages = RecentIds(DATABASE_CONFIG.get('dedup_capacity', 50000))
+        self.init_database()
+        self.warm_contact_cache()
+
+    def init_database(self):
+        """Инициализация базы данных и применение миграций схемы"""
+        try:
+            migrate(self.storage)
+            logger.info("✅ База данных инициализирована")
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка инициализации базы данных: {e}")
+
+    # Контакт вместе с элементом его активной сделки
+    CONTACT_ENTRY_SQL = '''
+        SELECT c.id, c.chat_id, c.chat_type, c.podio_contact_id,
+               (SELECT d.podio_item_id FROM deals d
+                WHERE d.contact_id = c.id AND d.status = 'active' AND d.podio_item_id IS NOT NULL
+                ORDER BY d.id DESC LIMIT 1)
+        FROM contacts c
+    '''
+
+    def warm_contact_cache(self):
+        """Загрузка последних активных контактов в кэш при запуске"""
+        try:
+            rows = self.storage.execute(
+                self.CONTACT_ENTRY_SQL + " ORDER BY c.updated_at DESC, c.id DESC LIMIT ?",
+                (self.contacts.max_size,)
+            ).fetchall()
+
+            # Самые свежие контакты добавляем последними, чтобы они вытеснялись позже
+            for contact_id, chat_id, chat_type, podio_contact_id, deal_item_id in reversed(rows):
+                self.contacts.put(chat_id, chat_type, contact_id, podio_contact_id, deal_item_id)
+
+            logger.info(f"✅ Кэш контактов загружен: {len(rows)}")
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки кэша контактов: {e}")
+
+    def _cache_contact(self, contact_id):
+        """Чтение контакта из базы в кэш, возвращает запись или None"""
+        row = self.storage.execute(self.CONTACT_ENTRY_SQL + " WHERE c.id = ?", (contact_id,)).fetchone()
+        if not row:
+            return None
+        contact_id, chat_id, chat_type, podio_contact_id, deal_item_id = row
+        self.contacts.put(chat_id, chat_type, contact_id, podio_contact_id, deal_item_id)
+        return self.contacts.get_by_contact(contact_id)
+
+    def _remember_contact(self, chat_id, chat_type, contact_id, created):
+        """Занесение контакта в кэш после успешной транзакции"""
+        if created:
+            self.contacts.put(chat_id, chat_type, contact_id)
+        elif not self.contacts.contains(chat_id, chat_type):
+            self._cache_contact(contact_id)
+
+    def invalidate_contact(self, contact_id):
+        """Сброс кэша контакта после изменения контакта или его сделок"""
+        self.contacts.invalidate_contact(contact_id)
+
+    def _insert_message(self, cursor, message_data):
+        """Запись сообщения в рамках текущей транзакции
+
+        Возвращает True для нового сообщения. Уже сохраненное сообщение
+        (повторная доставка webhook) не перезаписывается: id, processed_at
+        и podio_item_id остаются прежними, статус меняют только события статусов.
+        """
+        message_id = message_data.get('messageId')
+        # Поиск по уникальному индексу; транзакция записи исключает гонку с другим процессом
+        cursor.execute("SELECT 1 FROM wazzup_messages WHERE message_id = ?", (message_id,))
+        if cursor.fetchone():
+            return False
+
+        cursor.execute('''
+            INSERT INTO wazzup_messages
+            (message_id, channel_id, chat_id, chat_type, sender_name, text,
+             content_uri, message_type, status, datetime, is_echo)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            message_id,
+            message_data.get('channelId'),
+            message_data.get('chatId'),
+            message_data.get('chatType'),
+            message_data.get('contact', {}).get('name', 'Unknown'),
+            message_data.get('text', ''),
+            message_data.get('contentUri', ''),
+            message_data.get('type', 'text'),
+            message_data.get('status', 'unknown'),
+            message_data.get('dateTime'),
+            message_data.get('isEcho', False)
+        ))
+        return True
+
+    def _get_or_create_contact(self, cursor, chat_id, chat_type, name=None):
+        """Поиск или создание контакта в рамках текущей транзакции
+
+        Возвращает (contact_id, created).
+        """
+        cached = self.contacts.get(chat_id, chat_type)
+        if cached:
+            return cached['contact_id'], False
+
+        cursor.execute("SELECT id FROM contacts WHERE chat_id = ? AND chat_type = ?", (chat_id, chat_type))
+        contact = cursor.fetchone()
+        if contact:
+            return contact[0], False
+
+        cursor.execute('''
+            INSERT INTO contacts (chat_id, chat_type, name)
+            VALUES (?, ?, ?)
+        ''', (chat_id, chat_type, name or 'Unknown'))
+        return cursor.lastrowid, True
+
+    @DB_OPERATION_SECONDS.timed(operation='save_wazzup_message')
+    def save_wazzup_message(self, message_data):
+        """Сохранение сообщения из Wazzup"""
+        try:
+            with self.storage.transaction() as cursor:
+                self._insert_message(cursor, message_data)
+            self.recent_messages.add_many([message_data.get('messageId')])
+
+            logger.info("✅ Сообщение %s сохранено", message_data.get('messageId'), extra={'event': 'message.saved'})
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения сообщения: {e}")
+            return False
+
+    @DB_OPERATION_SECONDS.timed(operation='get_or_create_contact')
+    def get_or_create_contact(self, chat_id, chat_type, name=None):
+        """Получение или создание контакта"""
+        try:
+            with self.storage.transaction() as cursor:
+                contact_id, created = self._get_or_create_contact(cursor, chat_id, chat_type, name)
+
+            self._remember_contact(chat_id, chat_type, contact_id, created)
+            if created:
+                logger.info(f"✅ Создан новый контакт {contact_id} для {chat_type}:{chat_id}")
+            return contact_id
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка работы с контактом: {e}")
+            return None
+
+    @DB_OPERATION_SECONDS.timed(operation='save_webhook_batch')
+    def save_webhook_batch(self, messages):
+        """Сохранение сообщений и контактов из одного webhook одной транзакцией
+
+        Возвращает список пар (message, contact_id) только для новых
+        сообщений в исходном порядке или None при ошибке записи. Повторно
+        доставленные сообщения пропускаются, поэтому повтор webhook не
+        порождает повторной записи в Podio.
+        """
+        if not messages:
+            return []
+
+        messages, repeated = self.recent_messages.split(messages, lambda message: message.get('messageId'))
+        if repeated:
+            WEBHOOK_DUPLICATES.inc(len(repeated), stage='memory')
+        if not messages:
+            return []
+
+        processed = []
+        created_contacts = []
+        duplicates = 0
+        try:
+            with self.storage.transaction() as cursor:
+                contacts = {}
+                for message in messages:
+                    if not self._insert_message(cursor, message):
+                        # Уже сохранено ранее (другим процессом или до перезапуска)
+                        duplicates += 1
+                        continue
+
+                    chat_id = message.get('chatId')
+                    chat_type = message.get('chatType')
+                    key = (chat_id, chat_type)
+                    if key not in contacts:
+                        sender_name = message.get('contact', {}).get('name', 'Unknown')
+                        contact_id, created = self._get_or_create_contact(cursor, chat_id, chat_type, sender_name)
+                        contacts[key] = (contact_id, created)
+                        if created:
+                            created_contacts.append((contact_id, chat_type, chat_id))
+
+                    processed.append((message, contacts[key][0]))
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка пакетного сохранения сообщений: {e}")
+            return None
+
+        for (chat_id, chat_type), (contact_id, created) in contacts.items():
+            self._remember_contact(chat_id, chat_type, contact_id, created)
+        self.recent_messages.add_many(message.get('messageId') for message in messages)
+
+        if duplicates:
+            WEBHOOK_DUPLICATES.inc(duplicates, stage='index')
+            logger.info(f"♻️ Пропущено повторно доставленных сообщений: {duplicates}")
+        logger.info("✅ Сохранено сообщений: %d", len(processed), extra={'event': 'message.saved'})
+        for contact_id, chat_type, chat_id in created_contacts:
+            logger.info("✅ Создан новый контакт %s для %s:%s", contact_id, chat_type, chat_id,
+                        extra={'event': 'contact.created'})
+        return processed
+
+    @DB_OPERATION_SECONDS.timed(operation='update_statuses')
+    def update_statuses(self, statuses):
+        """Обновление статусов доставки из webhook Wazzup на месте
+
+        Статус меняется только у существующих строк входящих и исходящих
+        сообщений, без перезаписи остальных полей. Возвращает количество
+        измененных строк или None при ошибке.
+        """
+        updated = 0
+        try:
+            with self.storage.transaction() as cursor:
+                for entry in statuses:
+                    message_id = entry.get('messageId')
+                    status = entry.get('status')
+                    if not message_id or not status:
+                        continue
+                    # Статус не откатывается назад (read -> delivered) при запоздавшем повторе
+                    later = STATUS_ORDER[STATUS_ORDER.index(status) + 1:] if status in STATUS_ORDER else ()
+                    for table, key, column in STATUS_COLUMNS:
+                        sql = f"UPDATE {table} SET {column} = ? WHERE {key} = ? AND {column} IS NOT ?"
+                        if later:
+                            sql += f" AND COALESCE({column}, '') NOT IN ({', '.join('?' * len(later))})"
+                        cursor.execute(sql, (status, message_id, status, *later))
+                        updated += cursor.rowcount
+            return updated
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления статусов сообщений: {e}")
+            return None
+
+    @DB_OPERATION_SECONDS.timed(operation='get_chat_for_item')
+    def get_chat_for_item(self, podio_item_id):
+        """Поиск чата клиента по элементу Podio (сделке или сообщению)
+
+        Возвращает словарь с channel_id, chat_id и chat_type или None.
+        """
+        try:
+            item_id = str(podio_item_id)
+            row = self.storage.execute('''
+                SELECT c.chat_id, c.chat_type
+                FROM deals d JOIN contacts c ON c.id = d.contact_id
+                WHERE d.podio_item_id = ?
+                ORDER BY d.id DESC LIMIT 1
+            ''', (item_id,)).fetchone()
+
+            if not row:
+                row = self.storage.execute('''
+                    SELECT chat_id, chat_type FROM wazzup_messages
+                    WHERE podio_item_id = ?
+                    ORDER BY id DESC LIMIT 1
+                ''', (item_id,)).fetchone()
+
+            if not row:
+                return None
+
+            chat_id, chat_type = row
+            # Отвечаем в тот канал, из которого клиент писал последним
+            channel = self.storage.execute('''
+                SELECT channel_id FROM wazzup_messages
+                WHERE chat_id = ? AND chat_type = ?
+                ORDER BY id DESC LIMIT 1
+            ''', (chat_id, chat_type)).fetchone()
+
+            return {
+                'channel_id': channel[0] if channel else None,
+                'chat_id': chat_id,
+                'chat_type': chat_type,
+            }
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка поиска чата для элемента {podio_item_id}: {e}")
+            return None
+
+    @DB_OPERATION_SECONDS.timed(operation='has_recent_messages')
+    def has_recent_messages(self, seconds):
+        """Были ли входящие сообщения за последние seconds секунд"""
+        try:
+            row = self.storage.execute('''
+                SELECT 1 FROM wazzup_messages
+                WHERE processed_at >= datetime('now', ?)
+                LIMIT 1
+            ''', (f"-{int(seconds)} seconds",)).fetchone()
+            return row is not None
+        except Exception as e:
+            logger.error(f"❌ Ошибка проверки активности: {e}")
+            return False
+
+    @DB_OPERATION_SECONDS.timed(operation='get_active_deal_item')
+    def get_active_deal_item(self, contact_id):
+        """ID элемента Podio активной сделки контакта или None"""
+        try:
+            entry = self.contacts.get_by_contact(contact_id) or self._cache_contact(contact_id)
+            return entry['deal_item_id'] if entry else None
+        except Exception as e:
+            logger.error(f"❌ Ошибка поиска сделки контакта {contact_id}: {e}")
+            return None
+
+    @DB_OPERATION_SECONDS.timed(operation='get_unsynced_messages')
+    def get_unsynced_messages(self, seconds):
+        """Входящие сообщения без элемента Podio, сохраненные за последние seconds секунд
+
+        Возвращает список словарей в порядке сохранения (с contact_id) или
+        None при ошибке.
+        """
+        try:
+            rows = self.storage.execute('''
+                SELECT c.id, m.chat_id, m.chat_type, m.message_id, m.sender_name, m.text,
+                       m.content_uri, m.message_type
+                FROM wazzup_messages m
+                JOIN contacts c ON c.chat_id = m.chat_id AND c.chat_type = m.chat_type
+                WHERE m.podio_item_id IS NULL AND COALESCE(m.is_echo, 0) = 0
+                  AND m.processed_at >= datetime('now', ?)
+                ORDER BY m.id
+            ''', (f"-{int(seconds)} seconds",)).fetchall()
+            return [{
+                'contact_id': contact_id,
+                'chat_id': chat_id,
+                'chat_type': chat_type,
+                'message_id': message_id,
+                'sender_name': sender_name or 'Unknown',
+                'text': text or '',
+                'content_uri': content_uri or '',
+                'type': message_type or 'text',
+            } for contact_id, chat_id, chat_type, message_id, sender_name, text, content_uri, message_type in rows]
+        except Exception as e:
+            logger.error(f"❌ Ошибка поиска непереданных сообщений: {e}")
+            return None
+
+    @DB_OPERATION_SECONDS.timed(operation='get_synced_messages')
+    def get_synced_messages(self, message_ids):
+        """messageId из message_ids, уже переданные в Podio (множество)"""
+        message_ids = list(message_ids)
+        if not message_ids:
+            return set()
+        placeholders = ', '.join('?' for _ in message_ids)
+        rows = self.storage.execute(
+            f"SELECT message_id FROM wazzup_messages WHERE podio_item_id IS NOT NULL AND message_id IN ({placeholders})",
+            message_ids
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def begin_comment_post(self, external_id, podio_item_id):
+        """Отметка начала записи комментария external_id
+
+        Возвращает True, если запись этого комментария уже начиналась
+        (ответ Podio мог быть потерян), и False для первой попытки.
+        """
+        with self.storage.transaction() as cursor:
+            cursor.execute(
+                "INSERT OR IGNORE INTO podio_comment_posts (external_id, item_id) VALUES (?, ?)",
+                (external_id, str(podio_item_id))
+            )
+            return cursor.rowcount == 0
+
+    @DB_OPERATION_SECONDS.timed(operation='mark_messages_synced')
+    def mark_messages_synced(self, message_ids, podio_item_id, external_id=None):
+        """Отметка сообщений, переданных в элемент Podio, и завершение записи комментария external_id"""
+        try:
+            with self.storage.transaction() as cursor:
+                cursor.executemany(
+                    "UPDATE wazzup_messages SET podio_item_id = ? WHERE message_id = ?",
+                    [(str(podio_item_id), message_id) for message_id in message_ids]
+                )
+                if external_id:
+                    cursor.execute("DELETE FROM podio_comment_posts WHERE external_id = ?", (external_id,))
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка отметки сообщений: {e}")
+            return False
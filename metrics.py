@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Метрики интеграции в формате Prometheus
+- Счетчики, гистограммы задержек и gauges с метками
+- Текстовый формат для endpoint /metrics
+- При выключенных метриках запись сводится к одной проверке флага
+"""
+
+import re
+import time
+import bisect
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+PREFIX = 'podio_wazzup_'
+
+# Границы гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Числа в путях API заменяются на {id}, чтобы не плодить временные ряды
+PATH_IDS = re.compile(r'/\d+(?=/|$)')
+
+
+def endpoint_label(path):
+    """Шаблон пути для метки endpoint: /comment/item/123/ -> /comment/item/{id}/"""
+    return PATH_IDS.sub('/{id}', path.split('?', 1)[0])
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    """Набор метрик процесса"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, documentation, tuple(labelnames), **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self._register(Gauge, name, documentation, labelnames, callback=callback)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {PREFIX}{metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {PREFIX}{metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{PREFIX}{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in values
+        ]
+
+
+class Gauge(Metric):
+    """Текущее значение; callback вызывается при каждом сборе метрик
+
+    callback возвращает число (без меток) или словарь {значения меток: число}.
+    """
+    kind = 'gauge'
+
+    def __init__(self, registry, name, documentation, labelnames, callback=None):
+        super().__init__(registry, name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.callback:
+            try:
+                result = self.callback()
+            except Exception:
+                # Источник недоступен (например, база занята) - пропускаем метрику
+                return []
+            values = result.items() if isinstance(result, dict) else [((), result)]
+            values = [((key,) if not isinstance(key, tuple) else key, value) for key, value in values]
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        return [
+            f"{PREFIX}{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values) if value is not None
+        ]
+
+
+class Histogram(Metric):
+    """Распределение значений (обычно задержек в секундах)"""
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замер длительности блока with"""
+        if not self.registry.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def timed(self, **labels):
+        """Декоратор замера длительности функции"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.registry.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, **labels)
+            return wrapper
+        return decorator
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+        lines = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{PREFIX}{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{PREFIX}{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{PREFIX}{self.name}_count{labels} {count}")
+        return lines
+
+
+# Общий набор метрик процесса; main.py включает или выключает его по конфигурации
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_seconds', 'Время обработки входящих запросов Flask', ('endpoint', 'method', 'status'))
+UPSTREAM_REQUEST_SECONDS = REGISTRY.histogram(
+    'upstream_request_seconds', 'Время запросов к внешним API (с учетом повторов)',
+    ('upstream', 'method', 'endpoint', 'status'))
+UPSTREAM_RETRIES = REGISTRY.counter(
+    'upstream_retries', 'Повторы запросов к внешним API', ('upstream', 'reason'))
+DB_OPERATION_SECONDS = REGISTRY.histogram(
+    'db_operation_seconds', 'Время операций MessageTracker с базой', ('operation',))
+QUEUE_TASK_SECONDS = REGISTRY.histogram(
+    'queue_task_seconds', 'Время выполнения задач очередей', ('queue', 'kind', 'result'))
+WEBHOOK_DUPLICATES = REGISTRY.counter(
+    'webhook_duplicates', 'Повторно доставленные сообщения Wazzup', ('stage',))
+POLL_CYCLE_SECONDS = REGISTRY.histogram(
+    'poll_cycle_seconds', 'Длительность цикла polling комментариев Podio', (),
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+POLL_COMMENTS_SENT = REGISTRY.counter(
+    'poll_comments_sent', 'Комментарии, переданные клиентам циклом polling')
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Версионные миграции схемы базы данных
+- Номер примененной версии хранится в таблице schema_version
+- Миграции применяются по порядку, каждая в своей транзакции
+- Новая миграция добавляется в конец списка MIGRATIONS
+"""
+
+import logging
+
+from work_queue import shard_of
+
+logger = logging.getLogger(__name__)
+
+
+def migration_base_schema(cursor):
+    """Базовые таблицы (совместимо с базами, созданными до миграций)"""
+    # Таблица для сообщений Wazzup
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS wazzup_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id TEXT UNIQUE,
+            channel_id TEXT,
+            chat_id TEXT,
+            chat_type TEXT,
+            sender_name TEXT,
+            text TEXT,
+            content_uri TEXT,
+            message_type TEXT,
+            status TEXT,
+            datetime TEXT,
+            is_echo BOOLEAN,
+            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            podio_item_id TEXT
+        )
+    ''')
+
+    # Таблица для контактов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS contacts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT UNIQUE,
+            chat_type TEXT,
+            name TEXT,
+            phone TEXT,
+            username TEXT,
+            podio_contact_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Таблица для сделок
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            contact_id INTEGER,
+            podio_item_id TEXT,
+            status TEXT DEFAULT 'active',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (contact_id) REFERENCES contacts (id)
+        )
+    ''')
+
+    # Курсоры синхронизации комментариев Podio
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_cursors (
+            app_id TEXT PRIMARY KEY,
+            last_event_on TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Комментарии Podio, уже отправленные клиентам
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS podio_comments (
+            comment_id TEXT PRIMARY KEY,
+            item_id TEXT,
+            text TEXT,
+            status TEXT,
+            attempts INTEGER DEFAULT 0,
+            error TEXT,
+            created_on TEXT,
+            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def migration_contacts_chat_key(cursor):
+    """Уникальность контакта по паре (chat_id, chat_type) вместо одного chat_id
+
+    Один и тот же номер может писать и в WhatsApp, и в Telegram, поэтому
+    таблица пересоздается без UNIQUE на chat_id.
+    """
+    cursor.execute('''
+        CREATE TABLE contacts_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL,
+            chat_type TEXT,
+            name TEXT,
+            phone TEXT,
+            username TEXT,
+            podio_contact_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO contacts_new
+        (id, chat_id, chat_type, name, phone, username, podio_contact_id, created_at, updated_at)
+        SELECT id, chat_id, chat_type, name, phone, username, podio_contact_id, created_at, updated_at
+        FROM contacts
+    ''')
+    cursor.execute("DROP TABLE contacts")
+    cursor.execute("ALTER TABLE contacts_new RENAME TO contacts")
+    cursor.execute("CREATE UNIQUE INDEX idx_contacts_chat ON contacts (chat_id, chat_type)")
+
+
+def migration_query_indexes(cursor):
+    """Индексы под запросы интеграции"""
+    # История переписки чата и последний канал чата
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_chat_datetime ON wazzup_messages (chat_id, datetime)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON wazzup_messages (chat_id, chat_type, id)")
+    # Поиск чата по элементу Podio
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_podio_item ON wazzup_messages (podio_item_id)")
+    # Проверка активности и очистка старых записей
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_processed_at ON wazzup_messages (processed_at)")
+    # Сделки контакта и поиск сделки по элементу Podio
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_deals_contact ON deals (contact_id, status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_deals_podio_item ON deals (podio_item_id)")
+    # Повторная отправка неудачных комментариев
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_podio_comments_status ON podio_comments (status)")
+
+
+def migration_outbound_messages(cursor):
+    """Исходящие сообщения клиентам и статус их доставки"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbound_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            source TEXT,
+            channel_id TEXT,
+            chat_id TEXT,
+            chat_type TEXT,
+            part INTEGER DEFAULT 1,
+            parts INTEGER DEFAULT 1,
+            text TEXT,
+            status TEXT DEFAULT 'queued',
+            attempts INTEGER DEFAULT 0,
+            error TEXT,
+            wazzup_message_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbound_status ON outbound_messages (status, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbound_source ON outbound_messages (source)")
+
+
+def migration_leases(cursor):
+    """Аренды для выбора ведущего процесса"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            acquired_at REAL
+        )
+    ''')
+
+
+def migration_delivery_statuses(cursor):
+    """Статусы доставки Wazzup (delivered/read/error) для исходящих сообщений"""
+    cursor.execute("ALTER TABLE outbound_messages ADD COLUMN delivery_status TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbound_wazzup_id ON outbound_messages (wazzup_message_id)")
+
+
+def migration_media_files(cursor):
+    """Кэш вложений: файлы по хешу содержимого и их источники в Wazzup"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS media_files (
+            sha256 TEXT PRIMARY KEY,
+            size INTEGER,
+            mime_type TEXT,
+            filename TEXT,
+            podio_file_id TEXT,
+            uses INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS media_sources (
+            content_uri TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_media_sources_created ON media_sources (created_at)")
+
+
+# Текст для полнотекстового индекса: unicode61 не считает "ё" и "е" одной буквой
+FTS_TEXT = "replace(replace(COALESCE({0}.text, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+def migration_message_search(cursor):
+    """Полнотекстовый индекс FTS5 по тексту сообщений и имени отправителя"""
+    # Индекс хранит только токены, текст читается из wazzup_messages через представление
+    cursor.execute(f'''
+        CREATE VIEW IF NOT EXISTS messages_fts_source AS
+        SELECT id, {FTS_TEXT.format('wazzup_messages')} AS text, sender_name FROM wazzup_messages
+    ''')
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            text, sender_name,
+            content='messages_fts_source', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON wazzup_messages BEGIN
+            INSERT INTO messages_fts (rowid, text, sender_name)
+            VALUES (new.id, {FTS_TEXT.format('new')}, new.sender_name);
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON wazzup_messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text, sender_name)
+            VALUES ('delete', old.id, {FTS_TEXT.format('old')}, old.sender_name);
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF text, sender_name ON wazzup_messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text, sender_name)
+            VALUES ('delete', old.id, {FTS_TEXT.format('old')}, old.sender_name);
+            INSERT INTO messages_fts (rowid, text, sender_name)
+            VALUES (new.id, {FTS_TEXT.format('new')}, new.sender_name);
+        END
+    ''')
+    # Индекс для уже сохраненных сообщений
+    cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+
+def migration_podio_comment_posts(cursor):
+    """Комментарии Podio, запись которых начата: повтор задачи проверяет, не создан ли уже комментарий"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS podio_comment_posts (
+            external_id TEXT PRIMARY KEY,
+            item_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+# Таблицы очередей WorkQueue: создаются самой очередью при запуске
+QUEUE_TABLES = ('work_queue', 'outbound_queue')
+
+
+def migration_queue_shards(cursor):
+    """Шард задачи очереди по chatId для режима разделов (serve.py partition)"""
+    for table in QUEUE_TABLES:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        if not cursor.fetchone():
+            # Очередь еще не создавалась, WorkQueue создаст таблицу сразу с колонкой shard
+            continue
+        columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+        if 'shard' in columns:
+            continue
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN shard INTEGER DEFAULT 0")
+        rows = cursor.execute(f"SELECT id, partition_key FROM {table}").fetchall()
+        cursor.executemany(
+            f"UPDATE {table} SET shard = ? WHERE id = ?",
+            [(shard_of(key), item_id) for item_id, key in rows]
+        )
+
+
+# (версия, описание, функция) - порядок и номера менять нельзя
+MIGRATIONS = [
+    (1, 'базовая схема', migration_base_schema),
+    (2, 'контакты по (chat_id, chat_type)', migration_contacts_chat_key),
+    (3, 'индексы для запросов', migration_query_indexes),
+    (4, 'исходящие сообщения', migration_outbound_messages),
+    (5, 'аренды ведущего процесса', migration_leases),
+    (6, 'статусы доставки исходящих', migration_delivery_statuses),
+    (7, 'кэш вложений', migration_media_files),
+    (8, 'полнотекстовый поиск сообщений', migration_message_search),
+    (9, 'начатые комментарии Podio', migration_podio_comment_posts),
+    (10, 'шарды задач очередей', migration_queue_shards),
+]
+
+
+def current_version(storage):
+    """Номер последней примененной миграции"""
+    storage.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = storage.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(storage, target=None):
+    """Применение недостающих миграций, возвращает список примененных версий"""
+    current_version(storage)
+
+    applied = []
+    for version, name, migration in MIGRATIONS:
+        if target is not None and version > target:
+            break
+
+        with storage.transaction() as cursor:
+            # Проверка внутри транзакции: несколько процессов могут стартовать одновременно
+            cursor.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,))
+            if cursor.fetchone():
+                continue
+
+            migration(cursor)
+            cursor.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+
+        applied.append(version)
+        logger.info(f"🔧 Применена миграция {version}: {name}")
+
+    return applied
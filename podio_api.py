@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Клиент Podio API
+"""
+
+import time
+import logging
+from config import PODIO_CONFIG
+from http_transport import HttpTransport
+from podio_auth import TokenManager
+
+logger = logging.getLogger(__name__)
+
+
+class PodioAPI:
+    """Класс для работы с Podio API"""
+    
+    def __init__(self):
+        self.http = HttpTransport.from_config('Podio', PODIO_CONFIG, 'https://api.podio.com')
+        self.auth = TokenManager(self.http, PODIO_CONFIG, PODIO_CONFIG.get('token_refresh_margin', 300))
+        # Кэш метаданных (podio_metadata.PodioMetadata), задается при запуске
+        self.metadata = None
+        
+    @property
+    def access_token(self):
+        return self.auth.access_token
+    
+    def authenticate(self):
+        """Аутентификация в Podio и запуск фонового обновления токена"""
+        if self.auth.refresh(force=True):
+            logger.info("✅ Успешная аутентификация в Podio")
+            self.auth.start()
+            return True
+        logger.error("❌ Ошибка аутентификации Podio")
+        return False
+    
+    def ensure_authenticated(self):
+        """Проверка и обновление токена при необходимости"""
+        return self.auth.token() is not None
+    
+    def get_headers(self, token=None):
+        """Получение заголовков для API запросов"""
+        return {
+            'Authorization': f'Bearer {token or self.access_token}',
+            'Content-Type': 'application/json'
+        }
+    
+    def request(self, method, path, **kwargs):
+        """Запрос с токеном; при 401 токен обновляется и запрос повторяется один раз"""
+        extra_headers = kwargs.pop('headers', {})
+        token = self.auth.token()
+        response = self.http.request(method, path, headers={**self.get_headers(token), **extra_headers}, **kwargs)
+        if response.status_code != 401:
+            return response
+        
+        logger.warning(f"⚠️ Podio отклонил токен ({method} {path}), обновляем")
+        self.auth.invalidate(token)
+        token = self.auth.token()
+        if token is None:
+            return response
+        return self.http.request(method, path, headers={**self.get_headers(token), **extra_headers}, **kwargs)
+    
+    def create_item(self, app_id, fields, external_id=None):
+        """Создание нового элемента в приложении
+
+        Все поля передаются одним запросом; external_id позволяет найти
+        элемент, если ответ на создание был потерян.
+        """
+        if not self.ensure_authenticated():
+            return None
+            
+        url = f"/item/app/{app_id}/"
+        if self.metadata:
+            # Названия полей -> external_id по кэшу, без запросов к Podio
+            fields = self.metadata.item_fields(app_id, fields)
+        data = {
+            'fields': fields
+        }
+        if external_id:
+            data['external_id'] = external_id
+        
+        try:
+            response = self.request('POST', url, json=data)
+            if response.status_code == 200:
+                item_data = response.json()
+                logger.info(f"✅ Создан элемент {item_data.get('item_id')} в приложении {app_id}")
+                return item_data
+            else:
+                logger.error(f"❌ Ошибка создания элемента: {response.status_code}")
+                return None
+        except Exception as e:
+            logger.error(f"❌ Исключение при создании элемента: {e}")
+            return None
+    
+    def get_item_by_external_id(self, app_id, external_id):
+        """Элемент приложения по external_id: словарь, {} если элемента нет, None при ошибке"""
+        if not self.ensure_authenticated():
+            return None
+        
+        try:
+            response = self.request('GET', f"/item/app/{app_id}/external_id/{external_id}")
+            if response.status_code == 200:
+                return response.json()
+            elif response.status_code == 404:
+                return {}
+            else:
+                logger.error(f"❌ Ошибка поиска элемента {external_id}: {response.status_code}")
+                return None
+        except Exception as e:
+            logger.error(f"❌ Исключение при поиске элемента {external_id}: {e}")
+            return None
+    
+    def add_comment_to_item(self, app_id, item_id, comment_text, file_ids=None, external_id=None):
+        """Добавление комментария к элементу (с прикрепленными файлами file_ids)"""
+        if not self.ensure_authenticated():
+            return False
+            
+        url = f"/comment/app/{app_id}/{item_id}/"
+        data = {
+            'value': comment_text,
+            'external_id': external_id or f"wazzup_{int(time.time())}"
+        }
+        if file_ids:
+            data['file_ids'] = [int(file_id) for file_id in file_ids]
+        
+        try:
+            response = self.request('POST', url, json=data)
+            if response.status_code == 200:
+                logger.info(f"✅ Комментарий добавлен к элементу {item_id}")
+                return True
+            else:
+                logger.error(f"❌ Ошибка добавления комментария: {response.status_code}")
+                return False
+        except Exception as e:
+            logger.error(f"❌ Исключение при добавлении комментария: {e}")
+            return False
+    
+    def upload_file(self, body):
+        """Выгрузка файла (multipart тело, отправляемое потоком), возвращает file_id"""
+        if not self.ensure_authenticated():
+            return None
+        
+        try:
+            response = self.request('POST', '/file/', data=body, headers={'Content-Type': body.content_type})
+            if response.status_code == 200:
+                file_id = response.json().get('file_id')
+                logger.info(f"✅ Файл выгружен в Podio: {file_id}")
+                return file_id
+            else:
+                logger.error(f"❌ Ошибка выгрузки файла: {response.status_code}")
+                return None
+        except Exception as e:
+            logger.error(f"❌ Исключение при выгрузке файла: {e}")
+            return None
+    
+    def copy_file(self, file_id):
+        """Копия уже выгруженного файла (без повторной передачи содержимого)"""
+        if not self.ensure_authenticated():
+            return None
+        
+        try:
+            response = self.request('POST', f"/file/{file_id}/copy")
+            if response.status_code == 200:
+                return response.json().get('file_id')
+            else:
+                logger.error(f"❌ Ошибка копирования файла {file_id}: {response.status_code}")
+                return None
+        except Exception as e:
+            logger.error(f"❌ Исключение при копировании файла: {e}")
+            return None
+    
+    def filter_items(self, app_id, filters=None, sort_by='last_event_on', sort_desc=False, limit=100, offset=0):
+        """Получение страницы элементов приложения по фильтру"""
+        if not self.ensure_authenticated():
+            return None
+            
+        url = f"/item/app/{app_id}/filter/"
+        data = {
+            'filters': filters or {},
+            'sort_by': sort_by,
+            'sort_desc': sort_desc,
+            'limit': limit,
+            'offset': offset
+        }
+        
+        try:
+            response = self.request('POST', url, json=data)
+            if response.status_code == 200:
+                return response.json()
+            else:
+                logger.error(f"❌ Ошибка фильтрации элементов: {response.status_code}")
+                return None
+        except Exception as e:
+            logger.error(f"❌ Исключение при фильтрации элементов: {e}")
+            return None
+    
+    def get_item_comments(self, item_id, limit=100, offset=0):
+        """Получение страницы комментариев элемента (от старых к новым)"""
+        if not self.ensure_authenticated():
+            return None
+            
+        url = f"/comment/item/{item_id}/"
+        params = {
+            'limit': limit,
+            'offset': offset
+        }
+        
+        try:
+            response = self.request('GET', url, params=params)
+            if response.status_code == 200:
+                return response.json()
+            else:
+                logger.error(f"❌ Ошибка получения комментариев: {response.status_code}")
+                return None
+        except Exception as e:
+            logger.error(f"❌ Исключение при получении комментариев: {e}")
+            return None
+    
+    def has_item_comment(self, item_id, external_id, page_size=100):
+        """Есть ли у элемента комментарий с external_id (None при ошибке)"""
+        offset = 0
+        while True:
+            comments = self.get_item_comments(item_id, limit=page_size, offset=offset)
+            if comments is None:
+                return None
+            if any(comment.get('external_id') == external_id for comment in comments):
+                return True
+            if len(comments) < page_size:
+                return False
+            offset += page_size
+    
+    def get_comment(self, comment_id):
+        """Получение комментария по ID"""
+        if not self.ensure_authenticated():
+            return None
+            
+        url = f"/comment/{comment_id}"
+        
+        try:
+            response = self.request('GET', url)
+            if response.status_code == 200:
+                return response.json()
+            else:
+                logger.error(f"❌ Ошибка получения комментария {comment_id}: {response.status_code}")
+                return None
+        except Exception as e:
+            logger.error(f"❌ Исключение при получении комментария: {e}")
+            return None
+    
+    def get_hooks(self, app_id):
+        """Список hooks приложения"""
+        if not self.ensure_authenticated():
+            return None
+            
+        url = f"/hook/app/{app_id}/"
+        
+        try:
+            response = self.request('GET', url)
+            if response.status_code == 200:
+                return response.json()
+            else:
+                logger.error(f"❌ Ошибка получения hooks: {response.status_code}")
+                return None
+        except Exception as e:
+            logger.error(f"❌ Исключение при получении hooks: {e}")
+            return None
+    
+    def create_hook(self, app_id, hook_url, hook_type):
+        """Регистрация hook приложения (comment.create, item.update и т.д.)"""
+        if not self.ensure_authenticated():
+            return None
+            
+        url = f"/hook/app/{app_id}/"
+        data = {
+            'url': hook_url,
+            'type': hook_type
+        }
+        
+        try:
+            response = self.request('POST', url, json=data)
+            if response.status_code == 200:
+                hook_data = response.json()
+                logger.info(f"✅ Hook {hook_type} зарегистрирован для приложения {app_id}")
+                return hook_data
+            else:
+                logger.error(f"❌ Ошибка регистрации hook: {response.status_code}")
+                return None
+        except Exception as e:
+            logger.error(f"❌ Исключение при регистрации hook: {e}")
+            return None
+    
+    def request_hook_verification(self, hook_id):
+        """Запрос подтверждения hook: Podio отправит hook.verify на его URL"""
+        if not self.ensure_authenticated():
+            return False
+            
+        url = f"/hook/{hook_id}/verify/request"
+        
+        try:
+            response = self.request('POST', url)
+            if response.status_code in (200, 204):
+                logger.info(f"📨 Запрошено подтверждение hook {hook_id}")
+                return True
+            else:
+                logger.error(f"❌ Ошибка запроса подтверждения hook: {response.status_code}")
+                return False
+        except Exception as e:
+            logger.error(f"❌ Исключение при запросе подтверждения hook: {e}")
+            return False
+    
+    def validate_hook(self, hook_id, code):
+        """Подтверждение hook кодом из запроса hook.verify"""
+        if not self.ensure_authenticated():
+            return False
+            
+        url = f"/hook/{hook_id}/verify/validate"
+        data = {
+            'code': code
+        }
+        
+        try:
+            response = self.request('POST', url, json=data)
+            if response.status_code in (200, 204):
+                logger.info(f"✅ Hook {hook_id} подтвержден")
+                return True
+            else:
+                logger.error(f"❌ Ошибка подтверждения hook: {response.status_code}")
+                return False
+        except Exception as e:
+            logger.error(f"❌ Исключение при подтверждении hook: {e}")
+            return False
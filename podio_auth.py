@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Управление OAuth токеном Podio
+- Одно обновление токена на все потоки (single-flight)
+- Фоновое обновление заранее, до истечения срока
+- refresh_token вместо повторной отправки пароля
+"""
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Минимальная пауза между фоновыми обновлениями токена, секунды
+MIN_REFRESH_INTERVAL = 30
+
+
+class TokenManager:
+    """Токен доступа Podio, общий для всех потоков"""
+
+    def __init__(self, http, config, refresh_margin=300):
+        self.http = http
+        self.config = config
+        self.refresh_margin = refresh_margin
+        self.access_token = None
+        self.refresh_token = None
+        self.expires_at = 0.0
+        self.lifetime = 0.0
+        self.refreshed_at = None
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def valid(self):
+        """Есть ли действующий токен"""
+        return self.access_token is not None and time.monotonic() < self.expires_at
+
+    def token(self):
+        """Действующий токен доступа или None
+
+        Обновление блокирует вызывающий поток, только если токена нет или
+        он уже истек; в остальных случаях его заранее обновляет фоновый поток.
+        """
+        token = self.access_token
+        if token is not None and time.monotonic() < self.expires_at:
+            return token
+        if self.refresh(stale_token=token):
+            return self.access_token
+        return None
+
+    def refresh(self, stale_token=None, force=False):
+        """Обновление токена одним запросом на все потоки
+
+        stale_token - токен, который вызывающий считает устаревшим: если
+        другой поток уже заменил его, пока мы ждали блокировку, второй
+        запрос не отправляется.
+        """
+        with self._lock:
+            if not force and self.access_token != stale_token and self.valid():
+                return True
+
+            if self.refresh_token and self._request_token({
+                'grant_type': 'refresh_token',
+                'refresh_token': self.refresh_token,
+            }):
+                return True
+
+            # refresh_token отозван или еще не получен
+            return self._request_token({
+                'grant_type': 'password',
+                'username': self.config['username'],
+                'password': self.config['password'],
+            })
+
+    def invalidate(self, token):
+        """Отметка токена недействительным после ответа 401"""
+        with self._lock:
+            if self.access_token == token:
+                self.expires_at = 0.0
+
+    def _request_token(self, grant):
+        """Запрос токена в /oauth/token (вызывается под блокировкой)"""
+        data = {
+            'client_id': self.config['client_id'],
+            'client_secret': self.config['client_secret'],
+            **grant,
+        }
+
+        try:
+            response = self.http.post("/oauth/token", data=data)
+            if response.status_code == 200:
+                token_data = response.json()
+                self.access_token = token_data['access_token']
+                self.refresh_token = token_data.get('refresh_token') or self.refresh_token
+                self.lifetime = token_data.get('expires_in', 3600)
+                self.expires_at = time.monotonic() + self.lifetime
+                self.refreshed_at = time.time()
+                self.refreshes += 1
+                self._wakeup.set()
+                logger.info(f"✅ Токен Podio получен ({grant['grant_type']})")
+                return True
+            else:
+                logger.error(f"❌ Ошибка получения токена Podio ({grant['grant_type']}): {response.status_code}")
+                if grant['grant_type'] == 'refresh_token':
+                    self.refresh_token = None
+                return False
+        except Exception as e:
+            logger.error(f"❌ Исключение при получении токена Podio: {e}")
+            return False
+
+    def start(self):
+        """Запуск фонового обновления токена"""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name='podio-token', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        """Обновление токена за refresh_margin секунд до истечения
+
+        Для короткоживущего токена запас не больше половины срока его
+        действия, а между обновлениями не меньше MIN_REFRESH_INTERVAL секунд.
+        """
+        while True:
+            self._wakeup.clear()
+            if self.access_token is None:
+                delay = 30
+            else:
+                margin = min(self.refresh_margin, self.lifetime / 2)
+                delay = self.expires_at - margin - time.monotonic()
+                if self.refreshed_at is not None:
+                    delay = max(delay, self.refreshed_at + MIN_REFRESH_INTERVAL - time.time())
+
+            if delay > 0:
+                # Пробуждаемся раньше, если токен обновили вне этого потока
+                self._wakeup.wait(delay)
+                continue
+
+            if not self.refresh(stale_token=self.access_token):
+                # Старый токен еще действует, пробуем снова чуть позже
+                self._wakeup.wait(min(30, max(5, self.expires_at - time.monotonic())))
+
+    def stats(self):
+        """Возраст и оставшийся срок токена"""
+        return {
+            'valid': self.valid(),
+            'age': round(time.time() - self.refreshed_at, 1) if self.refreshed_at else None,
+            'expires_in': round(max(0.0, self.expires_at - time.monotonic()), 1) if self.access_token else None,
+            'refreshes': self.refreshes,
+        }
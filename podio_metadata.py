@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Метаданные Podio: рабочие области, приложения и поля приложений
+- Запросы к областям и приложениям выполняются параллельно
+- Ответы кэшируются на диске; после ttl проверяются через ETag (304 без тела)
+- При запуске используется кэш любой давности, обновление идет в фоне
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Значение App ID в конфигурации, которое нужно определить по имени приложения
+UNKNOWN = 'UNKNOWN'
+
+
+class PodioMetadata:
+    """Кэш метаданных Podio с параллельной загрузкой"""
+
+    def __init__(self, podio, cache_path=None, ttl=86400, concurrency=8):
+        self.podio = podio
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.concurrency = max(1, concurrency)
+        # путь API -> {'etag', 'data', 'fetched_at'}
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._dirty = False
+        self.counters = {'cached': 0, 'revalidated': 0, 'fetched': 0, 'failed': 0}
+        self.load()
+
+    @classmethod
+    def from_config(cls, podio, config):
+        return cls(
+            podio,
+            cache_path=config.get('metadata_cache'),
+            ttl=config.get('metadata_ttl', 86400),
+            concurrency=config.get('metadata_concurrency', 8),
+        )
+
+    def load(self):
+        """Чтение кэша с диска"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                self._entries = json.load(f).get('entries', {})
+        except Exception as e:
+            logger.warning(f"⚠️ Кэш метаданных Podio не прочитан: {e}")
+
+    def save(self):
+        """Атомарная запись кэша на диск"""
+        if not self.cache_path or not self._dirty:
+            return
+        try:
+            with self._lock:
+                data = json.dumps({'entries': self._entries}, ensure_ascii=False)
+                self._dirty = False
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи кэша метаданных Podio: {e}")
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _get(self, path, stale_ok=False, offline=False):
+        """Ответ GET из кэша или Podio
+
+        stale_ok: использовать кэш любой давности без запроса; offline:
+        только кэш. Если Podio недоступен, возвращается устаревший кэш,
+        а без него - None.
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry and (stale_ok or offline or time.time() - entry['fetched_at'] < self.ttl):
+            self._count('cached')
+            return entry['data']
+        if offline:
+            return None
+
+        headers = {'If-None-Match': entry['etag']} if entry and entry.get('etag') else {}
+        try:
+            response = self.podio.request('GET', path, headers=headers)
+        except Exception as e:
+            response = None
+            logger.warning(f"⚠️ Podio {path}: {e}")
+
+        if response is not None and response.status_code == 304 and entry:
+            self._count('revalidated')
+            with self._lock:
+                entry['fetched_at'] = time.time()
+                self._dirty = True
+            return entry['data']
+
+        if response is not None and response.status_code == 200:
+            self._count('fetched')
+            data = response.json()
+            with self._lock:
+                self._entries[path] = {
+                    'etag': response.headers.get('ETag'),
+                    'data': data,
+                    'fetched_at': time.time(),
+                }
+                self._dirty = True
+            return data
+
+        self._count('failed')
+        if response is not None:
+            logger.warning(f"⚠️ Podio {path}: {response.status_code}")
+        return entry['data'] if entry else None
+
+    def discover(self, stale_ok=False, offline=False):
+        """Рабочие области с приложениями и полями
+
+        Приложения всех областей, затем поля всех приложений запрашиваются
+        параллельно (до concurrency запросов одновременно).
+        """
+        def get(path):
+            return self._get(path, stale_ok, offline)
+
+        spaces = get('/space/') or []
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            app_lists = list(pool.map(lambda space: get(f"/app/space/{space['space_id']}/") or [], spaces))
+            apps = [app for app_list in app_lists for app in app_list]
+            details = dict(zip(
+                (app['app_id'] for app in apps),
+                pool.map(lambda app: get(f"/app/{app['app_id']}") or {}, apps),
+            ))
+        self.save()
+
+        result = []
+        for space, app_list in zip(spaces, app_lists):
+            result.append({
+                'space_id': space['space_id'],
+                'name': space.get('name'),
+                'url': space.get('url'),
+                'url_label': space.get('url_label'),
+                'apps': [self._app_entry(app, details.get(app['app_id'], {})) for app in app_list],
+            })
+        return result
+
+    @staticmethod
+    def _app_entry(app, detail):
+        config = app.get('config') or {}
+        return {
+            'app_id': app['app_id'],
+            'name': config.get('name'),
+            'item_name': config.get('item_name'),
+            'url_label': app.get('url_label'),
+            'fields': [
+                {
+                    'field_id': field.get('field_id'),
+                    'external_id': field.get('external_id'),
+                    'label': (field.get('config') or {}).get('label') or field.get('label'),
+                    'type': field.get('type'),
+                }
+                for field in detail.get('fields', [])
+                if field.get('status', 'active') == 'active'
+            ],
+        }
+
+    def refresh(self):
+        """Обновление кэша (устаревшие записи проверяются через ETag)"""
+        if not self._refreshing.acquire(blocking=False):
+            return None
+        try:
+            start = time.perf_counter()
+            spaces = self.discover()
+            logger.info(
+                f"🔄 Метаданные Podio обновлены: областей {len(spaces)}, "
+                f"приложений {sum(len(space['apps']) for space in spaces)} за {time.perf_counter() - start:.1f} с"
+            )
+            return spaces
+        finally:
+            self._refreshing.release()
+
+    def refresh_async(self):
+        """Фоновое обновление кэша"""
+        threading.Thread(target=self.refresh, name='podio-metadata', daemon=True).start()
+
+    @staticmethod
+    def _space_matches(space, space_url):
+        if not space_url:
+            return True
+        space_url = space_url.strip('/')
+        return (space.get('url') or '').rstrip('/').endswith(space_url) or space.get('url_label') == space_url.split('/')[-1]
+
+    def find_app(self, name, space_url=None, spaces=None):
+        """App ID по имени приложения или url_label (без учета регистра) или None"""
+        wanted = name.casefold()
+        for space in spaces if spaces is not None else self.discover(stale_ok=True):
+            if not self._space_matches(space, space_url):
+                continue
+            for app in space['apps']:
+                if wanted in ((app['name'] or '').casefold(), (app['url_label'] or '').casefold()):
+                    return app['app_id']
+        return None
+
+    def resolve_app_ids(self, config, offline=False):
+        """Заполнение App ID со значением UNKNOWN по config['app_names']
+
+        Использует кэш любой давности; запросы к Podio идут только при
+        пустом кэше и offline=False. Возвращает словарь определенных App ID.
+        """
+        resolved = {}
+        wanted = {key: name for key, name in config.get('app_names', {}).items()
+                  if config.get(key) in (None, '', UNKNOWN)}
+        if not wanted:
+            return resolved
+
+        spaces = self.discover(stale_ok=True, offline=offline)
+        if not spaces:
+            if not offline:
+                logger.warning("⚠️ Метаданные Podio недоступны, App ID не определены")
+            return resolved
+
+        for key, name in wanted.items():
+            app_id = self.find_app(name, config.get('space_url'), spaces)
+            if app_id:
+                config[key] = str(app_id)
+                resolved[key] = config[key]
+            else:
+                logger.warning(f"⚠️ Приложение Podio '{name}' ({key}) не найдено")
+        if resolved:
+            logger.info(f"✅ App ID определены по метаданным: {resolved}")
+        return resolved
+
+    def fields(self, app_id, stale_ok=True):
+        """Поля приложения: external_id -> описание поля"""
+        detail = self._get(f"/app/{app_id}", stale_ok) or {}
+        return {entry['external_id']: entry for entry in self._app_entry({'app_id': app_id}, detail)['fields']}
+
+    def item_fields(self, app_id, values):
+        """Значения полей для create_item с ключами external_id
+
+        Ключом может быть external_id или название поля (без учета регистра).
+        Неизвестные поля отбрасываются с предупреждением, чтобы Podio не
+        отклонил весь элемент.
+        """
+        fields = self.fields(app_id)
+        if not fields:
+            return values
+
+        by_label = {(field['label'] or '').casefold(): external_id for external_id, field in fields.items()}
+        result = {}
+        for key, value in values.items():
+            external_id = key if key in fields else by_label.get(str(key).casefold())
+            if external_id is None:
+                logger.warning(f"⚠️ Поле '{key}' не найдено в приложении {app_id}")
+                continue
+            result[external_id] = value
+        return result
+
+    def stats(self):
+        """Статистика кэша метаданных"""
+        with self._lock:
+            return {'entries': len(self._entries), **self.counters}
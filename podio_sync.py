@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Инкрементальная синхронизация комментариев Podio
+- Курсор по last_event_on для каждого приложения хранится в базе
+- Читаются только элементы, изменившиеся после курсора, постранично
+- Каждый комментарий отправляется в Wazzup не более одного раза
+- Интервал опроса подстраивается под активность переписки
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from config import INTEGRATION_CONFIG
+from command_rules import CommandRouter
+
+logger = logging.getLogger(__name__)
+
+# Формат дат Podio (UTC)
+PODIO_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Сколько раз пробовать отправить комментарий, прежде чем сдаться
+MAX_SEND_ATTEMPTS = 3
+
+# Типы Podio hooks, на которые подписывается интеграция
+HOOK_TYPES = ('comment.create', 'item.update')
+
+# Насколько давние комментарии перечитываются по событию item.update, секунды
+HOOK_LOOKBACK = 3600
+
+
+def podio_now(offset=0):
+    """Текущее время (со сдвигом offset секунд) в формате Podio"""
+    return (datetime.now(timezone.utc) + timedelta(seconds=offset)).strftime(PODIO_DATE_FORMAT)
+
+
+class AdaptiveInterval:
+    """Интервал опроса: короткий при активной переписке, длинный в простое"""
+
+    def __init__(self, min_interval, max_interval, backoff=2.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.current = max_interval
+
+    def record(self, active):
+        """Учет результата цикла, возвращает паузу до следующего"""
+        if active:
+            self.current = self.min_interval
+        else:
+            self.current = min(self.max_interval, self.current * self.backoff)
+        return self.current
+
+
+class CommentSyncEngine:
+    """Доставка новых комментариев Podio клиентам через Wazzup"""
+
+    def __init__(self, podio, wazzup, tracker, app_ids, page_size=100, delivery=None, router=None):
+        self.podio = podio
+        self.wazzup = wazzup
+        self.delivery = delivery
+        self.tracker = tracker
+        self.storage = tracker.storage
+        self.app_ids = app_ids
+        self.page_size = page_size
+        self.router = router or CommandRouter.from_config(INTEGRATION_CONFIG)
+
+    def get_cursor(self, app_id):
+        """Курсор приложения или None, если синхронизации еще не было"""
+        row = self.storage.execute(
+            "SELECT last_event_on FROM sync_cursors WHERE app_id = ?", (str(app_id),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, app_id, last_event_on):
+        """Сохранение курсора приложения"""
+        with self.storage.transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO sync_cursors (app_id, last_event_on, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(app_id) DO UPDATE SET
+                    last_event_on = excluded.last_event_on,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', (str(app_id), last_event_on))
+
+    def run_once(self):
+        """Один цикл синхронизации всех приложений
+
+        Возвращает количество отправленных комментариев.
+        """
+        sent = self.retry_failed()
+        for app_id in self.app_ids:
+            sent += self.sync_app(app_id)
+        return sent
+
+    def sync_app(self, app_id):
+        """Обработка элементов приложения, изменившихся после курсора"""
+        since = self.get_cursor(app_id)
+        if since is None:
+            # Первый запуск: история уже обработана вручную, начинаем с текущего момента
+            self.set_cursor(app_id, podio_now())
+            logger.info(f"🔖 Создан курсор синхронизации для приложения {app_id}")
+            return 0
+
+        newest = since
+        sent = 0
+        offset = 0
+        while True:
+            page = self.podio.filter_items(
+                app_id,
+                filters={'last_event_on': {'from': since}},
+                limit=self.page_size,
+                offset=offset
+            )
+            if page is None:
+                # Курсор не двигаем, элементы будут перечитаны в следующем цикле
+                return sent
+
+            items = page.get('items', [])
+            for item in items:
+                sent += self.sync_item(item['item_id'], since)
+                newest = max(newest, item.get('last_event_on') or newest)
+
+            if len(items) < self.page_size:
+                break
+            offset += self.page_size
+
+        if newest != since:
+            self.set_cursor(app_id, newest)
+        return sent
+
+    def sync_item(self, item_id, since=None):
+        """Обработка новых комментариев одного элемента"""
+        chat = self.tracker.get_chat_for_item(item_id)
+        if not chat:
+            # Элемент не связан с перепиской, комментарии читать незачем
+            return 0
+
+        sent = 0
+        offset = 0
+        while True:
+            comments = self.podio.get_item_comments(item_id, limit=self.page_size, offset=offset)
+            if comments is None:
+                return sent
+
+            for comment in comments:
+                if since and (comment.get('created_on') or '') < since:
+                    continue
+                if self.process_comment(item_id, comment, chat):
+                    sent += 1
+
+            if len(comments) < self.page_size:
+                break
+            offset += self.page_size
+        return sent
+
+    def handle_hook(self, event):
+        """Обработка события Podio hook
+
+        Возвращает количество отправленных комментариев; исключение
+        означает, что событие нужно повторить.
+        """
+        hook_type = event.get('type')
+
+        if hook_type == 'hook.verify':
+            if not self.podio.validate_hook(event.get('hook_id'), event.get('code')):
+                raise RuntimeError(f"не удалось подтвердить hook {event.get('hook_id')}")
+            return 0
+
+        if hook_type == 'comment.create':
+            comment = self.podio.get_comment(event.get('comment_id'))
+            if comment is None:
+                raise RuntimeError(f"не удалось получить комментарий {event.get('comment_id')}")
+            item_id = event.get('item_id') or (comment.get('ref') or {}).get('id')
+            return int(self.process_comment(item_id, comment))
+
+        if hook_type == 'item.update':
+            return self.sync_item(event.get('item_id'), podio_now(-HOOK_LOOKBACK))
+
+        logger.info(f"📥 Пропущено событие Podio {hook_type}")
+        return 0
+
+    def comment_text(self, comment):
+        """Текст комментария для клиента или None"""
+        # Комментарии, добавленные самой интеграцией, обратно не отправляем
+        if (comment.get('external_id') or '').startswith('wazzup_'):
+            return None
+
+        created_by = comment.get('created_by') or {}
+        route = self.router.evaluate(comment.get('value') or '', created_by.get('type'))
+        if route.action == 'exclude':
+            logger.debug(f"🔒 Комментарий {comment.get('comment_id')} исключен командой {route.command}")
+        return route.text
+
+    def process_comment(self, item_id, comment, chat=None):
+        """Отправка комментария клиенту, если он еще не отправлялся"""
+        text = self.comment_text(comment)
+        if text is None:
+            return False
+
+        comment_id = str(comment['comment_id'])
+        if not self._claim(comment_id, item_id, text, comment.get('created_on')):
+            return False
+
+        return self._deliver(comment_id, item_id, text, chat)
+
+    def retry_failed(self):
+        """Повторная отправка комментариев, которые не удалось доставить"""
+        rows = self.storage.execute('''
+            SELECT comment_id, item_id, text FROM podio_comments
+            WHERE status = 'failed' AND attempts < ?
+        ''', (MAX_SEND_ATTEMPTS,)).fetchall()
+
+        sent = 0
+        for comment_id, item_id, text in rows:
+            if self._claim(comment_id, item_id, text, None) and self._deliver(comment_id, item_id, text):
+                sent += 1
+        return sent
+
+    def _claim(self, comment_id, item_id, text, created_on):
+        """Резервирование комментария за текущим процессом
+
+        Возвращает False, если комментарий уже отправлен или отправляется.
+        """
+        with self.storage.transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO podio_comments (comment_id, item_id, text, status, created_on)
+                VALUES (?, ?, ?, 'sending', ?)
+                ON CONFLICT(comment_id) DO UPDATE SET status = 'sending'
+                WHERE podio_comments.status = 'failed' AND podio_comments.attempts < ?
+            ''', (comment_id, str(item_id), text, created_on, MAX_SEND_ATTEMPTS))
+            return cursor.rowcount > 0
+
+    def _finish(self, comment_id, status, error=None):
+        """Фиксация результата отправки"""
+        with self.storage.transaction() as cursor:
+            cursor.execute('''
+                UPDATE podio_comments
+                SET status = ?, error = ?, attempts = attempts + 1, processed_at = CURRENT_TIMESTAMP
+                WHERE comment_id = ?
+            ''', (status, error, comment_id))
+
+    def _deliver(self, comment_id, item_id, text, chat=None):
+        """Отправка текста в чат клиента"""
+        chat = chat or self.tracker.get_chat_for_item(item_id)
+        if not chat or not chat['channel_id']:
+            self._finish(comment_id, 'skipped', 'чат клиента не найден')
+            logger.warning(f"⚠️ Комментарий {comment_id}: чат для элемента {item_id} не найден")
+            return False
+
+        if self.delivery:
+            # Отправкой, повторами и лимитами каналов занимается конвейер доставки
+            key = f"podio_comment:{comment_id}"
+            self.delivery.enqueue(chat['channel_id'], chat['chat_id'], chat['chat_type'], text, key, source=key)
+            self._finish(comment_id, 'queued')
+            logger.info(f"📤 Комментарий {comment_id} поставлен в очередь для {chat['chat_type']} чата {chat['chat_id']}")
+            return True
+
+        result = self.wazzup.send_message(chat['channel_id'], chat['chat_id'], text, chat['chat_type'])
+        if result:
+            self._finish(comment_id, 'sent')
+            logger.info(f"📤 Комментарий {comment_id} отправлен в {chat['chat_type']} чат {chat['chat_id']}")
+            return True
+
+        self._finish(comment_id, 'failed', 'ошибка отправки в Wazzup')
+        return False
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Production запуск интеграции Podio-Wazzup
+- web: прием webhooks несколькими процессами gunicorn
+- background: очереди, отправка ответов, polling и обслуживание базы
+- all: web, где фоновые задачи выполняет один процесс, выбранный через аренду
+- partition: обработка очередей несколькими процессами, разделенными по chatId
+- replay: вернуть в очереди задачи, исчерпавшие попытки, и выйти
+
+Фоновая роль всегда защищена арендой, поэтому лишний запущенный
+процесс не дублирует polling и отправку ответов.
+"""
+
+import sys
+import time
+import signal
+import logging
+import argparse
+import threading
+import multiprocessing
+from config import INTEGRATION_CONFIG
+from log_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def gunicorn_options(args, with_background=False):
+    """Настройки gunicorn по аргументам командной строки"""
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': args.worker_class,
+        'graceful_timeout': args.graceful_timeout,
+        'timeout': max(30, args.graceful_timeout),
+        'keepalive': 5,
+        # Каждый процесс открывает свои соединения SQLite после fork
+        'preload_app': False,
+    }
+
+    def worker_exit(server, worker):
+        # Завершаем фоновые задачи до выхода процесса
+        import main
+        main.election.stop(args.graceful_timeout)
+
+    if with_background:
+        def post_worker_init(worker):
+            import main
+            main.election.start()
+
+        options['post_worker_init'] = post_worker_init
+        options['worker_exit'] = worker_exit
+    return options
+
+
+def run_web(args, with_background=False):
+    """Запуск webhook сервера через gunicorn"""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        logger.error("❌ Для production режима нужен gunicorn: pip install gunicorn")
+        return 1
+
+    class IntegrationServer(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                if value is not None and key in self.cfg.settings:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            import main
+            return main.app
+
+    logger.info(f"🌐 Запуск webhook сервера на {args.bind}: процессов {args.workers}, потоков {args.threads}")
+    IntegrationServer(gunicorn_options(args, with_background)).run()
+    return 0
+
+
+def serve_metrics(port):
+    """HTTP endpoint /metrics для процесса без Flask (роль background)"""
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    from metrics import REGISTRY
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = REGISTRY.render().encode()
+            self.send_response(200 if self.path.startswith('/metrics') else 404)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"📊 Метрики фоновых задач на порту {port}")
+
+
+def run_background(args):
+    """Фоновые задачи в отдельном процессе до SIGTERM/SIGINT"""
+    import main
+
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+
+    main.election.start()
+    stop.wait()
+    main.election.stop(args.graceful_timeout)
+    logger.info("✅ Фоновые задачи остановлены")
+    return 0
+
+
+def run_partition_process(index, count, graceful_timeout):
+    """Один раздел очередей в дочернем процессе до SIGTERM/SIGINT"""
+    setup_logging(INTEGRATION_CONFIG)
+    import main
+
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+
+    main.start_partition(index, count)
+    stop.wait()
+    main.stop_partition(graceful_timeout)
+
+
+def run_partitions(args):
+    """Процессы-разделы очередей с перезапуском упавших
+
+    --index задает номера разделов этого запуска (по умолчанию все), так
+    разделы можно разнести по нескольким службам. Все разделы работают на
+    одном хосте: общий файл SQLite нельзя открывать с нескольких хостов.
+    """
+    count = args.partitions
+    indexes = args.index if args.index is not None else list(range(count))
+    if not indexes or any(not 0 <= index < count for index in indexes):
+        logger.error(f"❌ Номера разделов должны быть от 0 до {count - 1}")
+        return 1
+
+    # Дочерние процессы запускаются с чистым интерпретатором: без потоков и соединений родителя
+    context = multiprocessing.get_context('spawn')
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+
+    processes = {}
+
+    def spawn(index):
+        process = context.Process(
+            target=run_partition_process, args=(index, count, args.graceful_timeout),
+            name=f"partition-{index}", daemon=False,
+        )
+        process.start()
+        processes[index] = process
+
+    for index in indexes:
+        spawn(index)
+    logger.info(f"🧩 Запущено разделов: {len(indexes)} из {count}")
+
+    while not stop.wait(1):
+        for index, process in list(processes.items()):
+            if not process.is_alive():
+                logger.error(f"❌ Раздел {index} завершился с кодом {process.exitcode}, перезапуск")
+                time.sleep(1)
+                spawn(index)
+
+    for process in processes.values():
+        process.terminate()
+    for process in processes.values():
+        process.join(args.graceful_timeout + 5)
+    logger.info("✅ Разделы остановлены")
+    return 0
+
+
+def run_replay(args):
+    """Возврат задач со статусом failed в очереди входящих и исходящих"""
+    import main
+
+    kinds = args.kind or None
+    inbound = main.work_queue.replay_failed(kinds)
+    outbound = main.delivery.queue.replay_failed(kinds)
+    logger.info(f"🔄 Возвращено в очередь задач: входящих {inbound}, исходящих {outbound}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('role', nargs='?', default='all', choices=('web', 'background', 'all', 'partition', 'replay'))
+    parser.add_argument('--bind', default=INTEGRATION_CONFIG.get('server_bind', '0.0.0.0:5000'))
+    parser.add_argument('--workers', type=int, default=INTEGRATION_CONFIG.get('server_workers', 4))
+    parser.add_argument('--threads', type=int, default=INTEGRATION_CONFIG.get('server_threads', 8))
+    parser.add_argument('--worker-class', default=INTEGRATION_CONFIG.get('server_worker_class', 'gthread'),
+                        help="gthread (потоки) или gevent (асинхронный, нужен пакет gevent)")
+    parser.add_argument('--metrics-port', type=int, default=INTEGRATION_CONFIG.get('background_metrics_port'),
+                        help="порт /metrics для роли background")
+    parser.add_argument('--graceful-timeout', type=int, default=INTEGRATION_CONFIG.get('graceful_timeout', 30))
+    parser.add_argument('--partitions', type=int, default=INTEGRATION_CONFIG.get('partitions', 4),
+                        help="для роли partition: общее число разделов")
+    parser.add_argument('--index', type=int, action='append',
+                        help="для роли partition: номер раздела этого запуска (можно несколько, все на одном хосте)")
+    parser.add_argument('--kind', action='append',
+                        help="для роли replay: только задачи этого типа (podio_comment, podio_hook, send)")
+    args = parser.parse_args()
+
+    setup_logging(INTEGRATION_CONFIG)
+
+    if args.role == 'background':
+        return run_background(args)
+    if args.role == 'partition':
+        return run_partitions(args)
+    if args.role == 'replay':
+        return run_replay(args)
+    return run_web(args, with_background=args.role == 'all')
+
+
+if __name__ == "__main__":
+    sys.exit(main())
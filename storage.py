@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Слой хранения SQLite для интеграции Podio-Wazzup
+- Переиспользуемые соединения для каждого потока (закрываются после завершения потока)
+- WAL режим и настраиваемый synchronous
+- Транзакции для пакетной записи
+- Подключаемая реализация хранилища (DATABASE_CONFIG['backend'])
+"""
+
+import sqlite3
+import importlib
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+AUTO_VACUUM_MODES = ('NONE', 'FULL', 'INCREMENTAL')
+
+
+class Storage:
+    """Потокобезопасный доступ к базе данных SQLite"""
+
+    def __init__(self, db_path, journal_mode='WAL', synchronous='NORMAL', busy_timeout=5000,
+                 auto_vacuum='INCREMENTAL'):
+        journal_mode = journal_mode.upper()
+        synchronous = synchronous.upper()
+        auto_vacuum = auto_vacuum.upper()
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"Неизвестный journal_mode: {journal_mode}")
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Неизвестный synchronous: {synchronous}")
+        if auto_vacuum not in AUTO_VACUUM_MODES:
+            raise ValueError(f"Неизвестный auto_vacuum: {auto_vacuum}")
+
+        self.db_path = db_path
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.auto_vacuum = auto_vacuum
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        # Поток -> его соединение; соединения завершившихся потоков закрываются
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Создание хранилища по словарю DATABASE_CONFIG"""
+        return cls(
+            config['db_path'],
+            journal_mode=config.get('journal_mode', 'WAL'),
+            synchronous=config.get('synchronous', 'NORMAL'),
+            busy_timeout=config.get('busy_timeout', 5000),
+            auto_vacuum=config.get('auto_vacuum', 'INCREMENTAL'),
+        )
+
+    def _connect(self):
+        """Открытие нового соединения с нужными PRAGMA"""
+        # isolation_level=None: транзакциями управляем сами через BEGIN/COMMIT
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        # auto_vacuum действует только для новой базы, до создания таблиц
+        conn.execute(f"PRAGMA auto_vacuum={self.auto_vacuum}")
+        conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        return conn
+
+    def connection(self):
+        """Соединение текущего потока (создается при первом обращении)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                dead = [thread for thread in self._connections if not thread.is_alive()]
+                stale = [self._connections.pop(thread) for thread in dead]
+                self._connections[threading.current_thread()] = conn
+            # Потоки, завершившиеся без release() (перезапуск ролей, пулы потоков)
+            self._close_all(stale)
+        return conn
+
+    def release(self):
+        """Закрытие соединения текущего потока (вызывается при завершении потока)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._lock:
+            self._connections.pop(threading.current_thread(), None)
+        self._close_all([conn])
+
+    @staticmethod
+    def _close_all(connections):
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.error(f"❌ Ошибка закрытия соединения: {e}")
+
+    @contextmanager
+    def transaction(self):
+        """Транзакция на соединении текущего потока
+
+        Вложенные вызовы присоединяются к внешней транзакции,
+        поэтому несколько операций можно объединить в один COMMIT.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn.cursor()
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn.cursor()
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+
+    def execute(self, sql, params=()):
+        """Выполнение одиночного запроса (autocommit)"""
+        return self.connection().execute(sql, params)
+
+    def close(self):
+        """Закрытие всех открытых соединений"""
+        with self._lock:
+            connections, self._connections = list(self._connections.values()), {}
+        self._close_all(connections)
+        self._local = threading.local()
+
+
+def create_storage(config):
+    """Хранилище по DATABASE_CONFIG
+
+    backend: 'sqlite' (по умолчанию) или 'модуль:Класс'. Класс создается
+    через from_config(config) и должен иметь интерфейс Storage (connection,
+    transaction, execute, release, close, db_path) и принимать SQL диалекта SQLite.
+    Встроен только sqlite: база - локальный файл, общий для процессов одного
+    хоста (режим разделов тоже однохостовый).
+    """
+    backend = config.get('backend', 'sqlite')
+    if backend == 'sqlite':
+        return Storage.from_config(config)
+
+    module_name, _, class_name = backend.partition(':')
+    try:
+        cls = getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError) as e:
+        raise ValueError(f"Неизвестный backend хранилища {backend}: {e}")
+    logger.info(f"🗄️ Хранилище: {backend}")
+    return cls.from_config(config)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Общие фикстуры тестов
+- Модули интеграции импортируются из корня репозитория
+- Без config.py используется config.example.py с путями во временном каталоге
+"""
+
+import os
+import sys
+import tempfile
+import importlib.util
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    import config  # noqa: F401
+except ImportError:
+    spec = importlib.util.spec_from_file_location('config', os.path.join(ROOT, 'config.example.py'))
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    sys.modules['config'] = config
+    data_dir = tempfile.mkdtemp(prefix='podio-wazzup-tests-')
+    config.DATABASE_CONFIG['db_path'] = os.path.join(data_dir, 'integration_data.db')
+    config.INTEGRATION_CONFIG['log_file'] = None
+
+from storage import Storage  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+
+@pytest.fixture
+def storage(tmp_path):
+    """Пустая база с примененными миграциями"""
+    db = Storage(str(tmp_path / 'test.db'))
+    migrate(db)
+    yield db
+    db.close()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Выключатель внешнего API: состояния и отложенные задачи очереди
+"""
+
+import threading
+import time
+
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, CircuitOpen
+from work_queue import WorkQueue, WorkerPool
+
+
+class Clock:
+    """Управляемое время для time.monotonic"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker('podio', failure_threshold=3, reset_timeout=30, max_reset_timeout=100,
+                          replay_rate=0, replay_period=0)
+
+
+def fail_times(breaker, count):
+    for _ in range(count):
+        breaker.before_request()
+        breaker.record(True)
+
+
+def test_opens_after_threshold_of_consecutive_failures(breaker):
+    fail_times(breaker, 2)
+    breaker.before_request()
+    breaker.record(False)
+    # Успешный ответ сбрасывает счетчик
+    fail_times(breaker, 2)
+    assert breaker.state == 'closed'
+
+    fail_times(breaker, 1)
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpen) as error:
+        breaker.before_request()
+    assert error.value.delay == pytest.approx(30)
+
+
+def test_ignored_results_do_not_count(breaker):
+    for _ in range(5):
+        breaker.before_request()
+        breaker.record(None)
+    assert breaker.state == 'closed'
+    assert breaker.failures == 0
+
+
+def test_half_open_allows_single_probe_and_closes_on_success(breaker, clock):
+    fail_times(breaker, 3)
+    clock.now += 30
+
+    breaker.before_request()
+    assert breaker.state == 'half_open'
+    # Пока идет пробный запрос, остальные не отправляются
+    with pytest.raises(CircuitOpen):
+        breaker.before_request()
+
+    closed = []
+    breaker.on_close(lambda: closed.append(True))
+    breaker.record(False)
+    assert breaker.state == 'closed'
+    assert closed == [True]
+    breaker.before_request()
+
+
+def in_thread(call):
+    """Вызов в отдельном потоке с пробросом исключения"""
+    errors = []
+
+    def run():
+        try:
+            call()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+def test_only_probe_thread_finishes_probe(breaker, clock):
+    fail_times(breaker, 3)
+    clock.now += 30
+    breaker.before_request()
+
+    # Запросы, отправленные до открытия выключателя, завершаются в других потоках
+    in_thread(lambda: breaker.record(None))
+    in_thread(lambda: breaker.record(True))
+
+    assert breaker.state == 'half_open'
+    with pytest.raises(CircuitOpen):
+        in_thread(breaker.before_request)
+
+    breaker.record(False)
+    assert breaker.state == 'closed'
+    in_thread(breaker.before_request)
+
+
+def test_failed_probe_doubles_reset_timeout_up_to_max(breaker, clock):
+    fail_times(breaker, 3)
+    for expected in (60, 100, 100):
+        clock.now += breaker.retry_in()
+        breaker.before_request()
+        breaker.record(True)
+        assert breaker.state == 'open'
+        assert breaker.retry_in() == pytest.approx(expected)
+
+    clock.now += breaker.retry_in()
+    breaker.before_request()
+    breaker.record(False)
+    # После восстановления пауза снова начальная
+    fail_times(breaker, 3)
+    assert breaker.retry_in() == pytest.approx(30)
+
+
+def test_replay_throttles_tasks_after_recovery(clock):
+    breaker = CircuitBreaker('wazzup', failure_threshold=1, reset_timeout=10, replay_rate=2, replay_period=60)
+    fail_times(breaker, 1)
+    clock.now += 10
+    breaker.before_request()
+    breaker.record(False)
+
+    assert breaker.stats()['replaying'] is True
+    clock.now += 61
+    assert breaker.throttle() == 0
+    assert breaker.stats()['replaying'] is False
+
+
+@pytest.fixture
+def queue(storage):
+    return WorkQueue(storage, max_attempts=3)
+
+
+def task_row(queue, item_id):
+    return queue.storage.execute("SELECT status, attempts FROM work_queue WHERE id = ?", (item_id,)).fetchone()
+
+
+def test_open_breaker_defers_upstream_failures_without_attempt(queue, breaker):
+    pool = WorkerPool(queue, workers=1)
+
+    def call_api(payload):
+        # Как обертки PodioAPI: исключение транспорта превращается в None
+        try:
+            breaker.before_request()
+            breaker.record(True)
+        except CircuitOpen:
+            pass
+        raise RuntimeError('не удалось добавить комментарий')
+
+    pool.register('podio_comment', call_api, breaker=breaker)
+    fail_times(breaker, 3)
+    item_id = queue.put('podio_comment', {}, 'podio:whatsapp:1')
+
+    pool._process(queue.claim())
+
+    assert task_row(queue, item_id) == ('pending', 0)
+    # Задачи типа с открытым выключателем не захватываются
+    assert queue.claim(pool._unavailable_kinds()) is None
+
+
+def test_open_breaker_does_not_shield_handler_errors(queue, breaker, clock):
+    pool = WorkerPool(queue, workers=1)
+
+    def broken(payload):
+        raise RuntimeError('контакт не найден')
+
+    pool.register('podio_comment', broken, breaker=breaker)
+    fail_times(breaker, 3)
+    item_id = queue.put('podio_comment', {}, 'podio:whatsapp:1')
+
+    # Пробный запрос уже возможен, но задача падает не из-за API
+    clock.now += 30
+    pool._process(queue.claim(pool._unavailable_kinds()))
+
+    assert task_row(queue, item_id) == ('pending', 1)
+    assert time.time() < queue.storage.execute(
+        "SELECT next_attempt_at FROM work_queue WHERE id = ?", (item_id,)).fetchone()[0]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Правила команд: разбор комментария и автоматическая отправка по типу автора
+"""
+
+from command_rules import CommandRules, Route
+
+
+def make_rules(**overrides):
+    config = {
+        'send_commands': ['@send', '@отправить'],
+        'exclude_commands': ['@internal'],
+        'auto_send_comments': True,
+        'auto_send_roles': ['user'],
+        **overrides,
+    }
+    return CommandRules.from_config(config)
+
+
+def test_send_command_is_stripped_from_text():
+    assert make_rules().evaluate('Добрый день @ОТПРАВИТЬ', 'app') == Route('send', '@отправить', 'Добрый день')
+
+
+def test_exclude_command_wins():
+    assert make_rules().evaluate('@send заметка @internal', 'user').action == 'exclude'
+
+
+def test_auto_send_depends_on_author_type():
+    rules = make_rules()
+
+    assert rules.evaluate('Ответ клиенту', 'user') == Route('auto', None, 'Ответ клиенту')
+    # Комментарии приложений без команды не отправляются
+    assert rules.evaluate('Статус обновлен', 'app') == Route('skip', None, None)
+    assert make_rules(auto_send_comments=False).evaluate('Ответ клиенту', 'user').action == 'skip'
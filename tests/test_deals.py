@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Сделки Podio: создание один раз, восстановление после потерянного ответа и сверка
+"""
+
+import itertools
+
+import pytest
+
+from deals import DealResolver
+from message_tracker import MessageTracker
+
+CONTACTS_APP_ID = '44'
+DEALS_APP_ID = '55'
+
+
+class FakePodio:
+    """Элементы Podio в памяти"""
+
+    def __init__(self):
+        self.items = {}
+        self.created = []
+        self.fail_create = False
+        self._ids = itertools.count(1000)
+
+    def create_item(self, app_id, fields, external_id=None):
+        if self.fail_create:
+            return None
+        item_id = next(self._ids)
+        self.items[item_id] = {'app_id': app_id, 'external_id': external_id, 'fields': [],
+                               'last_event_on': '2024-01-01 10:00:00'}
+        self.created.append((app_id, fields, external_id))
+        return {'item_id': item_id}
+
+    def get_item_by_external_id(self, app_id, external_id):
+        for item_id, item in self.items.items():
+            if item['app_id'] == app_id and item['external_id'] == external_id:
+                return {'item_id': item_id, **item}
+        return {}
+
+    def filter_items(self, app_id, filters=None, limit=30, offset=0):
+        since = filters['last_event_on']['from']
+        items = [{'item_id': item_id, **item} for item_id, item in self.items.items()
+                 if item['app_id'] == app_id and item['last_event_on'] >= since]
+        return {'items': items[offset:offset + limit]}
+
+
+class Cursors:
+    def __init__(self):
+        self.values = {}
+
+    def get_cursor(self, key):
+        return self.values.get(key)
+
+    def set_cursor(self, key, value):
+        self.values[key] = value
+
+
+@pytest.fixture
+def tracker(storage):
+    return MessageTracker(storage)
+
+
+@pytest.fixture
+def podio():
+    return FakePodio()
+
+
+def make_resolver(podio, tracker, **overrides):
+    config = {
+        'deals_app_id': DEALS_APP_ID,
+        'contacts_app_id': CONTACTS_APP_ID,
+        'auto_create_deals': True,
+        'contact_fields': {'title': '{name}', 'phone': [{'type': 'mobile', 'value': '+{phone}'}]},
+        'deal_fields': {'title': '{name} ({chat_type})'},
+        'deal_contact_field': 'contact',
+        'deal_status_field': 'status',
+        'deal_closed_values': ['Закрыта'],
+        **overrides,
+    }
+    return DealResolver(podio, tracker, config, Cursors())
+
+
+def test_contact_and_deal_are_created_once(podio, tracker):
+    resolver = make_resolver(podio, tracker)
+    contact_id = tracker.get_or_create_contact('79001234567', 'whatsapp', 'Иван')
+
+    item_id = resolver.resolve(contact_id)
+
+    assert [(app_id, external_id) for app_id, _, external_id in podio.created] == [
+        (CONTACTS_APP_ID, f"wazzup_contact_{contact_id}"),
+        (DEALS_APP_ID, f"wazzup_deal_{contact_id}_1"),
+    ]
+    contact_fields, deal_fields = podio.created[0][1], podio.created[1][1]
+    assert contact_fields == {'title': 'Иван', 'phone': [{'type': 'mobile', 'value': '+79001234567'}]}
+    assert deal_fields == {'title': 'Иван (whatsapp)', 'contact': [1000]}
+
+    # Следующие сообщения идут в ту же сделку без запросов к Podio
+    assert resolver.resolve(contact_id) == item_id
+    assert len(podio.created) == 2
+    assert resolver.stats()['local'] == 1
+
+
+def test_empty_template_values_are_not_sent(podio, tracker):
+    resolver = make_resolver(podio, tracker)
+    contact_id = tracker.get_or_create_contact('client', 'telegram', 'Анна')
+
+    resolver.resolve(contact_id)
+
+    assert podio.created[0][1] == {'title': 'Анна'}
+
+
+def test_no_deal_when_creation_disabled_or_app_unknown(podio, tracker):
+    contact_id = tracker.get_or_create_contact('79001234567', 'whatsapp', 'Иван')
+
+    assert make_resolver(podio, tracker, auto_create_deals=False).resolve(contact_id) is None
+    assert make_resolver(podio, tracker, deals_app_id='UNKNOWN').resolve(contact_id) is None
+    assert podio.created == []
+
+
+def test_retry_finds_item_created_before_lost_response(podio, tracker, storage):
+    resolver = make_resolver(podio, tracker, contacts_app_id=None)
+    contact_id = tracker.get_or_create_contact('79001234567', 'whatsapp', 'Иван')
+    # Прерванная попытка: строка 'creating' есть, элемент в Podio создан, ответ потерян
+    with storage.transaction() as cursor:
+        cursor.execute("INSERT INTO deals (contact_id, status) VALUES (?, 'creating')", (contact_id,))
+        deal_id = cursor.lastrowid
+    existing = podio.create_item(DEALS_APP_ID, {}, external_id=f"wazzup_deal_{contact_id}_{deal_id}")
+    podio.created.clear()
+
+    assert resolver.resolve(contact_id) == str(existing['item_id'])
+    assert podio.created == []
+    assert resolver.stats()['recovered'] == 1
+
+
+def test_failed_create_is_retried_with_same_external_id(podio, tracker):
+    resolver = make_resolver(podio, tracker, contacts_app_id=None)
+    contact_id = tracker.get_or_create_contact('79001234567', 'whatsapp', 'Иван')
+
+    podio.fail_create = True
+    with pytest.raises(RuntimeError):
+        resolver.resolve(contact_id)
+
+    podio.fail_create = False
+    item_id = resolver.resolve(contact_id)
+
+    assert [external_id for _, _, external_id in podio.created] == [f"wazzup_deal_{contact_id}_1"]
+    assert tracker.get_active_deal_item(contact_id) == item_id
+
+
+def test_reconcile_closes_deal_and_next_message_opens_new_one(podio, tracker):
+    resolver = make_resolver(podio, tracker, contacts_app_id=None)
+    contact_id = tracker.get_or_create_contact('79001234567', 'whatsapp', 'Иван')
+    item_id = resolver.resolve(contact_id)
+
+    # Первая сверка только запоминает курсор
+    assert resolver.reconcile(force=True) == 0
+    item = podio.items[int(item_id)]
+    item['fields'] = [{'external_id': 'status', 'values': [{'value': {'text': 'Закрыта'}}]}]
+    item['last_event_on'] = '2999-01-01 00:00:00'
+
+    assert resolver.reconcile(force=True) == 1
+    assert tracker.get_active_deal_item(contact_id) is None
+
+    new_item_id = resolver.resolve(contact_id)
+    assert new_item_id != item_id
+    assert resolver.stats()['closed'] == 1
+
+
+def test_other_partition_does_not_use_cached_closed_deal(podio, tracker, storage):
+    leader = make_resolver(podio, tracker, contacts_app_id=None, auto_create_deals=False)
+    partition = make_resolver(podio, MessageTracker(storage), contacts_app_id=None, auto_create_deals=False)
+    partition.verify_cached = True
+    contact_id = tracker.get_or_create_contact('79001234567', 'whatsapp', 'Иван')
+    with storage.transaction() as cursor:
+        cursor.execute("INSERT INTO deals (contact_id, podio_item_id) VALUES (?, '777')", (contact_id,))
+
+    assert partition.resolve(contact_id) == '777'
+    leader._set_status(['777'], 'active', 'closed')
+
+    assert partition.resolve(contact_id) is None
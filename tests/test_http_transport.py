@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP транспорт: повторы после ошибок соединения
+"""
+
+import socket
+import threading
+
+import pytest
+import requests
+
+from http_transport import HttpTransport
+
+
+class DroppingServer:
+    """Сервер, который читает запрос и закрывает соединение без ответа"""
+
+    def __init__(self):
+        self.requests = 0
+        self._socket = socket.socket()
+        self._socket.bind(('127.0.0.1', 0))
+        self._socket.listen()
+        self.url = f"http://127.0.0.1:{self._socket.getsockname()[1]}"
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                return
+            with conn:
+                if conn.recv(65536):
+                    self.requests += 1
+
+    def close(self):
+        self._socket.close()
+
+
+@pytest.fixture
+def server():
+    server = DroppingServer()
+    yield server
+    server.close()
+
+
+def make_transport(base_url):
+    return HttpTransport('test', base_url, max_retries=2, backoff_factor=0)
+
+
+def test_post_is_not_repeated_after_disconnect(server):
+    transport = make_transport(server.url)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        transport.post('/comment', json={'value': 'текст'})
+
+    assert server.requests == 1
+
+
+def test_get_is_repeated_after_disconnect(server):
+    transport = make_transport(server.url)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        transport.get('/item')
+
+    assert server.requests == 3
+
+
+def test_post_is_repeated_when_connection_is_refused():
+    free = socket.socket()
+    free.bind(('127.0.0.1', 0))
+    port = free.getsockname()[1]
+    free.close()
+    transport = make_transport(f"http://127.0.0.1:{port}")
+    attempts = []
+    send = transport.session.request
+    transport.session.request = lambda *args, **kwargs: attempts.append(1) or send(*args, **kwargs)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        transport.post('/comment', json={'value': 'текст'})
+
+    assert len(attempts) == 3
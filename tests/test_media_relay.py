@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Передача вложений в Podio через кэш на диске
+"""
+
+import hashlib
+import os
+
+import pytest
+
+from media_relay import MediaRelay
+
+CONTENT_URI = 'https://store.wazzup24.com/photo.jpg'
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.status_code = 200
+        self.headers = {'Content-Type': 'image/jpeg', 'Content-Length': str(len(content))}
+        self.content = content
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeHttp:
+    """Хранилище Wazzup: содержимое по ссылке можно заменить"""
+
+    def __init__(self, content):
+        self.content = content
+
+    def request(self, method, url, **kwargs):
+        return FakeResponse(self.content)
+
+
+class FakePodio:
+    def __init__(self):
+        self.uploaded = []
+
+    def upload_file(self, body):
+        self.uploaded.append(b''.join(body))
+        return len(self.uploaded)
+
+    def copy_file(self, file_id):
+        return int(file_id) + 100
+
+
+@pytest.fixture
+def podio():
+    return FakePodio()
+
+
+@pytest.fixture
+def http():
+    return FakeHttp(b'old photo')
+
+
+@pytest.fixture
+def relay(storage, podio, http, tmp_path):
+    return MediaRelay(storage, podio, str(tmp_path / 'media'), chunk_size=4, http=http)
+
+
+def test_same_content_is_uploaded_once_and_copied(relay, podio):
+    assert relay.relay(CONTENT_URI) == 1
+    assert relay.relay(CONTENT_URI) == 101
+
+    assert len(podio.uploaded) == 1
+    assert b'old photo' in podio.uploaded[0]
+    assert relay.stats()['reused'] == 1
+
+
+def test_redownloaded_content_with_new_digest_is_a_cache_miss(relay, podio, http):
+    old_digest = relay._download(CONTENT_URI, None)
+    os.remove(relay.cache_path(old_digest))
+    http.content = b'new photo'
+
+    # Файл пропал из кэша, а по ссылке уже другое содержимое
+    assert relay._podio_file(old_digest, CONTENT_URI, None) is None
+    new_digest = hashlib.sha256(b'new photo').hexdigest()
+    assert relay._source_digest(CONTENT_URI) == new_digest
+    assert podio.uploaded == []
+
+    assert relay.relay(CONTENT_URI) == 1
+    assert b'new photo' in podio.uploaded[0]
+    row = relay.storage.execute("SELECT podio_file_id FROM media_files WHERE sha256 = ?", (old_digest,)).fetchone()
+    assert row == (None,)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Хранилище SQLite: соединения потоков
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+
+def run_in_thread(target):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(target()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_release_closes_thread_connection(storage):
+    def work():
+        conn = storage.connection()
+        storage.release()
+        return conn
+
+    conn = run_in_thread(work)
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    assert all(thread.is_alive() for thread in storage._connections)
+
+
+def test_connections_of_finished_threads_are_closed(storage):
+    # Поток обработки HTTP-запроса завершился, не вызвав release()
+    conn = run_in_thread(storage.connection)
+
+    run_in_thread(storage.connection)
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    # Остается только соединение последнего завершившегося потока
+    assert len([thread for thread in storage._connections if not thread.is_alive()]) == 1
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь задач: порядок внутри раздела, повторы и failed (dead letter)
+"""
+
+import time
+
+import pytest
+
+from work_queue import WorkQueue, WorkerPool, RetryLater
+
+
+@pytest.fixture
+def queue(storage):
+    return WorkQueue(storage, max_attempts=3, retry_delay=5, max_retry_delay=300)
+
+
+def task_row(queue, item_id):
+    return queue.storage.execute(
+        "SELECT status, attempts, next_attempt_at FROM work_queue WHERE id = ?", (item_id,)
+    ).fetchone()
+
+
+def make_due(queue, item_id):
+    """Срок повтора задачи наступил"""
+    with queue.storage.transaction() as cursor:
+        cursor.execute("UPDATE work_queue SET next_attempt_at = 0 WHERE id = ?", (item_id,))
+
+
+def test_claim_keeps_order_within_partition(queue):
+    a1, a2, b1 = queue.put_many([
+        ('wazzup', {'n': 'a1'}, 'chat-a'),
+        ('wazzup', {'n': 'a2'}, 'chat-a'),
+        ('wazzup', {'n': 'b1'}, 'chat-b'),
+    ])
+
+    assert queue.claim()['id'] == a1
+    # a2 ждет завершения a1, другой чат обрабатывается параллельно
+    assert queue.claim()['id'] == b1
+    assert queue.claim() is None
+
+    queue.complete(a1)
+    item = queue.claim()
+    assert item['id'] == a2
+    assert item['payload'] == {'n': 'a2'}
+
+
+def test_failed_task_blocks_its_partition_until_retry(queue):
+    a1, a2 = queue.put_many([('wazzup', {}, 'chat-a'), ('wazzup', {}, 'chat-a')])
+    queue.claim()
+
+    assert queue.fail(a1, 'timeout') is True
+    # Повтор a1 еще не наступил, а a2 не обгоняет его
+    assert queue.claim() is None
+
+    make_due(queue, a1)
+    item = queue.claim()
+    assert item['id'] == a1
+    assert item['attempts'] == 1
+
+
+def test_retry_delay_grows_exponentially(queue):
+    item_id = queue.put('wazzup', {}, 'chat-a')
+    delays = []
+    for _ in range(2):
+        queue.claim()
+        before = time.time()
+        queue.fail(item_id, 'error')
+        delays.append(task_row(queue, item_id)[2] - before)
+        make_due(queue, item_id)
+
+    assert delays[0] == pytest.approx(5, abs=1)
+    assert delays[1] == pytest.approx(10, abs=1)
+
+
+def test_task_goes_to_dead_letter_after_max_attempts(queue):
+    a1, a2 = queue.put_many([('wazzup', {}, 'chat-a'), ('wazzup', {}, 'chat-a')])
+    for _ in range(3):
+        assert queue.claim()['id'] == a1
+        retry = queue.fail(a1, 'error')
+        make_due(queue, a1)
+    assert retry is False
+
+    status, attempts, _ = task_row(queue, a1)
+    assert (status, attempts) == ('failed', 3)
+    assert queue.counts()['failed'] == 1
+    # Задача в failed не держит раздел
+    assert queue.claim()['id'] == a2
+
+    assert queue.replay_failed(['wazzup']) == 1
+    assert task_row(queue, a1)[:2] == ('pending', 0)
+
+
+def test_requeue_stale_returns_interrupted_tasks(queue):
+    item_id = queue.put('wazzup', {}, 'chat-a')
+    queue.claim()
+
+    assert queue.requeue_stale() == 1
+    assert queue.claim()['id'] == item_id
+
+
+def test_worker_pool_counts_errors_and_defers_without_attempt(queue):
+    pool = WorkerPool(queue, workers=1)
+
+    def broken(payload):
+        raise RuntimeError('сбой обработчика')
+
+    def throttled(payload):
+        raise RetryLater(30, 'лимит отправки')
+
+    pool.register('broken', broken)
+    pool.register('throttled', throttled)
+    broken_id = queue.put('broken', {}, 'chat-a')
+    throttled_id = queue.put('throttled', {}, 'chat-b')
+
+    pool._process(queue.claim())
+    pool._process(queue.claim())
+
+    assert task_row(queue, broken_id)[:2] == ('pending', 1)
+    status, attempts, next_attempt_at = task_row(queue, throttled_id)
+    assert (status, attempts) == ('pending', 0)
+    assert next_attempt_at > time.time() + 20
+
+
+def test_worker_pool_completes_successful_task(queue):
+    pool = WorkerPool(queue, workers=1)
+    handled = []
+    pool.register('wazzup', handled.append)
+    item_id = queue.put('wazzup', {'n': 1}, 'chat-a')
+
+    pool._process(queue.claim())
+
+    assert handled == [{'n': 1}]
+    assert task_row(queue, item_id) is None
+    assert pool.stats()['processed'] == 1
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Клиент Wazzup API
+"""
+
+import logging
+from config import WAZZUP_CONFIG
+from http_transport import HttpTransport
+
+logger = logging.getLogger(__name__)
+
+
+class WazzupAPI:
+    """Класс для работы с Wazzup API"""
+    
+    def __init__(self):
+        self.api_token = WAZZUP_CONFIG['api_token']
+        self.base_url = WAZZUP_CONFIG['base_url']
+        self.http = HttpTransport.from_config('Wazzup', WAZZUP_CONFIG, self.base_url)
+    
+    def get_headers(self):
+        """Получение заголовков для API запросов"""
+        return {
+            'Authorization': f'Bearer {self.api_token}',
+            'Content-Type': 'application/json'
+        }
+    
+    def send_message(self, channel_id, chat_id, text, chat_type='whatsapp', crm_message_id=None):
+        """Отправка сообщения
+
+        crm_message_id - ключ идемпотентности: Wazzup не отправит
+        повторно сообщение с тем же ключом.
+        """
+        url = f"{self.base_url}/message"
+        data = {
+            'channelId': channel_id,
+            'chatId': chat_id,
+            'text': text,
+            'chatType': chat_type
+        }
+        if crm_message_id:
+            data['crmMessageId'] = crm_message_id
+        
+        try:
+            response = self.http.post(url, headers=self.get_headers(), json=data)
+            if response.status_code == 201:  # Wazzup возвращает 201 для успешной отправки
+                result = response.json()
+                logger.info(f"✅ Сообщение отправлено в {chat_type} чат {chat_id}")
+                return result
+            elif crm_message_id and 'REPEATED_CRM_MESSAGE_ID' in response.text:
+                # Сообщение уже было отправлено предыдущей попыткой
+                logger.info(f"✅ Сообщение {crm_message_id} уже отправлено ранее")
+                return {'crmMessageId': crm_message_id, 'repeated': True}
+            else:
+                logger.error(f"❌ Ошибка отправки сообщения: {response.status_code} - {response.text}")
+                return None
+        except Exception as e:
+            logger.error(f"❌ Исключение при отправке сообщения: {e}")
+            return None
+    
+    def setup_webhooks(self, webhook_url):
+        """Настройка webhooks"""
+        url = f"{self.base_url}/webhooks"
+        data = {
+            'webhooksUri': webhook_url,
+            'subscriptions': {
+                'messagesAndStatuses': True,
+                'contactsAndDealsCreation': False,
+                'channelsUpdates': False,
+                'templateStatus': False
+            }
+        }
+        
+        try:
+            response = self.http.patch(url, headers=self.get_headers(), json=data)
+            if response.status_code == 200:
+                logger.info(f"✅ Webhooks настроены на {webhook_url}")
+                return True
+            else:
+                logger.error(f"❌ Ошибка настройки webhooks: {response.status_code} - {response.text}")
+                return False
+        except Exception as e:
+            logger.error(f"❌ Исключение при настройке webhooks: {e}")
+            return False
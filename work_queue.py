@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Надежная очередь задач в SQLite и пул обработчиков
+- Webhook только записывает задачу и сразу отвечает
+- Задачи с одинаковым ключом раздела (chatId) выполняются строго по порядку
+- Неудачные задачи повторяются с нарастающей паузой
+- Пока внешний API недоступен, его задачи ждут в очереди, не тратя попыток
+- Задачи делятся на шарды по chatId для обработки несколькими процессами
+"""
+
+import zlib
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+from metrics import QUEUE_TASK_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Окно для расчета скорости разбора очереди, секунды
+RATE_WINDOW = 60
+
+# Число шардов; процессы-разделы делят их по остатку от деления
+SHARDS = 1024
+
+
+def shard_of(partition_key):
+    """Шард задачи по последней части ключа раздела
+
+    Ключи задач одного чата ('79001234567', 'chat:whatsapp:79001234567',
+    'podio:whatsapp:79001234567') заканчиваются на chatId, поэтому все
+    задачи чата попадают в один процесс.
+    """
+    if partition_key is None:
+        return 0
+    return zlib.crc32(str(partition_key).rsplit(':', 1)[-1].encode()) % SHARDS
+
+
+class RetryLater(Exception):
+    """Задачу нужно отложить без траты попытки (например, из-за лимита отправки)"""
+
+    def __init__(self, delay, reason=''):
+        super().__init__(reason or f"отложено на {delay:.2f} с")
+        self.delay = delay
+
+
+class WorkQueue:
+    """Очередь задач, хранящаяся в таблице SQLite"""
+
+    def __init__(self, storage, table='work_queue', max_attempts=5, retry_delay=5, max_retry_delay=300):
+        self.storage = storage
+        # (номер, количество) - процесс обрабатывает только свои шарды; None - все
+        self.partition = None
+        self.table = table
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.init_table()
+
+    def init_table(self):
+        """Создание таблицы очереди (колонку shard в старые таблицы добавляет миграция 10)"""
+        with self.storage.transaction() as cursor:
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    partition_key TEXT,
+                    shard INTEGER DEFAULT 0,
+                    payload TEXT NOT NULL,
+                    status TEXT DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt_at REAL DEFAULT 0,
+                    last_error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_status ON {self.table} (status, id)")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_partition ON {self.table} (partition_key, id)")
+
+    def _partition_filter(self, alias=''):
+        """Условие SQL и параметры для шардов этого процесса"""
+        if not self.partition or self.partition[1] <= 1:
+            return '', ()
+        index, count = self.partition
+        return f" AND {alias}shard % ? = ?", (count, index)
+
+    def put(self, kind, payload, partition_key=None):
+        """Добавление одной задачи"""
+        return self.put_many([(kind, payload, partition_key)])[0]
+
+    def put_many(self, items):
+        """Добавление нескольких задач одной транзакцией
+
+        items: список (kind, payload, partition_key). Возвращает id задач.
+        """
+        ids = []
+        with self.storage.transaction() as cursor:
+            for kind, payload, partition_key in items:
+                cursor.execute(
+                    f"INSERT INTO {self.table} (kind, partition_key, shard, payload) VALUES (?, ?, ?, ?)",
+                    (kind, partition_key, shard_of(partition_key), json.dumps(payload, ensure_ascii=False))
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def claim(self, skip_kinds=()):
+        """Захват следующей готовой задачи
+
+        Задача готова, если перед ней в том же разделе нет незавершенных задач,
+        поэтому порядок внутри чата сохраняется даже при повторах.
+        Задачи типов skip_kinds (их API недоступен) не захватываются.
+        """
+        now = time.time()
+        skip = ''.join(' AND q.kind != ?' for _ in skip_kinds)
+        shard, shard_params = self._partition_filter('q.')
+        with self.storage.transaction() as cursor:
+            cursor.execute(f'''
+                SELECT q.id, q.kind, q.partition_key, q.payload, q.attempts
+                FROM {self.table} q
+                WHERE q.status = 'pending' AND q.next_attempt_at <= ?{skip}{shard}
+                  AND NOT EXISTS (
+                      SELECT 1 FROM {self.table} p
+                      WHERE p.partition_key = q.partition_key
+                        AND p.id < q.id
+                        AND p.status IN ('pending', 'processing')
+                  )
+                ORDER BY q.id
+                LIMIT 1
+            ''', (now, *skip_kinds, *shard_params))
+            row = cursor.fetchone()
+            if not row:
+                return None
+
+            cursor.execute(
+                f"UPDATE {self.table} SET status = 'processing', updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (row[0],)
+            )
+
+        return {
+            'id': row[0],
+            'kind': row[1],
+            'partition_key': row[2],
+            'payload': json.loads(row[3]),
+            'attempts': row[4],
+        }
+
+    def complete(self, item_id):
+        """Удаление успешно выполненной задачи"""
+        with self.storage.transaction() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE id = ?", (item_id,))
+
+    def fail(self, item_id, error):
+        """Отметка неудачной попытки
+
+        Возвращает True, если задача будет повторена, и False,
+        если попытки исчерпаны и задача помечена как failed.
+        """
+        with self.storage.transaction() as cursor:
+            cursor.execute(f"SELECT attempts FROM {self.table} WHERE id = ?", (item_id,))
+            row = cursor.fetchone()
+            if not row:
+                return False
+
+            attempts = row[0] + 1
+            if attempts >= self.max_attempts:
+                cursor.execute(f'''
+                    UPDATE {self.table}
+                    SET status = 'failed', attempts = ?, last_error = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (attempts, str(error), item_id))
+                return False
+
+            delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+            cursor.execute(f'''
+                UPDATE {self.table}
+                SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (attempts, time.time() + delay, str(error), item_id))
+            return True
+
+    def defer(self, item_id, delay):
+        """Возврат задачи в очередь через delay секунд без увеличения счетчика попыток"""
+        with self.storage.transaction() as cursor:
+            cursor.execute(f'''
+                UPDATE {self.table}
+                SET status = 'pending', next_attempt_at = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (time.time() + delay, item_id))
+
+    def replay_failed(self, kinds=None):
+        """Возврат задач, исчерпавших попытки (failed), в очередь со сброшенным счетчиком"""
+        condition = "status = 'failed'"
+        params = ()
+        if kinds:
+            condition += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            params = tuple(kinds)
+        with self.storage.transaction() as cursor:
+            cursor.execute(f'''
+                UPDATE {self.table}
+                SET status = 'pending', attempts = 0, next_attempt_at = 0, updated_at = CURRENT_TIMESTAMP
+                WHERE {condition}
+            ''', params)
+            return cursor.rowcount
+
+    def requeue_stale(self):
+        """Возврат задач, прерванных остановкой процесса, в очередь
+
+        В режиме разделов возвращаются только задачи своих шардов:
+        задачи других процессов в это время выполняются.
+        """
+        shard, shard_params = self._partition_filter()
+        with self.storage.transaction() as cursor:
+            cursor.execute(
+                f"UPDATE {self.table} SET status = 'pending' WHERE status = 'processing'{shard}", shard_params
+            )
+            return cursor.rowcount
+
+    def payloads(self, kind):
+        """Данные всех задач типа kind, еще не удаленных из очереди (включая failed)"""
+        rows = self.storage.execute(f"SELECT payload FROM {self.table} WHERE kind = ?", (kind,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def counts(self):
+        """Количество задач по статусам"""
+        rows = self.storage.execute(f"SELECT status, COUNT(*) FROM {self.table} GROUP BY status").fetchall()
+        counts = {'pending': 0, 'processing': 0, 'failed': 0}
+        counts.update(dict(rows))
+        return counts
+
+
+class WorkerPool:
+    """Пул потоков, разбирающих очередь задач"""
+
+    def __init__(self, queue, workers=4, poll_interval=1.0, name='worker'):
+        self.queue = queue
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.name = name
+        self.handlers = {}
+        self.breakers = {}
+        self._threads = []
+        self._running = False
+        self._wakeup = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self._processed = 0
+        self._failed = 0
+        self._completions = deque()
+
+    def register(self, kind, handler, breaker=None):
+        """Регистрация обработчика для типа задач
+
+        breaker - выключатель API, к которому обращается обработчик: пока он
+        открыт, задачи этого типа не захватываются, а после восстановления
+        разбираются с ограниченной частотой.
+        """
+        self.handlers[kind] = handler
+        if breaker:
+            self.breakers[kind] = breaker
+            breaker.on_close(self.notify)
+
+    def notify(self):
+        """Пробуждение ожидающих потоков после добавления задач"""
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def start(self):
+        """Запуск потоков обработки"""
+        if self._running:
+            return
+        self._running = True
+
+        stale = self.queue.requeue_stale()
+        if stale:
+            logger.info(f"🔄 Возвращено в очередь незавершенных задач: {stale}")
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"🚀 Запущено обработчиков очереди: {self.workers}")
+
+    def stop(self, timeout=10):
+        """Остановка потоков после завершения текущих задач"""
+        self._running = False
+        self.notify()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        """Цикл одного потока обработки"""
+        try:
+            while self._running:
+                try:
+                    item = self.queue.claim(self._unavailable_kinds())
+                except Exception as e:
+                    logger.error(f"❌ Ошибка чтения очереди: {e}")
+                    item = None
+
+                if item is None:
+                    with self._wakeup:
+                        self._wakeup.wait(self.poll_interval)
+                    continue
+
+                self._process(item)
+        finally:
+            self.queue.storage.release()
+
+    def _unavailable_kinds(self):
+        """Типы задач, чей API сейчас недоступен"""
+        return [kind for kind, breaker in self.breakers.items() if breaker.retry_in()]
+
+    def _process(self, item):
+        """Выполнение одной задачи"""
+        handler = self.handlers.get(item['kind'])
+        breaker = self.breakers.get(item['kind'])
+        start = time.perf_counter()
+        if breaker:
+            breaker.begin_task()
+        try:
+            if handler is None:
+                raise RuntimeError(f"нет обработчика для задач типа {item['kind']}")
+            wait = breaker.throttle() if breaker else 0
+            if wait:
+                raise RetryLater(wait, "разбор отложенных задач")
+            handler(item['payload'])
+        except RetryLater as e:
+            self.queue.defer(item['id'], e.delay)
+            QUEUE_TASK_SECONDS.observe(time.perf_counter() - start, queue=self.name, kind=item['kind'], result='deferred')
+            # Поток сразу берет задачу другого раздела
+            return
+        except Exception as e:
+            if breaker and breaker.state != 'closed' and breaker.task_failed():
+                # Сбой из-за недоступности API: задача ждет восстановления без траты попытки.
+                # Прочие ошибки (ошибка обработчика, ответ 4xx) тратят попытку и ведут в failed
+                self.queue.defer(item['id'], max(breaker.retry_in(), 1))
+                QUEUE_TASK_SECONDS.observe(time.perf_counter() - start, queue=self.name, kind=item['kind'], result='deferred')
+                logger.warning(f"⚠️ Задача {item['id']} ({item['kind']}) отложена: {e}")
+                return
+            QUEUE_TASK_SECONDS.observe(time.perf_counter() - start, queue=self.name, kind=item['kind'], result='error')
+            will_retry = self.queue.fail(item['id'], e)
+            with self._stats_lock:
+                self._failed += 1
+            if will_retry:
+                logger.warning(f"⚠️ Задача {item['id']} ({item['kind']}) будет повторена: {e}")
+            else:
+                logger.error(f"❌ Задача {item['id']} ({item['kind']}) не выполнена после всех попыток: {e}")
+            # Следующая задача раздела могла ждать именно эту
+            self.notify()
+            return
+
+        self.queue.complete(item['id'])
+        QUEUE_TASK_SECONDS.observe(time.perf_counter() - start, queue=self.name, kind=item['kind'], result='ok')
+        now = time.time()
+        with self._stats_lock:
+            self._processed += 1
+            self._completions.append(now)
+            while self._completions[0] < now - RATE_WINDOW:
+                self._completions.popleft()
+        self.notify()
+
+    def drain_rate(self):
+        """Скорость разбора очереди (задач в секунду) за последние RATE_WINDOW секунд"""
+        cutoff = time.time() - RATE_WINDOW
+        with self._stats_lock:
+            while self._completions and self._completions[0] < cutoff:
+                self._completions.popleft()
+            return len(self._completions) / RATE_WINDOW
+
+    def stats(self):
+        """Статистика очереди и пула"""
+        counts = self.queue.counts()
+        with self._stats_lock:
+            processed, failed = self._processed, self._failed
+        return {
+            'depth': counts['pending'] + counts['processing'],
+            'pending': counts['pending'],
+            'processing': counts['processing'],
+            'dead': counts['failed'],
+            'workers': self.workers,
+            'processed': processed,
+            'failed_attempts': failed,
+            'drain_rate': round(self.drain_rate(), 3),
+        }